@@ -103,7 +103,7 @@ class ClMpu6050DAQ(threading.Timer):
 
 	def fnCalibrate(self):
 		"""
-		Purpose:	Collects 1000 samples for calibration (offset)
+		Purpose:	Collects 1000 samples for calibration (offset and noise floor)
 		Passed:		None
 		"""
 		
@@ -128,6 +128,10 @@ class ClMpu6050DAQ(threading.Timer):
 		
 		# Dump results to pickle file
 		pkl.dump(self.offset, open('IMU6050Offset.pkl', 'wb'))
+		
+		# Noise floor while still, in the units placed on the data queue (m/s^2, deg/s)
+		noise = np.std(calArray[0:6], axis=1) * [9.8065, 9.8065, 9.8065, 1, 1, 1]
+		pkl.dump(noise, open('IMU6050Noise.pkl', 'wb'))
 
 class ClMpu9250DAQ:
 	"""
@@ -201,7 +205,7 @@ class ClMpu9250DAQ:
 	
 	def fnCalibrate(self):
 		"""
-		Purpose:	Collects 1000 samples for calibration (offset)
+		Purpose:	Collects 1000 samples for calibration (offset and noise floor)
 		Passed:		None
 		"""
 		
@@ -226,6 +230,10 @@ class ClMpu9250DAQ:
 		
 		# Dump results to pickle file
 		pkl.dump(self.offset, open('IMU9250Offset.pkl', 'wb'))
+		
+		# Noise floor while still, in the units placed on the data queue (m/s^2, deg/s)
+		noise = np.std(calArray[0:6], axis=1) * [9.8065, 9.8065, 9.8065, 1, 1, 1]
+		pkl.dump(noise, open('IMU9250Noise.pkl', 'wb'))
 
 
 def timeDiff(end, start):
@@ -72,6 +72,8 @@ class ClWheelDataParsing:
 
         self.address = dataSource['Address'] # BT Address
 
+        self.placement = dataSource['Placement'] # Wheel the samples are tagged with
+
         self.refTime = 0
 
         # Create class storage variables
@@ -171,9 +173,10 @@ class ClWheelDataParsing:
         # Sets adjusted timestamp
         timeStamp = self.refTime + wheelDataPB.time_stamp / 1000
 
-        # Sends received data to queue
+        # Sends received data to queue, tagged with the wheel so the classifier can keep one window per placement
         self.Queue.put(['WHEEL', timeStamp, wheelDataPB.acc_x * 9.8065, wheelDataPB.acc_y * 9.8065, wheelDataPB.acc_z * 9.8065,
-                        wheelDataPB.angular_x * math.pi / 180, wheelDataPB.angular_y * math.pi / 180, wheelDataPB.angular_z * math.pi / 180])
+                        wheelDataPB.angular_x * math.pi / 180, wheelDataPB.angular_y * math.pi / 180, wheelDataPB.angular_z * math.pi / 180,
+                        self.placement])
 
         # Appends class lists
         self.timeStamp.append(timeStamp)
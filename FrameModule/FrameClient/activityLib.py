@@ -0,0 +1,162 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library detects when the wheelchair is standing
+				still so the classification pipeline can be suspended.
+
+				The variance of each axis over the newest hop of samples is
+				compared against the noise floor measured during IMU
+				calibration. The chair is stationary once several hops in a
+				row stay within the noise floor, and moving again as soon
+				as one hop does not.
+
+				Run directly to measure CPU saved on recorded sessions:
+				python3 activityLib.py "IMU Data/Middle_Parked_Frame6050.csv" ...
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os
+import pickle as pkl
+
+# DEFINITIONS
+
+# Variance within (STATIONARY_FACTOR x noise std) squared on every axis counts as still
+STATIONARY_FACTOR = 3.0
+
+# Consecutive still hops before the pipeline is suspended
+STATIONARY_HOPS = 4
+
+# CLASSES
+
+class ClActivityDetector:
+	"""
+	Class for deciding from short blocks of samples whether the chair is stationary.
+	"""
+
+	def __init__(self, noiseStd, factor = STATIONARY_FACTOR, stationaryHops = STATIONARY_HOPS):
+		"""
+		Purpose:	Set the per-axis variance threshold from the noise floor
+		Passed:		Noise standard deviation of every axis, in the units of the samples checked
+					Multiple of the noise standard deviation still counted as noise
+					Consecutive still hops before reporting stationary
+		"""
+
+		self.threshold = np.square(factor * np.asarray(noiseStd, dtype=np.float64))
+		self.stationaryHops = stationaryHops
+
+		self.stillHops = 0
+		self.stationary = False
+
+	def fnUpdate(self, samples):
+		"""
+		Purpose:	Update the state with the newest hop of samples
+		Passed:		(n, axes) newest samples
+		Returns:	True while the chair is stationary
+		"""
+
+		if np.all(np.var(samples, axis=0) <= self.threshold):
+			self.stillHops += 1
+			if self.stillHops >= self.stationaryHops:
+				self.stationary = True
+		else:
+			# Any motion resumes classification straight away
+			self.stillHops = 0
+			self.stationary = False
+
+		return self.stationary
+
+
+# FUNCTIONS
+
+def fnLoadNoiseFloor(path, scale = None):
+	"""
+	Purpose:	Read the noise floor saved by fnCalibrate
+	Passed:		Noise pickle path
+				Optional scale converting the saved units into the classifier's units
+	Returns:	Noise standard deviation of every axis, None if the IMU has not been calibrated
+	"""
+
+	if not os.path.isfile(path):
+		return None
+
+	with open(path, 'rb') as noiseFile:
+		noise = np.asarray(pkl.load(noiseFile), dtype=np.float64)
+
+	if scale is not None:
+		noise = noise * np.abs(scale)
+
+	return noise
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+	import time
+
+	from configLib import SENSOR_PARAMS, HOP_SAMPLES, fnSessionFreqs
+	from sessionLib import fnLoadSession, fnSessionWindows, fnFilterWindows
+	from cascadeLib import ClModelCascade, fnLoadClassifiers, fnAvailableStages, ALL_STAGES, MODELS
+
+	parser = argparse.ArgumentParser(description='Measure the CPU saved by stationary gating on recorded sessions.')
+	parser.add_argument('sessions', nargs='+', help='session csv files written by fnSaveData or fnSaveSynthesis')
+	parser.add_argument('--noise', default=None, help='noise pickle from fnCalibrate (m/s^2, deg/s), otherwise estimated from the quietest hops of all sessions')
+	parser.add_argument('--models', nargs='+', default=None, choices=list(MODELS), help='models run on every classified window (default every model trained for the placement)')
+	parser.add_argument('--placement', default=None, help='placement to read from synthesis files (Left or Right)')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between classifications')
+	parser.add_argument('--watts', type=float, default=None, help='extra power draw of one busy core, to estimate energy saved')
+	args = parser.parse_args()
+
+	sessions = [fnLoadSession(path, args.placement) for path in args.sessions]
+
+	# Calibrated noise floor, else the spread of the quietest hops over every session
+	if args.noise is not None:
+		noiseStd = fnLoadNoiseFloor(args.noise, [1, 1, 1, np.pi / 180, np.pi / 180, np.pi / 180])
+	else:
+		hopStd = np.concatenate([np.std(fnSessionWindows(samples, SENSOR_PARAMS[placement], args.hop)[:, -args.hop:], axis=1)
+								 for samples, placement, terrain in sessions])
+		noiseStd = np.percentile(hopStd, 5, axis=0)
+		print('Noise floor estimated from the sessions: {}'.format(np.array2string(noiseStd, precision=4)))
+
+	for path, (samples, placement, terrain) in zip(args.sessions, sessions):
+		sensorParam = SENSOR_PARAMS[placement]
+
+		modelNames = args.models or fnAvailableStages(placement, ALL_STAGES)[0]
+		models, scalers = fnLoadClassifiers(placement, [modelNames])
+		cascade = ClModelCascade([modelNames], models, scalers, placement, fnSessionFreqs(sensorParam), sensorParam['fSamp'])
+		detector = ClActivityDetector(noiseStd)
+
+		windows = fnSessionWindows(samples, sensorParam, args.hop)
+		filtered = np.zeros((sensorParam['wLength'], samples.shape[1]))
+		windowsRun = 0
+		cpuRun = 0.0
+		cpuDetector = 0.0
+
+		for window in windows:
+			cpuStart = time.process_time()
+			stationary = detector.fnUpdate(window[-args.hop:])
+			cpuDetector += time.process_time() - cpuStart
+
+			if stationary:
+				continue
+
+			cpuStart = time.process_time()
+			fnFilterWindows(window[None], sensorParam, filtered[None])
+			cascade.fnClassify(filtered)
+			cpuRun += time.process_time() - cpuStart
+			windowsRun += 1
+
+		# Gated windows would have cost the mean CPU of a classified window
+		gated = len(windows) - windowsRun
+		cpuPerWindow = cpuRun / max(windowsRun, 1)
+		cpuSaved = gated * cpuPerWindow - cpuDetector
+		summary = '{} ({}): {} windows, {:.1%} stationary, {:.2f} ms CPU per classified window, saved {:.2f} s CPU ({:.1%})'.format(
+			terrain, os.path.basename(path), len(windows), gated / max(len(windows), 1), cpuPerWindow * 1e3,
+			cpuSaved, cpuSaved / max(len(windows) * cpuPerWindow, 1e-12))
+
+		if args.watts is not None:
+			summary += ', about {:.1f} J'.format(cpuSaved * args.watts)
+
+		print(summary)
@@ -0,0 +1,352 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library runs the terrain classifiers on a filtered
+				window in stages.
+
+				Each stage plans and computes only the features its models
+				read. In cascade mode a later stage only runs when the
+				class probability margin of the stages so far is below a
+				threshold, so confident windows skip the spectral features
+				and models entirely.
+
+				Run directly to measure the cascade on recorded sessions:
+				python3 cascadeLib.py --threshold 0.3 "IMU Data/Middle_Grass_Frame6050.csv" ...
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os
+import time
+
+from modelLib import fnLoadModel, fnLoadScaler, fnCompiledPath
+from paramStoreLib import fnLoadParamStore, FAMILY_TABLES
+from plannerLib import ClFeaturePlan, fnColumnNames
+from timingLib import ClStageTimer
+from configLib import SENSOR_PARAMS, fnSessionFreqs
+
+# DEFINITIONS
+
+dir_path = os.path.dirname(os.path.realpath(__file__))  # Current file directory
+
+# Trained artifact locations, compiled copies are cached by modelLib
+MODEL_DIR = os.path.join(dir_path, 'models')
+SCALER_DIR = os.path.join(dir_path, 'scalers')
+
+# Classifiers by timing stage: model file and the feature family it was trained on
+# Models trained on a selection of features carry their feature names and get a reduced plan
+MODELS = {'SVM Time': ('SupportVectorMachine_{}_TimeFeats.joblib', 'Time'),
+		  'SVM Freq': ('SupportVectorMachine_{}_FreqFeats.joblib', 'Freq'),
+		  'SVM PSD': ('SupportVectorMachine_{}_PSDLogs.joblib', 'PSDLog'),
+		  'RF Time': ('RandomForest_{}_TimeFeats.joblib', 'Time'),
+		  'RF Freq': ('RandomForest_{}_FreqFeats.joblib', 'Freq'),
+		  'RF PSD': ('RandomForest_{}_PSDLogs.joblib', 'PSDLog')}
+
+# Scaler files by feature family
+SCALERS = {'Time': '{}_TimeFeats_Scaler.joblib', 'Freq': '{}_FreqFeats_Scaler.joblib', 'PSDLog': '{}_PSDLogs_Scaler.joblib'}
+
+# Every model in a single stage, narrowed by fnAvailableStages to the models trained for a placement
+ALL_STAGES = [list(MODELS)]
+
+# Time features and the time forest first, the spectral forests only when it is unsure
+CASCADE_STAGES = [['RF Time'], ['RF Freq', 'RF PSD']]
+
+# Probability margin (best minus second best class) at or above which later stages are skipped
+CASCADE_THRESHOLD = 0.3
+
+# FUNCTIONS
+
+def fnLoadClassifiers(placement, stages, dtype = np.float64):
+	"""
+	Purpose:	Load the compiled models named in a list of stages and every family scaler
+	Passed:		Sensor placement (Middle, Left, Right)
+				List of stages, each a list of model names from MODELS
+				Float type the models and scalers run in
+	Returns:	Dictionary of model name to compiled model, dictionary of family to compiled scaler
+	"""
+
+	models = {name: fnLoadModel(os.path.join(MODEL_DIR, MODELS[name][0].format(placement)), dtype) for stage in stages for name in stage}
+	scalers = {family: fnLoadFamilyScaler(placement, family, dtype) for family in SCALERS}
+
+	return models, scalers
+
+def fnAvailableStages(placement, stages):
+	"""
+	Purpose:	Keep only the models of each stage that were trained for a placement
+	Passed:		Sensor placement (Middle, Left, Right)
+				List of stages, each a list of model names from MODELS
+	Returns:	List of the stages with a model left, each a list of model names
+	"""
+
+	available = []
+
+	for stage in stages:
+		paths = {name: os.path.join(MODEL_DIR, MODELS[name][0].format(placement)) for name in stage}
+		stage = [name for name in stage if os.path.isfile(paths[name]) or fnCompiledPath(paths[name]) is not None]
+		if stage:
+			available.append(stage)
+
+	if not available:
+		raise ValueError('No models for {} in {}'.format(placement, MODEL_DIR))
+
+	return available
+
+def fnLoadFamilyScaler(placement, family, dtype = np.float64):
+	"""
+	Purpose:	Load the scaler of a feature family, from the normalization parameter store
+				when no scaler was trained for the placement
+	Passed:		Sensor placement (Middle, Left, Right)
+				Feature family (Time, Freq, PSDLog)
+				Float type of the features standardized
+	Returns:	Compiled scaler
+	"""
+
+	path = os.path.join(SCALER_DIR, SCALERS[family].format(placement))
+
+	if os.path.isfile(path) or fnCompiledPath(path) is not None:
+		return fnLoadScaler(path, dtype)
+
+	# Looked up by name, so the columns follow the runtime column order whatever the store's order
+	names = fnColumnNames(placement, fnSessionFreqs(SENSOR_PARAMS[placement]))[family]
+
+	return fnLoadParamStore().fnScaler(FAMILY_TABLES[family], placement, names=names).fnAsType(dtype)
+
+def fnMargin(probabilities):
+	"""
+	Purpose:	Difference between the two most probable classes
+	Passed:		Class probabilities
+	Returns:	Margin between 0 and 1
+	"""
+
+	if len(probabilities) < 2:
+		return 1.0
+
+	top = np.partition(probabilities, -2)[-2:]
+
+	return top[1] - top[0]
+
+# CLASSES
+
+class ClModelCascade:
+	"""
+	Class for running stages of classifiers on a filtered window, stopping early once confident.
+	"""
+
+	def __init__(self, stages, models, scalers, placement, freqs, fSamp, threshold = None, dtype = np.float64):
+		"""
+		Purpose:	Plan the features of every stage and find each model's columns
+		Passed:		List of stages, each a list of model names from MODELS
+					Dictionary of model name to compiled model
+					Dictionary of family to compiled scaler
+					Sensor placement (Middle, Left, Right)
+					Frequencies labelling the PSD bins
+					Sampling frequency
+					Margin at or above which later stages are skipped (None to always run every stage)
+					Float type the features are computed in, as the models and scalers were loaded
+		"""
+
+		self.threshold = threshold
+		self.models = models
+
+		# Class labels of the probability models, which all share the terrain classes
+		probabilityModels = [model for model in models.values() if hasattr(model, 'predict_proba')]
+		self.classes = probabilityModels[0].classes_ if probabilityModels else None
+
+		# Feature names of every model, the full family in scaler column order unless stored with the model
+		columnNames = fnColumnNames(placement, freqs)
+		self.featureNames = {}
+		for name, model in models.items():
+			self.featureNames[name] = columnNames[MODELS[name][1]] if model.featureNames is None else [str(featName) for featName in model.featureNames]
+
+		# Each stage plans only the features its own models read
+		self.stages = []
+		for stage in stages:
+			requiredNames = list(dict.fromkeys(featName for name in stage for featName in self.featureNames[name]))
+			plan = ClFeaturePlan(requiredNames, placement, freqs, fSamp, scalers, dtype)
+			columns = {name: plan.fnColumns(self.featureNames[name]) for name in stage}
+			rows = {name: np.zeros((1, len(columns[name])), dtype=dtype) for name in stage}
+			self.stages.append({'Models': list(stage), 'Plan': plan, 'Columns': columns, 'Rows': rows})
+
+		# Short-circuit counters and latency saved per window
+		self.windows = 0
+		self.shortCircuited = 0
+		self.evaluated = 0
+		self.agreed = 0
+		self.stageSeconds = np.zeros(len(self.stages))
+		self.stageCounts = np.zeros(len(self.stages), dtype=np.int64)
+		self.savedSeconds = 0.0
+		self.savedTimer = ClStageTimer(['Saved'], None)
+
+	def fnRunStage(self, i, window, probabilities, timer = None):
+		"""
+		Purpose:	Compute a stage's planned features and run its models
+		Passed:		Stage index
+					(wLength, 6) filtered window
+					List the stage's class probabilities are appended to
+					Optional ClStageTimer with the feature and model stages
+		Returns:	Dictionary of model name to class label
+		"""
+
+		stage = self.stages[i]
+		plan = stage['Plan']
+		timeStage = time.perf_counter()
+
+		if plan.needsTime:
+			plan.fnComputeTime(window)
+			if timer is not None:
+				timeStage = timer.fnLap('Time Features', timeStage)
+		if plan.needsPSD:
+			plan.fnComputePSD(window)
+			if timer is not None:
+				timeStage = timer.fnLap('PSD', timeStage)
+		if plan.needsFreq:
+			plan.fnComputeFreq()
+			if timer is not None:
+				timeStage = timer.fnLap('Freq Features', timeStage)
+
+		# Each model reads its own columns of the planned row
+		labels = {}
+		for name in stage['Models']:
+			model = self.models[name]
+			row = stage['Rows'][name]
+			np.take(plan.row, stage['Columns'][name], axis=1, out=row)
+
+			if hasattr(model, 'predict_proba'):
+				probability = model.predict_proba(row)[0]
+				probabilities.append(probability)
+				labels[name] = model.classes_[np.argmax(probability)]
+			else:
+				labels[name] = model.predict(row)[0]
+
+			if timer is not None:
+				timeStage = timer.fnLap(name, timeStage)
+
+		return labels
+
+	def fnClassify(self, window, timer = None, evaluate = False):
+		"""
+		Purpose:	Classify a filtered window, skipping later stages once the margin is confident
+		Passed:		(wLength, 6) filtered window
+					Optional ClStageTimer with the feature and model stages
+					Run skipped stages anyway to measure their cost and agreement exactly
+		Returns:	Dictionary of model name to class label (skipped models absent),
+					cascade class label (mean probability of the models run),
+					number of stages run
+		"""
+
+		labels = {}
+		probabilities = []
+		decision = None
+		stagesRun = len(self.stages)
+
+		for i in range(len(self.stages)):
+			timeStart = time.perf_counter()
+			stageLabels = self.fnRunStage(i, window, probabilities, timer)
+			self.stageSeconds[i] += time.perf_counter() - timeStart
+			self.stageCounts[i] += 1
+			labels.update(stageLabels)
+
+			if probabilities:
+				meanProbability = np.mean(probabilities, axis=0)
+				decision = self.classes[np.argmax(meanProbability)]
+
+			# Confident enough to stop before the remaining stages
+			if self.threshold is not None and i + 1 < len(self.stages) and probabilities and fnMargin(meanProbability) >= self.threshold:
+				stagesRun = i + 1
+				break
+
+		if decision is None:
+			decision = labels[self.stages[0]['Models'][0]]
+
+		self.windows += 1
+
+		# Latency saved, measured by running the skipped stages in evaluation, otherwise their mean cost so far
+		saved = 0.0
+		if stagesRun < len(self.stages):
+			self.shortCircuited += 1
+
+			if evaluate:
+				fullProbabilities = list(probabilities)
+				for i in range(stagesRun, len(self.stages)):
+					timeStart = time.perf_counter()
+					self.fnRunStage(i, window, fullProbabilities)
+					saved += time.perf_counter() - timeStart
+				self.evaluated += 1
+				self.agreed += self.classes[np.argmax(np.mean(fullProbabilities, axis=0))] == decision
+			else:
+				counted = self.stageCounts[stagesRun:] > 0
+				saved = np.sum(self.stageSeconds[stagesRun:][counted] / self.stageCounts[stagesRun:][counted])
+
+		self.savedSeconds += saved
+		self.savedTimer.fnRecord('Saved', saved)
+
+		return labels, decision, stagesRun
+
+	def fnSummary(self):
+		"""
+		Purpose:	Format the short-circuit fraction and latency saved
+		Returns:	Summary string
+		"""
+
+		if self.windows == 0:
+			return 'Cascade: no windows'
+
+		p95 = self.savedTimer.fnPercentiles('Saved', (95, ))[0]
+		summary = 'Cascade: {} windows, {:.1%} short-circuited, saved mean {:.3f} ms, p95 {:.3f} ms'.format(
+			self.windows, self.shortCircuited / self.windows, self.savedSeconds / self.windows * 1e3, p95 * 1e3)
+
+		if self.evaluated:
+			summary += ', {:.1%} of short-circuited windows agree with the full cascade'.format(self.agreed / self.evaluated)
+
+		return summary
+
+	def fnReset(self):
+		"""
+		Purpose:	Clear the short-circuit counters
+		"""
+
+		self.windows = 0
+		self.shortCircuited = 0
+		self.evaluated = 0
+		self.agreed = 0
+		self.savedSeconds = 0.0
+		self.savedTimer.fnReset()
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	from configLib import HOP_SAMPLES
+	from sessionLib import fnLoadSession, fnSessionWindows, fnFilterWindows
+
+	parser = argparse.ArgumentParser(description='Measure the confidence-gated cascade on recorded sessions.')
+	parser.add_argument('sessions', nargs='+', help='session csv files written by fnSaveData or fnSaveSynthesis')
+	parser.add_argument('--threshold', type=float, default=CASCADE_THRESHOLD, help='probability margin that skips later stages')
+	parser.add_argument('--placement', default=None, help='placement to read from synthesis files (Left or Right)')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between classifications')
+	args = parser.parse_args()
+
+	cascades = {}
+
+	for path in args.sessions:
+		samples, placement, terrain = fnLoadSession(path, args.placement)
+		sensorParam = SENSOR_PARAMS[placement]
+
+		# Only the models trained for this placement, a missing model drops out of its stage
+		if placement not in cascades:
+			stages = fnAvailableStages(placement, CASCADE_STAGES)
+			models, scalers = fnLoadClassifiers(placement, stages)
+			cascades[placement] = (stages, models, scalers)
+		stages, models, scalers = cascades[placement]
+
+		# One cascade per session so every terrain is reported on its own
+		cascade = ClModelCascade(stages, models, scalers, placement, fnSessionFreqs(sensorParam), sensorParam['fSamp'], args.threshold)
+		filtered = fnFilterWindows(fnSessionWindows(samples, sensorParam, args.hop), sensorParam)
+
+		for window in filtered:
+			cascade.fnClassify(window, evaluate=True)
+
+		print('{} ({}, {}): {}'.format(terrain, placement, os.path.basename(path), cascade.fnSummary()))
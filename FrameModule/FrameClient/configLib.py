@@ -0,0 +1,55 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library holds the sensor and window configuration
+				shared by the real-time classifier, the placement service
+				and the offline tools, so every one of them cuts, pads,
+				hops and labels windows the same way.
+
+				Only numpy is imported, so the classifier can load it at
+				startup without pulling in pandas.
+"""
+# IMPORTED LIBRARIES
+
+from featuresLib import psd_freqs
+
+# DEFINITIONS
+
+# Direction Vectors
+DATA_COLUMNS = ['X Accel', 'Y Accel', 'Z Accel', 'X Gyro', 'Y Gyro', 'Z Gyro']
+
+FRAME_MODULE = {'wLength': 300, 'fSamp': 300, 'fLow': 55, 'fHigh': 1}
+WHEEL_MODULE = {'wLength': 333, 'fSamp': 333.3, 'fLow': 60, 'fHigh': 1}
+
+# Sensor parameters by placement
+SENSOR_PARAMS = {'Middle': FRAME_MODULE, 'Left': WHEEL_MODULE, 'Right': WHEEL_MODULE}
+
+PAD_LENGTH = 15 # pad length to let filtering be better
+N_BINS_OVER_CUTOFF = 5 # Collect some information from attenuated frequencies bins
+
+# Classification runs after every HOP_SAMPLES new samples (150 = 0.5 s at 300 Hz)
+HOP_SAMPLES = 150
+
+# DICTIONARIES
+
+TERRAINS = ['Concrete', 'Carpet', 'Linoleum', 'Asphalt', 'Sidewalk', 'Grass', 'Gravel']
+
+# FUNCTIONS
+
+def fnNumberOfBins(sensorParam):
+	"""
+	Purpose:	Number of PSD bins kept, up to and a little past the cutoff frequency
+	Passed:		Sensor parameter dictionary
+	Returns:	Number of bins
+	"""
+
+	return int(sensorParam['wLength'] / sensorParam['fSamp'] * sensorParam['fLow']) + N_BINS_OVER_CUTOFF
+
+def fnSessionFreqs(sensorParam):
+	"""
+	Purpose:	Frequencies labelling the PSD bins kept for a sensor
+	Passed:		Sensor parameter dictionary
+	Returns:	Array of frequencies
+	"""
+
+	return psd_freqs(sensorParam['wLength'], sensorParam['fSamp'], fnNumberOfBins(sensorParam))
@@ -0,0 +1,232 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library caches the raw features of recorded sessions
+				on disk, so training and evaluation runs over the 'IMU Data'
+				archive only filter and featurize a recording once.
+
+				Entries are keyed by the SHA-1 of the recording's contents,
+				the placement, window length, hop, filter parameters and
+				feature version, and hold one memory-mappable .npy array per
+				feature family. A changed recording or parameter gives a new
+				key, and entries of an older version of a recording are
+				removed when its new entry is written.
+
+				Features are stored before scaling, so they stay valid when
+				the scalers and models are retrained.
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os
+import json
+import shutil
+import hashlib
+
+from modelLib import fnFileHash
+from filterLib import FILTER_ORDER
+from featuresLib import window_features_batch
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, fnNumberOfBins
+from sessionLib import SESSION_OFFSET, fnParseSessionName, fnLoadSession, fnSessionWindows, fnFilterWindows
+
+# DEFINITIONS
+
+dir_path = os.path.dirname(os.path.realpath(__file__))  # Current file directory
+
+# Directory holding one subdirectory per cached session, placement and parameter set
+FEATURE_CACHE_DIR = os.path.join(dir_path, 'featureCache')
+
+# Bump whenever the filter or feature engines change what they compute
+FEATURE_VERSION = 1
+
+FEATURE_FAMILIES = ('Time', 'Freq', 'PSDLog')
+
+# FUNCTIONS
+
+def fnSourceHash(path):
+	"""
+	Purpose:	SHA-1 of a recording, reusing the stored digest while its mtime and size are unchanged
+	Passed:		Recording path
+	Returns:	Hex digest
+	"""
+
+	path = os.path.realpath(path)
+	stat = os.stat(path)
+	source = {'path': path, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+	stampPath = os.path.join(FEATURE_CACHE_DIR, 'sources', hashlib.sha1(path.encode()).hexdigest() + '.json')
+
+	try:
+		with open(stampPath) as stampFile:
+			stamp = json.load(stampFile)
+		if all(stamp[key] == source[key] for key in ['path', 'mtime', 'size']):
+			return stamp['sha1']
+	except (OSError, ValueError, KeyError):
+		pass
+
+	source['sha1'] = fnFileHash(path)
+
+	try:
+		os.makedirs(os.path.dirname(stampPath), exist_ok=True)
+		fnWriteJson(stampPath, source)
+	except OSError as e:
+		print('Could not store the hash of {}: {}'.format(path, e))
+
+	return source['sha1']
+
+def fnFeatureParams(placement, hopSamples):
+	"""
+	Purpose:	Every parameter the cached features depend on, apart from the recording
+	Passed:		Sensor placement (Middle, Left, Right)
+				Samples between windows
+	Returns:	Dictionary of parameters
+	"""
+
+	sensorParam = SENSOR_PARAMS[placement]
+
+	return {'version': FEATURE_VERSION, 'placement': placement, 'hop': hopSamples,
+			'wLength': sensorParam['wLength'], 'fSamp': sensorParam['fSamp'], 'fLow': sensorParam['fLow'],
+			'padLength': PAD_LENGTH, 'filterOrder': FILTER_ORDER, 'nBins': fnNumberOfBins(sensorParam),
+			'offset': [float(value) for value in SESSION_OFFSET]}
+
+def fnFeatureKey(sha1, params):
+	"""
+	Purpose:	Cache key of a recording's features under a parameter set
+	Passed:		SHA-1 of the recording
+				Dictionary of parameters from fnFeatureParams
+	Returns:	Hex key
+	"""
+
+	return hashlib.sha1(json.dumps({'sha1': sha1, 'params': params}, sort_keys=True).encode()).hexdigest()
+
+def fnWriteJson(path, content):
+	"""
+	Purpose:	Write a json file beside its destination and swap it in, so readers never see part of it
+	Passed:		Destination path
+				Content to serialize
+	"""
+
+	tempPath = '{}.{}.tmp'.format(path, os.getpid())
+	with open(tempPath, 'w') as jsonFile:
+		json.dump(content, jsonFile)
+	os.replace(tempPath, path)
+
+def fnSaveArray(path, array):
+	"""
+	Purpose:	Write an .npy file beside its destination and swap it in
+	Passed:		Destination path
+				Array to store
+	"""
+
+	tempPath = '{}.{}.tmp.npy'.format(path[:-len('.npy')], os.getpid())
+	np.save(tempPath, np.ascontiguousarray(array), allow_pickle=False)
+	os.replace(tempPath, path)
+
+def fnPruneStale(path, placement, sha1):
+	"""
+	Purpose:	Remove entries of a recording whose contents have since changed
+	Passed:		Recording path
+				Sensor placement
+				SHA-1 of the current contents
+	"""
+
+	for entry in os.listdir(FEATURE_CACHE_DIR):
+		metaPath = os.path.join(FEATURE_CACHE_DIR, entry, 'meta.json')
+		try:
+			with open(metaPath) as metaFile:
+				meta = json.load(metaFile)
+		except (OSError, ValueError):
+			continue
+
+		if meta['source']['path'] == path and meta['params']['placement'] == placement and meta['source']['sha1'] != sha1:
+			shutil.rmtree(os.path.join(FEATURE_CACHE_DIR, entry), ignore_errors=True)
+
+def fnLoadFeatures(path, hopSamples, placement = None, families = FEATURE_FAMILIES):
+	"""
+	Purpose:	Raw features of every window of a recording, memory-mapped from the cache and
+				only filtered and featurized for families that are not cached yet
+	Passed:		Recording csv path
+				Samples between windows
+				Placement to read from a synthesis file ('Left' or 'Right'), otherwise
+				taken from the file name
+				Feature families wanted (Time, Freq, PSDLog)
+	Returns:	Dictionary of family to read-only (n_windows, columns) array,
+				dictionary describing the entry (source, params, windows, terrain)
+	"""
+
+	path = os.path.realpath(path)
+	sha1 = fnSourceHash(path)
+
+	# Placement from the file name, as fnLoadSession reads it
+	if placement is None:
+		session = fnParseSessionName(path)
+		placement = session['Placement'] if session else 'Middle'
+
+	params = fnFeatureParams(placement, hopSamples)
+	key = fnFeatureKey(sha1, params)
+	entryDirectory = os.path.join(FEATURE_CACHE_DIR, '{}_{}_{}'.format(os.path.splitext(os.path.basename(path))[0], placement, key[:16]))
+	metaPath = os.path.join(entryDirectory, 'meta.json')
+
+	try:
+		with open(metaPath) as metaFile:
+			meta = json.load(metaFile)
+	except (OSError, ValueError):
+		meta = None
+
+	missing = [family for family in families if meta is None or family not in meta['families']]
+
+	if missing:
+		samples, placement, terrain = fnLoadSession(path, placement)
+
+		sensorParam = SENSOR_PARAMS[placement]
+		filtered = fnFilterWindows(fnSessionWindows(samples, sensorParam, hopSamples), sensorParam)
+		computed = window_features_batch(filtered, sensorParam['fSamp'], params['nBins'], families=missing)
+
+		if meta is None:
+			meta = {'source': {'path': path, 'sha1': sha1}, 'params': params, 'key': key,
+					'windows': len(filtered), 'terrain': terrain, 'families': []}
+
+		try:
+			if not os.path.isdir(entryDirectory):
+				os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+				fnPruneStale(path, placement, sha1)
+				os.makedirs(entryDirectory, exist_ok=True)
+
+			for family, features in computed.items():
+				fnSaveArray(os.path.join(entryDirectory, family + '.npy'), features)
+			meta['families'] = sorted(set(meta['families']) | set(computed))
+			fnWriteJson(metaPath, meta)
+		except OSError as e:
+			print('Could not cache features of {}: {}'.format(path, e))
+
+			# Families cached before are still mapped from the entry, the new ones stay in memory
+			for features in computed.values():
+				features.flags.writeable = False
+			return {family: computed[family] if family in computed else
+					np.load(os.path.join(entryDirectory, family + '.npy'), mmap_mode='r', allow_pickle=False) for family in families}, meta
+
+	features = {family: np.load(os.path.join(entryDirectory, family + '.npy'), mmap_mode='r', allow_pickle=False) for family in families}
+
+	return features, meta
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+	import time
+
+	parser = argparse.ArgumentParser(description='Fill the feature cache for recorded sessions and time cold against warm loads.')
+	parser.add_argument('sessions', nargs='+', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between windows')
+	args = parser.parse_args()
+
+	sessions = [session.split('=', 1) if '=' in session else (None, session) for session in args.sessions]
+
+	for label in ['First', 'Warm']:
+		timeStart = time.perf_counter()
+		nWindows = 0
+		for placement, path in sessions:
+			features, meta = fnLoadFeatures(path, args.hop, placement)
+			nWindows += meta['windows']
+		print('{} load: {} sessions, {} windows in {:.3f} s'.format(label, len(sessions), nWindows, time.perf_counter() - timeStart))
@@ -1,5 +1,5 @@
 import numpy as np
-from scipy import stats
+from collections import deque
 
 EPSILON = 0.00001 # For small float values
 
@@ -56,3 +56,626 @@ def vf(freqs, psd_amps):
 '''Root variance frequency'''
 def rvf(freqs, psd_amps):
     return np.sqrt(msf(freqs, psd_amps))
+
+'''Number of time domain features computed per axis by time_features'''
+N_TIME_FEATURES = 10
+
+'''All time domain features of an (n, axes) array in one pass over shared moments.
+Returns a flat row ordered by axis, then Mean, Std, Norm, AC, Max, Min, RMS, ZCR,
+Skew, EK, which is the column order of the time feature scalers. Without out the
+row has the float type of the window (float64 for integer samples)'''
+def time_features(window, out=None):
+    n, n_axes = window.shape
+
+    if out is None:
+        out = np.empty(n_axes * N_TIME_FEATURES, dtype=np.result_type(window, np.float32))
+    feats = out.reshape(n_axes, N_TIME_FEATURES)
+
+    # Raw moments shared by Mean, Norm, AC and RMS
+    mean = np.sum(window, axis=0) / n
+    sum_sq = np.einsum('ij,ij->j', window, window)
+
+    # Central moments shared by Std, Skew and EK
+    dev = window - mean
+    dev_sq = dev * dev
+    m2 = np.sum(dev_sq, axis=0) / n
+    m3 = np.einsum('ij,ij->j', dev_sq, dev) / n
+    m4 = np.einsum('ij,ij->j', dev_sq, dev_sq) / n
+
+    feats[:, 0] = mean
+    feats[:, 1] = np.sqrt(m2)
+    feats[:, 2] = np.sqrt(sum_sq)
+    feats[:, 3] = sum_sq
+    feats[:, 4] = np.amax(window, axis=0)
+    feats[:, 5] = np.amin(window, axis=0)
+    feats[:, 6] = np.sqrt(sum_sq / n)
+    feats[:, 7] = np.count_nonzero(np.diff(window > 0, axis=0), axis=0) / n
+
+    # Biased skew and excess kurtosis, constant axes give 0 and -3 like scipy.stats
+    with np.errstate(divide='ignore', invalid='ignore'):
+        feats[:, 8] = np.where(m2 == 0, 0, m3 / m2 ** 1.5)
+        feats[:, 9] = np.where(m2 == 0, 0, m4 / m2 ** 2) - 3
+
+    return out
+
+
+'''Number of frequency domain features computed per axis by freq_features'''
+N_FREQ_FEATURES = 5
+
+'''Frequencies labelling the first n_bins PSD bins of an n sample window'''
+def psd_freqs(n, fs, n_bins):
+    return np.arange(n_bins) * (fs / n)
+
+'''Power spectral density of every axis of an (n, axes) window from a single real FFT.
+Matches scipy.signal.periodogram (constant detrend, density scaling), truncated to
+bins 1 to n_bins, and is returned as an (n_bins, axes) array. A float32 window is
+transformed in single precision where numpy's FFT supports it (numpy 2.0 onwards)'''
+def psd_bins(window, fs, n_bins, out=None):
+    n = window.shape[0]
+
+    spectrum = np.fft.rfft(window - np.mean(window, axis=0), axis=0)[1:n_bins + 1]
+
+    if out is None:
+        out = np.empty(spectrum.shape, dtype=np.result_type(window, np.float32))
+    np.multiply(spectrum.real, spectrum.real, out=out)
+    out += spectrum.imag * spectrum.imag
+
+    # One-sided density, the Nyquist bin of an even window is not doubled
+    out *= 2 / (fs * n)
+    if n % 2 == 0 and n_bins >= n // 2:
+        out[n // 2 - 1] /= 2
+
+    return out
+
+'''Log10 of an (n_bins, axes) PSD with zero power mapped to 0. Returns a flat row
+ordered by axis, then bin, which is the column order of the PSD log scalers'''
+def log_psd(psd, out=None):
+    psd_t = psd.T
+
+    if out is None:
+        out = np.empty(psd.size, dtype=psd.dtype)
+    logs = out.reshape(psd_t.shape)
+
+    logs.fill(0)
+    np.log10(psd_t, out=logs, where=psd_t > 0)
+
+    return out
+
+'''MSF, RMSF, FC, VF and RVF of every axis of an (n_bins, axes) PSD at once. Returns
+a flat row ordered by axis, then feature, which is the column order of the frequency
+feature scalers'''
+def freq_features(freqs, psd, out=None):
+    n_axes = psd.shape[1]
+
+    if out is None:
+        out = np.empty(n_axes * N_FREQ_FEATURES, dtype=psd.dtype)
+    feats = out.reshape(n_axes, N_FREQ_FEATURES)
+
+    # Denominator shared by every feature
+    denom = np.sum(psd, axis=0)
+    small = denom <= EPSILON
+    denom[small] = 1
+
+    mean_sq_freq = np.dot(freqs, psd * psd) / denom
+    freq_center = np.dot(freqs, psd) / denom
+
+    # In case zero amplitude transform is encountered
+    mean_sq_freq[small] = EPSILON
+    freq_center[small] = EPSILON
+
+    feats[:, 0] = mean_sq_freq
+    feats[:, 1] = np.sqrt(mean_sq_freq)
+    feats[:, 2] = freq_center
+    feats[:, 3] = mean_sq_freq - freq_center ** 2
+    feats[:, 4] = np.sqrt(mean_sq_freq)
+
+    return out
+
+
+'''Windows processed together by the batch engines, bounding their temporary arrays'''
+BATCH_CHUNK = 1024
+
+'''Batch time_features over a stack of windows. The sample axis is given by axis and the
+other two are taken as (windows, axes), so the default layout is (windows, samples, axes)
+and sliding_window_view stacks can be passed without copying. Returns a
+(windows, axes * N_TIME_FEATURES) array with one time_features row per window'''
+def time_features_batch(windows, axis=1, out=None, chunk=BATCH_CHUNK):
+    windows = np.moveaxis(windows, axis, 1)
+    n_windows, n, n_axes = windows.shape
+
+    if out is None:
+        out = np.empty((n_windows, n_axes * N_TIME_FEATURES))
+    feats = out.reshape(n_windows, n_axes, N_TIME_FEATURES)
+
+    for start in range(0, n_windows, chunk):
+        block = windows[start:start + chunk]
+        block_feats = feats[start:start + chunk]
+
+        # Raw moments shared by Mean, Norm, AC and RMS
+        mean = np.sum(block, axis=1) / n
+        sum_sq = np.einsum('wij,wij->wj', block, block)
+
+        # Central moments shared by Std, Skew and EK
+        dev = block - mean[:, None]
+        dev_sq = dev * dev
+        m2 = np.sum(dev_sq, axis=1) / n
+        m3 = np.einsum('wij,wij->wj', dev_sq, dev) / n
+        m4 = np.einsum('wij,wij->wj', dev_sq, dev_sq) / n
+
+        block_feats[:, :, 0] = mean
+        block_feats[:, :, 1] = np.sqrt(m2)
+        block_feats[:, :, 2] = np.sqrt(sum_sq)
+        block_feats[:, :, 3] = sum_sq
+        block_feats[:, :, 4] = np.amax(block, axis=1)
+        block_feats[:, :, 5] = np.amin(block, axis=1)
+        block_feats[:, :, 6] = np.sqrt(sum_sq / n)
+        block_feats[:, :, 7] = np.count_nonzero(np.diff(block > 0, axis=1), axis=1) / n
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            block_feats[:, :, 8] = np.where(m2 == 0, 0, m3 / m2 ** 1.5)
+            block_feats[:, :, 9] = np.where(m2 == 0, 0, m4 / m2 ** 2) - 3
+
+    return out
+
+'''Batch psd_bins over a stack of windows laid out as for time_features_batch. Returns a
+(windows, n_bins, axes) array with one psd_bins result per window'''
+def psd_bins_batch(windows, fs, n_bins, axis=1, out=None, chunk=BATCH_CHUNK):
+    windows = np.moveaxis(windows, axis, 1)
+    n_windows, n, n_axes = windows.shape
+
+    if out is None:
+        out = np.empty((n_windows, n_bins, n_axes))
+
+    for start in range(0, n_windows, chunk):
+        block = windows[start:start + chunk]
+        block_out = out[start:start + chunk]
+
+        spectrum = np.fft.rfft(block - np.mean(block, axis=1, keepdims=True), axis=1)[:, 1:n_bins + 1]
+        np.multiply(spectrum.real, spectrum.real, out=block_out)
+        block_out += spectrum.imag * spectrum.imag
+
+    # One-sided density, the Nyquist bin of an even window is not doubled
+    out *= 2 / (fs * n)
+    if n % 2 == 0 and n_bins >= n // 2:
+        out[:, n // 2 - 1] /= 2
+
+    return out
+
+'''Batch log_psd of a stack of PSDs whose bin axis is given by axis, the other two taken
+as (windows, axes). Returns a (windows, axes * n_bins) array with one log_psd row per window'''
+def log_psd_batch(psd, axis=1, out=None):
+    psd_t = np.moveaxis(psd, axis, 2)
+
+    if out is None:
+        out = np.empty((psd_t.shape[0], psd_t.shape[1] * psd_t.shape[2]))
+    logs = out.reshape(psd_t.shape)
+
+    logs.fill(0)
+    np.log10(psd_t, out=logs, where=psd_t > 0)
+
+    return out
+
+'''Batch freq_features of a stack of PSDs laid out as for log_psd_batch. The PSD sum is
+the denominator of every feature and is computed once per window and axis, and
+VF and RVF reuse MSF and FC rather than recomputing them. Returns a
+(windows, axes * N_FREQ_FEATURES) array with one freq_features row per window'''
+def freq_features_batch(freqs, psd, axis=1, out=None):
+    psd = np.moveaxis(psd, axis, 1)
+    n_windows, n_bins, n_axes = psd.shape
+
+    if out is None:
+        out = np.empty((n_windows, n_axes * N_FREQ_FEATURES))
+    feats = out.reshape(n_windows, n_axes, N_FREQ_FEATURES)
+
+    # Denominator shared by every feature
+    denom = np.sum(psd, axis=1)
+    small = denom <= EPSILON
+    denom[small] = 1
+
+    mean_sq_freq = np.einsum('k,wka,wka->wa', freqs, psd, psd) / denom
+    freq_center = np.einsum('k,wka->wa', freqs, psd) / denom
+
+    # In case zero amplitude transform is encountered
+    mean_sq_freq[small] = EPSILON
+    freq_center[small] = EPSILON
+
+    feats[:, :, 0] = mean_sq_freq
+    feats[:, :, 1] = np.sqrt(mean_sq_freq)
+    feats[:, :, 2] = freq_center
+    feats[:, :, 3] = mean_sq_freq - freq_center ** 2
+    feats[:, :, 4] = feats[:, :, 1]
+
+    return out
+
+'''Time features, frequency features and PSD logs of a stack of windows, laid out as for
+time_features_batch, from a single PSD per window. Only the families asked for are
+computed. Returns a dictionary of feature family (Time, Freq, PSDLog) to a
+(windows, columns) array in the scaler column order'''
+def window_features_batch(windows, fs, n_bins, axis=1, families=('Time', 'Freq', 'PSDLog')):
+    n = np.moveaxis(windows, axis, 1).shape[1]
+    features = {}
+
+    if 'Time' in families:
+        features['Time'] = time_features_batch(windows, axis)
+
+    if 'Freq' in families or 'PSDLog' in families:
+        psd = psd_bins_batch(windows, fs, n_bins, axis)
+        if 'Freq' in families:
+            features['Freq'] = freq_features_batch(psd_freqs(n, fs, n_bins), psd)
+        if 'PSDLog' in families:
+            features['PSDLog'] = log_psd_batch(psd)
+
+    return features
+
+
+'''Samples between exact recomputations of the streaming sums from the stored window'''
+REANCHOR_INTERVAL = 10000
+
+'''Time domain features of a sliding window kept up to date one sample at a time.
+Moments are accumulated about a per-axis anchor, zero crossings are counted as
+samples enter and leave, and max/min come from monotonic deques, so each append is
+O(1) amortized and features() returns the time_features row of the current window
+without revisiting it. Every reanchor_interval samples the sums are rebuilt from
+the stored window about its current mean, which bounds the drift of the running
+sums and the cancellation in the central moments over long runs.'''
+class ClStreamingTimeFeatures:
+
+    def __init__(self, length, n_axes=6, reanchor_interval=REANCHOR_INTERVAL):
+        self.length = length
+        self.n_axes = n_axes
+        self.reanchor_interval = reanchor_interval
+
+        # Stored window, oldest sample lives at the write index once full
+        self.window = np.zeros((length, n_axes))
+        self.index = 0
+        self.count = 0
+        self.sample_count = 0
+
+        # Power sums of (x - anchor) for powers 1 to 4
+        self.anchor = np.zeros(n_axes)
+        self.sums = np.zeros((4, n_axes))
+        self.powers = np.empty((4, n_axes))
+
+        # Sign changes between consecutive samples in the window
+        self.positive = np.zeros((length, n_axes), dtype=bool)
+        self.crossings = np.zeros(n_axes, dtype=np.int64)
+
+        # Monotonic deques of (sample number, value) per axis
+        self.max_deques = [deque() for _ in range(n_axes)]
+        self.min_deques = [deque() for _ in range(n_axes)]
+
+        self.since_anchor = 0
+
+    '''Add one sample, dropping the oldest once the window is full'''
+    def append(self, sample):
+        sample = np.asarray(sample, dtype=np.float64)
+        index = self.index
+        powers = self.powers
+
+        if self.count == 0:
+            # Anchor the sums at the first sample so they start out small
+            self.anchor = sample.copy()
+        elif self.count == self.length:
+            # Remove the outgoing sample's moments and its crossing with the next sample
+            oldest = self.window[index]
+            np.subtract(oldest, self.anchor, out=powers[0])
+            np.multiply(powers[0], powers[0], out=powers[1])
+            np.multiply(powers[1], powers[0], out=powers[2])
+            np.multiply(powers[1], powers[1], out=powers[3])
+            self.sums -= powers
+            self.crossings -= self.positive[index] != self.positive[index + 1 if index + 1 < self.length else 0]
+        if self.count < self.length:
+            self.count += 1
+
+        # Crossing between the newest stored sample and the incoming one
+        positive = sample > 0
+        if self.count > 1:
+            self.crossings += positive != self.positive[index - 1]
+
+        self.window[index] = sample
+        self.positive[index] = positive
+
+        np.subtract(sample, self.anchor, out=powers[0])
+        np.multiply(powers[0], powers[0], out=powers[1])
+        np.multiply(powers[1], powers[0], out=powers[2])
+        np.multiply(powers[1], powers[1], out=powers[3])
+        self.sums += powers
+
+        # Sliding window max/min, expired entries leave from the front
+        number = self.sample_count
+        expired = number - self.length
+        for axis in range(self.n_axes):
+            value = sample[axis]
+
+            max_deque = self.max_deques[axis]
+            while max_deque and max_deque[-1][1] <= value:
+                max_deque.pop()
+            max_deque.append((number, value))
+            if max_deque[0][0] <= expired:
+                max_deque.popleft()
+
+            min_deque = self.min_deques[axis]
+            while min_deque and min_deque[-1][1] >= value:
+                min_deque.pop()
+            min_deque.append((number, value))
+            if min_deque[0][0] <= expired:
+                min_deque.popleft()
+
+        self.index = index + 1 if index + 1 < self.length else 0
+        self.sample_count = number + 1
+
+        self.since_anchor += 1
+        if self.since_anchor >= self.reanchor_interval:
+            self.reanchor()
+
+    '''Rebuild the power sums exactly from the stored window about its current mean'''
+    def reanchor(self):
+        stored = self.window[:self.count]
+
+        self.anchor = np.mean(stored, axis=0) if self.count else np.zeros(self.n_axes)
+        dev = stored - self.anchor
+        dev_sq = dev * dev
+        self.sums[0] = np.sum(dev, axis=0)
+        self.sums[1] = np.sum(dev_sq, axis=0)
+        self.sums[2] = np.einsum('ij,ij->j', dev_sq, dev)
+        self.sums[3] = np.einsum('ij,ij->j', dev_sq, dev_sq)
+
+        self.since_anchor = 0
+
+    '''Time features of the current window in the time_features column order'''
+    def features(self, out=None):
+        n = self.count
+        if out is None:
+            out = np.empty(self.n_axes * N_TIME_FEATURES)
+        feats = out.reshape(self.n_axes, N_TIME_FEATURES)
+
+        s1, s2, s3, s4 = self.sums / n
+        c = self.anchor
+
+        # Central moments from the anchored raw moments
+        d = s1
+        d_sq = d * d
+        m2 = np.maximum(s2 - d_sq, 0)
+        m3 = s3 - 3 * d * s2 + 2 * d_sq * d
+        m4 = s4 - 4 * d * s3 + 6 * d_sq * s2 - 3 * d_sq * d_sq
+
+        # Sum of squares about zero, shared by Norm, AC and RMS
+        sum_sq = np.maximum(self.sums[1] + c * (2 * self.sums[0] + n * c), 0)
+
+        feats[:, 4] = [max_deque[0][1] for max_deque in self.max_deques]
+        feats[:, 5] = [min_deque[0][1] for min_deque in self.min_deques]
+
+        # Leftover round-off in the sums of a constant axis is not variance
+        constant = feats[:, 4] == feats[:, 5]
+        m2[constant] = 0
+
+        feats[:, 0] = c + d
+        feats[:, 1] = np.sqrt(m2)
+        feats[:, 2] = np.sqrt(sum_sq)
+        feats[:, 3] = sum_sq
+        feats[:, 6] = np.sqrt(sum_sq / n)
+        feats[:, 7] = self.crossings / n
+
+        # Biased skew and excess kurtosis, constant axes give 0 and -3 like time_features
+        with np.errstate(divide='ignore', invalid='ignore'):
+            feats[:, 8] = np.where(constant, 0, m3 / m2 ** 1.5)
+            feats[:, 9] = np.where(constant, 0, m4 / m2 ** 2) - 3
+
+        return out
+
+    '''Samples in the window, oldest first'''
+    def snapshot(self):
+        if self.count < self.length:
+            return self.window[:self.count].copy()
+        return np.concatenate((self.window[self.index:], self.window[:self.index]))
+
+
+'''Low frequency PSD bins of a sliding window kept up to date one sample at a time.
+Each of bins 1 to n_bins is advanced with the sliding DFT recurrence
+X_k <- (X_k - x_oldest + x_newest) * exp(2j pi k / n), O(n_bins) per sample, and psd()
+scales them exactly like psd_bins. The mean only reaches bin 0, so the constant detrend
+of the periodogram needs no update. Rounding in the recurrence is not damped, so the
+bins are recomputed with an FFT of the stored window every reanchor_interval samples.'''
+class ClSlidingPSD:
+
+    def __init__(self, length, fs, n_bins, n_axes=6, reanchor_interval=REANCHOR_INTERVAL):
+        self.length = length
+        self.fs = fs
+        self.n_bins = n_bins
+        self.n_axes = n_axes
+        self.reanchor_interval = reanchor_interval
+
+        # Stored window, oldest sample lives at the write index once full
+        self.window = np.zeros((length, n_axes))
+        self.index = 0
+        self.sample_count = 0
+
+        # DFT bins 1 to n_bins of the window, oldest sample at time 0
+        self.bins = np.zeros((n_bins, n_axes), dtype=complex)
+        self.twiddle = np.exp(2j * np.pi * np.arange(1, n_bins + 1) / length)[:, None]
+        self.delta = np.empty(n_axes)
+
+        # Density scaling of psd_bins, Nyquist bin of an even window is not doubled
+        self.scale = np.full((n_bins, 1), 2 / (fs * length))
+        if length % 2 == 0 and n_bins >= length // 2:
+            self.scale[length // 2 - 1] /= 2
+
+        self.since_anchor = 0
+
+    '''Add one sample, dropping the oldest (zeros until the window has filled)'''
+    def append(self, sample):
+        oldest = self.window[self.index]
+        np.subtract(sample, oldest, out=self.delta)
+        oldest[:] = sample
+
+        self.bins += self.delta
+        self.bins *= self.twiddle
+
+        self.index = self.index + 1 if self.index + 1 < self.length else 0
+        self.sample_count += 1
+
+        self.since_anchor += 1
+        if self.since_anchor >= self.reanchor_interval:
+            self.reanchor()
+
+    '''Recompute the bins exactly from the stored window'''
+    def reanchor(self):
+        window = np.concatenate((self.window[self.index:], self.window[:self.index]))
+        self.bins[:] = np.fft.rfft(window, axis=0)[1:self.n_bins + 1]
+        self.since_anchor = 0
+
+    '''PSD of the current window as an (n_bins, axes) array, as returned by psd_bins'''
+    def psd(self, out=None):
+        if out is None:
+            out = np.empty(self.bins.shape)
+        np.multiply(self.bins.real, self.bins.real, out=out)
+        out += self.bins.imag * self.bins.imag
+        out *= self.scale
+
+        return out
+
+
+if __name__ == '__main__':
+
+    from scipy import signal, stats
+
+    # Parity check of the vectorized engines against the per-axis functions
+    time_functions = [np.mean, np.std, l2norm, autocorr, np.amax, np.amin, rms, zcr, stats.skew, stats.kurtosis]
+
+    np.random.seed(0)
+
+    for trial in range(100):
+        window = np.random.normal(size=(300, 6)) * np.random.uniform(0.01, 10, size=6) + np.random.normal(size=6)
+
+        reference = [func(window[:, i]) for i in range(window.shape[1]) for func in time_functions]
+        np.testing.assert_allclose(time_features(window), reference, rtol=1e-9, atol=1e-12)
+
+    print('time_features matches per-axis functions')
+
+    freq_functions = [msf, rmsf, fc, vf, rvf]
+
+    for fs, n, n_bins in [(300, 300, 60), (333.3, 333, 64)]:
+        freqs = psd_freqs(n, fs, n_bins)
+
+        for trial in range(100):
+            window = np.random.normal(size=(n, 6)) * np.random.uniform(0.01, 10, size=6)
+            window[:, 5] = 0
+
+            reference = np.zeros((n_bins, 6))
+            for i in range(6):
+                freq, Pxx = signal.periodogram(window[:, i], fs)
+                reference[:, i] = np.resize(Pxx[1:], n_bins)
+                np.testing.assert_allclose(freqs, np.resize(freq[:-1], n_bins))
+
+            psd = psd_bins(window, fs, n_bins)
+            np.testing.assert_allclose(psd, reference, rtol=1e-9, atol=1e-12)
+
+            reference_log = [np.log10(p) if p != 0 else 0 for p in reference.T.ravel()]
+            np.testing.assert_allclose(log_psd(psd), reference_log, rtol=1e-9, atol=1e-9)
+
+            reference_freq = [func(freqs, psd[:, i]) for i in range(6) for func in freq_functions]
+            np.testing.assert_allclose(freq_features(freqs, psd), reference_freq, rtol=1e-9, atol=1e-12)
+
+    print('psd_bins, log_psd and freq_features match periodogram and per-axis functions')
+
+    # Batch engines against the single window engines, in the default and a transposed layout
+    for fs, n, n_bins in [(300, 300, 60), (333.3, 333, 64)]:
+        freqs = psd_freqs(n, fs, n_bins)
+        windows = np.random.normal(size=(50, n, 6)) * np.random.uniform(0.01, 10, size=6) + np.random.normal(size=6)
+        windows[3] = 0
+        windows[7, :, 2] = 1.5
+
+        psd = psd_bins_batch(windows, fs, n_bins, chunk=16)
+        features = window_features_batch(windows.transpose(0, 2, 1), fs, n_bins, axis=2)
+
+        for i, window in enumerate(windows):
+            window_psd = psd_bins(window, fs, n_bins)
+            np.testing.assert_allclose(time_features_batch(windows, chunk=16)[i], time_features(window), rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(psd[i], window_psd, rtol=1e-12, atol=1e-15)
+            np.testing.assert_allclose(log_psd_batch(psd)[i], log_psd(window_psd), rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(freq_features_batch(freqs, psd)[i], freq_features(freqs, window_psd), rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(features['Time'][i], time_features(window), rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(features['Freq'][i], freq_features(freqs, window_psd), rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(features['PSDLog'][i], log_psd(window_psd), rtol=1e-12, atol=1e-12)
+
+    print('time_features_batch, psd_bins_batch, log_psd_batch and freq_features_batch match the single window engines')
+
+    # Streaming time features against the batch engine over a long run of IMU-like data,
+    # or over a recorded (samples, axes) .npy passed as the first argument
+    import sys
+    import timeit
+
+    if len(sys.argv) > 1:
+        recording = np.load(sys.argv[1])
+    else:
+        n_samples = 200000
+        t = np.arange(n_samples) / 300
+        recording = np.random.normal(size=(n_samples, 6)) * [0.5, 0.5, 0.8, 20, 20, 20]
+        recording += np.sin(2 * np.pi * 1.5 * t)[:, None] * [1, 0, 2, 30, 0, 10]
+        recording += [0.1, -0.2, 9.8, 0.5, -1, 0]
+        recording[50000:60000, 4] = 0.25
+
+    for length in [330, 363]:
+        streaming = ClStreamingTimeFeatures(length, recording.shape[1])
+        worst = 0
+
+        for i, sample in enumerate(recording):
+            streaming.append(sample)
+            if i + 1 >= length and i % 97 == 0:
+                reference = time_features(recording[i + 1 - length:i + 1])
+                np.testing.assert_allclose(streaming.features(), reference, rtol=1e-7, atol=1e-9)
+                worst = max(worst, np.max(np.abs(streaming.features() - reference) / np.maximum(np.abs(reference), 1)))
+
+        print('ClStreamingTimeFeatures matches time_features over {} samples (window {}, worst relative error {:.1e})'.format(len(recording), length, worst))
+
+    sample = recording[-1]
+    window = recording[-length:]
+    append_time = min(timeit.repeat(lambda: streaming.append(sample), number=10000, repeat=5)) / 10000
+    features_time = min(timeit.repeat(streaming.features, number=10000, repeat=5)) / 10000
+    batch_time = min(timeit.repeat(lambda: time_features(window), number=10000, repeat=5)) / 10000
+    print('append {:.1f} us/sample, features {:.1f} us, time_features {:.1f} us/window'.format(append_time * 1e6, features_time * 1e6, batch_time * 1e6))
+
+    # Batch featurization of a recording against a loop over its windows, the cost per window
+    # should stay flat as the number of windows grows
+    fs, length, n_bins, hop = 300, 330, 60, 30
+    recording_windows = np.lib.stride_tricks.sliding_window_view(recording, length, axis=0)[::hop]
+
+    for n_windows in [10, 100, 1000, len(recording_windows)]:
+        windows = recording_windows[:n_windows]
+        loop_time = min(timeit.repeat(lambda: [(time_features(window.T), log_psd(psd_bins(window.T, fs, n_bins))) for window in windows[:100]],
+                                      number=1, repeat=3)) / min(n_windows, 100)
+        batch_time = min(timeit.repeat(lambda: window_features_batch(windows, fs, n_bins, axis=2), number=1, repeat=3)) / n_windows
+        print('{:6d} windows: batch {:.1f} us/window, loop {:.1f} us/window'.format(n_windows, batch_time * 1e6, loop_time * 1e6))
+
+    # Sliding PSD bins against periodogram on the same windows, then throughput
+    for fs, length, n_bins in [(300, 300, 60), (333.3, 333, 64), (300, 120, 60)]:
+        sliding = ClSlidingPSD(length, fs, n_bins, recording.shape[1])
+
+        for i, sample in enumerate(recording[:100000]):
+            sliding.append(sample)
+            if i + 1 >= length and i % 997 == 0:
+                window = recording[i + 1 - length:i + 1]
+                reference = np.zeros((n_bins, window.shape[1]))
+                for axis in range(window.shape[1]):
+                    freq, Pxx = signal.periodogram(window[:, axis], fs)
+                    reference[:, axis] = np.resize(Pxx[1:], n_bins)
+                psd = sliding.psd()
+                np.testing.assert_allclose(psd, reference, rtol=1e-6, atol=1e-9 * np.max(reference))
+
+        print('ClSlidingPSD matches periodogram (fs {}, window {}, {} bins)'.format(fs, length, n_bins))
+
+    fs, length, n_bins, hop = 300, 300, 60, 150
+    sliding = ClSlidingPSD(length, fs, n_bins, recording.shape[1])
+    window = recording[-length:]
+
+    def fnPeriodograms():
+        for axis in range(window.shape[1]):
+            signal.periodogram(window[:, axis], fs)
+
+    append_time = min(timeit.repeat(lambda: sliding.append(sample), number=10000, repeat=5)) / 10000
+    psd_time = min(timeit.repeat(sliding.psd, number=10000, repeat=5)) / 10000
+    batch_time = min(timeit.repeat(lambda: psd_bins(window, fs, n_bins), number=10000, repeat=5)) / 10000
+    periodogram_time = min(timeit.repeat(fnPeriodograms, number=1000, repeat=5)) / 1000
+    print('ClSlidingPSD append {:.1f} us/sample ({:.0f} samples/s), psd {:.1f} us'.format(append_time * 1e6, 1 / append_time, psd_time * 1e6))
+    print('per {} sample hop: sliding {:.0f} us, psd_bins {:.0f} us, 6 periodograms {:.0f} us'.format(
+        hop, (hop * append_time + psd_time) * 1e6, batch_time * 1e6, periodogram_time * 1e6))
@@ -0,0 +1,75 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library designs and applies the low pass
+				Butterworth filter used on the rolling IMU window.
+
+				Filter coefficients are designed once per sensor parameter
+				set in second-order-sections form and cached, and all axes
+				of a window, or of a stack of windows, are filtered in a
+				single zero-phase call.
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+from scipy import signal
+
+# DEFINITIONS
+
+FILTER_ORDER = 4
+
+# Cached second-order sections keyed by (order, fLow, fSamp, float type)
+SOS_CACHE = {}
+
+# FUNCTIONS
+
+def fnDesignButter(sensorParam, order = FILTER_ORDER, dtype = np.float64):
+	"""
+	Purpose:	Retrieve the low pass Butterworth filter for a sensor, designing
+				it on first use
+	Passed:		Sensor parameter dictionary (FRAME_MODULE / WHEEL_MODULE)
+				Filter order
+				Float type of the sections, windows of the same type are filtered in it
+	Returns:	Second-order sections array
+	"""
+
+	key = (order, sensorParam['fLow'], sensorParam['fSamp'], np.dtype(dtype).name)
+
+	if key not in SOS_CACHE:
+		# Get normalized cut-off frequency
+		w_low = sensorParam['fLow'] / (sensorParam['fSamp'] / 2)
+		SOS_CACHE[key] = signal.butter(N=order, Wn=w_low, btype='low', output='sos').astype(dtype)
+
+	return SOS_CACHE[key]
+
+def fnFilterWindow(sos, dataWindow, out, padLength):
+	"""
+	Purpose:	Zero-phase filter every axis of a padded window along axis 0
+				and store the unpadded centre in a preallocated array
+	Passed:		Second-order sections
+				Padded (wLength + 2 * padLength, axes) raw window
+				Preallocated (wLength, axes) output array
+				Pad length on either side of the window
+	Returns:	Output array
+	"""
+
+	filtered = signal.sosfiltfilt(sos, dataWindow, axis=0)
+	out[:] = filtered[padLength:padLength + out.shape[0]]
+
+	return out
+
+def fnFilterWindowBatch(sos, dataWindows, out, padLength):
+	"""
+	Purpose:	Zero-phase filter every axis of a stack of padded windows along axis 1,
+				each window on its own exactly as fnFilterWindow does
+	Passed:		Second-order sections
+				Padded (windows, wLength + 2 * padLength, axes) raw windows
+				Preallocated (windows, wLength, axes) output array
+				Pad length on either side of the windows
+	Returns:	Output array
+	"""
+
+	filtered = signal.sosfiltfilt(sos, dataWindows, axis=1)
+	out[:] = filtered[:, padLength:padLength + out.shape[1]]
+
+	return out
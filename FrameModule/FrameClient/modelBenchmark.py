@@ -0,0 +1,380 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python script benchmarks every model in models/ against the
+				classification budget and writes the results as a csv table,
+				one row per placement, model type and feature table, so runs
+				of different commits can be compared.
+
+				Each model is measured in its own fresh worker process: the
+				cold load (fnLoadModel with nothing in memory), compiling it
+				from its joblib file, the bytes of its arrays and the growth
+				in resident size. The held-out end of every recorded session,
+				split as trainingPipeline holds it out, is then replayed
+				window by window through the ClTerrainClassifier path (filter,
+				planned features, scaler, model) for the warm per-window
+				latency and the accuracy.
+
+				Tables with no model file, and models of a table without a
+				feature engine (FFTs), are kept in the table with their status.
+				The script exits with status 1 if any model's p99 latency is
+				over the budget, or regressed against a previous table.
+
+				python3 modelBenchmark.py "IMU Data/Middle_Grass_Frame6050.csv" Left="IMU Data/Grass_Synthesis.csv" ...
+				python3 modelBenchmark.py ... --compare benchmarks/modelBenchmark_1a2b3c4.csv
+"""
+
+# IMPORTED LIBRARIES
+
+import numpy as np
+import pandas as pd
+import os
+import re
+import sys
+import time
+import platform
+import subprocess
+
+from multiprocessing import Pool
+
+from filterLib import fnDesignButter, fnFilterWindow
+from modelLib import fnLoadModel, fnCompileModel
+from cascadeLib import ClModelCascade, fnLoadFamilyScaler, MODELS, SCALERS, MODEL_DIR
+from serviceLib import ClLapRecorder, CYCLE_SECONDS
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, TERRAINS, fnSessionFreqs
+from sessionLib import fnParseSessionName, fnLoadSession, fnSessionWindows
+from trainingPipeline import fnSplitWindows, TEST_FRACTION
+from precisionReport import fnResidentBytes, fnArrayBytes
+from paramStoreLib import NORM_TABLES, FAMILY_TABLES
+
+# DEFINITIONS
+
+dir_path = os.path.dirname(os.path.realpath(__file__))  # Current file directory
+
+# Windows classified before timing starts, so caches and lazily built plans are warm
+WARMUP_WINDOWS = 10
+
+# Directory the tables are written to by default, one per commit
+BENCHMARK_DIR = os.path.join(dir_path, 'benchmarks')
+
+# Model file prefixes (RandomForest, SupportVectorMachine) in MODELS order
+MODEL_TYPES = list(dict.fromkeys(fileName.split('_')[0] for fileName, family in MODELS.values()))
+
+# Model artifact names: type, placement and feature table
+MODEL_PATTERN = re.compile(r'^(?P<type>[A-Za-z]+)_(?P<placement>[A-Za-z]+)_(?P<table>[A-Za-z]+)$')
+
+# Rows are matched across tables on these columns
+KEY_COLUMNS = ['placement', 'type', 'table']
+
+# Regressions against a previous table: relative p99 growth (ignoring growth under the noise floor)
+# and drop in accuracy
+LATENCY_TOLERANCE = 0.25
+LATENCY_NOISE_MS = 0.5
+ACCURACY_DROP = 0.01
+
+# FUNCTIONS
+
+def fnCommit():
+	"""
+	Purpose:	Commit of the working tree the benchmark runs on
+	Returns:	Short hash, marked -dirty with uncommitted changes, 'unknown' outside a git checkout
+	"""
+
+	try:
+		commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=dir_path, capture_output=True, text=True, check=True).stdout.strip()
+		changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=dir_path, capture_output=True, text=True, check=True).stdout
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+	return commit + ('-dirty' if changes.strip() else '')
+
+def fnFindModels(directory = MODEL_DIR):
+	"""
+	Purpose:	Every model artifact in a directory, joblib files and compiled directories
+				written by the training pipeline counted once
+	Passed:		Model directory
+	Returns:	List of dictionaries of the artifact's path (as a joblib path), type, placement,
+				feature table, family (None without a feature engine) and model name (None outside MODELS)
+	"""
+
+	names = {fileName.format(placement): name for name, (fileName, family) in MODELS.items() for placement in SENSOR_PARAMS}
+	families = {table: family for family, table in FAMILY_TABLES.items()}
+
+	stems = set()
+	for entry in os.listdir(directory):
+		stem, extension = os.path.splitext(entry)
+		if extension == '.joblib' or os.path.isfile(os.path.join(directory, entry, 'meta.json')):
+			stems.add(stem if extension == '.joblib' else entry)
+
+	models = []
+	for stem in sorted(stems):
+		match = MODEL_PATTERN.match(stem)
+		if match is None or match.group('placement') not in SENSOR_PARAMS:
+			print('Skipping {}: not a <Type>_<Placement>_<Table> model'.format(stem))
+			continue
+
+		models.append({'path': os.path.join(directory, stem + '.joblib'), 'type': match.group('type'),
+					   'placement': match.group('placement'), 'table': match.group('table'),
+					   'family': families.get(match.group('table')), 'name': names.get(stem + '.joblib')})
+
+	return models
+
+def fnArtifactBytes(path):
+	"""
+	Purpose:	Size on disk of a model, its joblib file or else its compiled directory
+	Passed:		Path to joblib file
+	Returns:	Bytes
+	"""
+
+	if os.path.isfile(path):
+		return os.path.getsize(path)
+
+	directory = os.path.splitext(path)[0]
+
+	return sum(os.path.getsize(os.path.join(directory, entry)) for entry in os.listdir(directory))
+
+def fnBenchmarkModel(task):
+	"""
+	Purpose:	Measure one model in a fresh worker process
+	Passed:		Model dictionary from fnFindModels, list of (session csv path, placement), hop, test fraction
+	Returns:	Dictionary of the row's columns
+	"""
+
+	model, sessions, hopSamples, testFraction = task
+	path = model['path']
+	placement = model['placement']
+
+	row = {'placement': placement, 'type': model['type'], 'table': model['table'], 'model': model['name'] or '',
+		   'status': 'ok', 'fileBytes': fnArtifactBytes(path)}
+
+	# Cold load, as the classifier starts: no copy in memory, the compiled directory or on-disk cache mapped
+	rssStart = fnResidentBytes()
+	timeStart = time.perf_counter()
+	compiled = fnLoadModel(path)
+	row['loadMs'] = (time.perf_counter() - timeStart) * 1e3
+	row['rssBytes'] = fnResidentBytes() - rssStart
+	row['arrayBytes'] = fnArrayBytes(compiled)
+	row['features'] = len(compiled.featureNames) if compiled.featureNames is not None else np.nan
+
+	# Rebuilding the compiled form from the joblib file, as on a cache miss, sklearn imported beforehand
+	row['compileMs'] = np.nan
+	if os.path.isfile(path):
+		from joblib import load
+		import sklearn.ensemble, sklearn.svm
+		timeStart = time.perf_counter()
+		fnCompileModel(load(path))
+		row['compileMs'] = (time.perf_counter() - timeStart) * 1e3
+
+	if model['family'] is None:
+		row['status'] = 'no feature engine'
+		return row
+	if model['name'] is None:
+		row['status'] = 'not in MODELS'
+		return row
+
+	replay = fnReplayModel(model['name'], compiled, placement, fnHeldOutWindows(sessions, placement, hopSamples, testFraction))
+
+	row['features'] = replay['features']
+	row['testWindows'] = len(replay['seconds'])
+	row['accuracy'] = float(np.mean(replay['correct'])) if len(replay['correct']) else np.nan
+
+	if not len(replay['seconds']):
+		row['status'] = 'no sessions'
+		return row
+
+	row['p50Ms'], row['p95Ms'], row['p99Ms'] = np.percentile(replay['seconds'], [50, 95, 99]) * 1e3
+	row['modelP50Ms'], row['modelP99Ms'] = np.percentile(replay['modelSeconds'], [50, 99]) * 1e3
+
+	return row
+
+def fnHeldOutWindows(sessions, placement, hopSamples, testFraction = TEST_FRACTION):
+	"""
+	Purpose:	Padded windows of the held-out end of every session of a placement, split as
+				trainingPipeline holds them out
+	Passed:		List of (session csv path, placement)
+				Sensor placement
+				Samples between classifications
+				Share of each session held out
+	Returns:	List of ((n_windows, wLength + 2 * PAD_LENGTH, 6) windows, terrain) per session
+	"""
+
+	sensorParam = SENSOR_PARAMS[placement]
+	gapWindows = -(-(sensorParam['wLength'] + 2 * PAD_LENGTH) // hopSamples) - 1
+
+	heldOut = []
+	for sessionPath, sessionPlacement in sessions:
+		if sessionPlacement != placement:
+			continue
+
+		samples, sessionPlacement, terrain = fnLoadSession(sessionPath, sessionPlacement)
+		windows = fnSessionWindows(samples, sensorParam, hopSamples)
+		trainWindows, testWindows = fnSplitWindows(len(windows), gapWindows, testFraction)
+		heldOut.append((windows[testWindows], terrain))
+
+	return heldOut
+
+def fnReplayModel(name, compiled, placement, heldOut):
+	"""
+	Purpose:	Classify held-out windows one at a time through the ClTerrainClassifier path
+				(filter, planned features, scaler, model) with a single model
+	Passed:		Model name from MODELS
+				Compiled model
+				Sensor placement
+				List of (windows, terrain) from fnHeldOutWindows
+	Returns:	Dictionary of the window seconds, the model's share of them, whether each window
+				of a known terrain was labelled correctly and the number of features planned
+	"""
+
+	sensorParam = SENSOR_PARAMS[placement]
+	scalers = {family: fnLoadFamilyScaler(placement, family) for family in SCALERS}
+	cascade = ClModelCascade([[name]], {name: compiled}, scalers, placement, fnSessionFreqs(sensorParam), sensorParam['fSamp'])
+	sos = fnDesignButter(sensorParam)
+	filtered = np.zeros((sensorParam['wLength'], 6))
+
+	seconds = []
+	modelSeconds = []
+	correct = []
+	warmup = WARMUP_WINDOWS
+
+	for windows, terrain in heldOut:
+
+		# Warm-up windows are run again below, only their timings are dropped
+		for window in windows[:warmup]:
+			fnFilterWindow(sos, window, filtered, PAD_LENGTH)
+			cascade.fnClassify(filtered)
+		warmup -= min(warmup, len(windows))
+
+		for window in windows:
+			laps = ClLapRecorder()
+			timeStart = time.perf_counter()
+			fnFilterWindow(sos, window, filtered, PAD_LENGTH)
+			labels, decision, stagesRun = cascade.fnClassify(filtered, laps)
+			seconds.append(time.perf_counter() - timeStart)
+			modelSeconds.append(sum(lap for stage, lap in laps.laps if stage == name))
+
+			if terrain in TERRAINS:
+				correct.append(decision == TERRAINS.index(terrain))
+
+	return {'seconds': np.array(seconds), 'modelSeconds': np.array(modelSeconds), 'correct': np.array(correct, dtype=bool),
+			'features': len(cascade.featureNames[name])}
+
+def fnMissingRows(models, placements):
+	"""
+	Purpose:	Rows for every model type and feature table without a model file, so every
+				table has the same rows across commits
+	Passed:		List of model dictionaries from fnFindModels
+				Placements benchmarked
+	Returns:	List of row dictionaries
+	"""
+
+	found = {(model['placement'], model['type'], model['table']) for model in models}
+
+	return [{'placement': placement, 'type': modelType, 'table': table, 'model': '', 'status': 'missing'}
+			for placement in placements for modelType in MODEL_TYPES for table in NORM_TABLES
+			if (placement, modelType, table) not in found]
+
+def fnCompare(table, previous, tolerance = LATENCY_TOLERANCE, accuracyDrop = ACCURACY_DROP):
+	"""
+	Purpose:	Find the rows that regressed against a previous table
+	Passed:		Benchmark table
+				Previous benchmark table
+				Relative growth of the p99 latency counted as a regression
+				Drop in accuracy counted as a regression
+	Returns:	List of regression descriptions
+	"""
+
+	merged = table.merge(previous, on=KEY_COLUMNS, how='inner', suffixes=('', 'Previous'))
+	regressions = []
+
+	for i, row in merged.iterrows():
+		label = '{} {} {}'.format(row['placement'], row['type'], row['table'])
+
+		if row['statusPrevious'] == 'ok' and row['status'] != 'ok':
+			regressions.append('{}: {} (was ok)'.format(label, row['status']))
+			continue
+		if row['status'] != 'ok' or row['statusPrevious'] != 'ok':
+			continue
+
+		growth = row['p99Ms'] - row['p99MsPrevious']
+		if growth > max(tolerance * row['p99MsPrevious'], LATENCY_NOISE_MS):
+			regressions.append('{}: p99 latency {:.2f} ms, was {:.2f} ms'.format(label, row['p99Ms'], row['p99MsPrevious']))
+		if row['accuracy'] < row['accuracyPrevious'] - accuracyDrop:
+			regressions.append('{}: accuracy {:.2%}, was {:.2%}'.format(label, row['accuracy'], row['accuracyPrevious']))
+
+	return regressions
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Benchmark the latency, memory and held-out accuracy of every model against the classification budget.')
+	parser.add_argument('sessions', nargs='*', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between classifications')
+	parser.add_argument('--test-fraction', type=float, default=TEST_FRACTION, help='share of each session held out, as in trainingPipeline')
+	parser.add_argument('--budget', type=float, default=CYCLE_SECONDS, help='seconds a window may take at p99')
+	parser.add_argument('--output', default=None, help='csv table written (default benchmarks/modelBenchmark_<commit>.csv)')
+	parser.add_argument('--compare', default=None, help='previous csv table to check for regressions')
+	args = parser.parse_args()
+
+	commit = fnCommit()
+
+	sessions = []
+	for session in args.sessions:
+		placement, path = session.split('=', 1) if '=' in session else (None, session)
+		name = fnParseSessionName(path)
+		sessions.append((path, placement or (name['Placement'] if name else 'Middle')))
+
+	models = fnFindModels()
+	placements = sorted({model['placement'] for model in models} | {placement for path, placement in sessions})
+
+	# A fresh worker per model, so every load is cold and no model shares another's memory
+	rows = []
+	with Pool(1, maxtasksperchild=1) as pool:
+		for row in pool.imap(fnBenchmarkModel, [(model, sessions, args.hop, args.test_fraction) for model in models]):
+			rows.append(row)
+
+	rows += fnMissingRows(models, placements)
+
+	columns = KEY_COLUMNS + ['model', 'status', 'features', 'fileBytes', 'arrayBytes', 'rssBytes', 'loadMs', 'compileMs',
+							 'testWindows', 'accuracy', 'p50Ms', 'p95Ms', 'p99Ms', 'modelP50Ms', 'modelP99Ms']
+	table = pd.DataFrame(rows, columns=columns).sort_values(KEY_COLUMNS).reset_index(drop=True)
+	table['overBudget'] = table['p99Ms'] > args.budget * 1e3
+	table.insert(0, 'commit', commit)
+	table.insert(1, 'machine', platform.machine())
+
+	output = args.output or os.path.join(BENCHMARK_DIR, 'modelBenchmark_{}.csv'.format(commit))
+	os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+	table.to_csv(output, index=False)
+
+	for i, row in table[table['status'] != 'missing'].iterrows():
+		if row['status'] != 'ok':
+			print('{:>6s} {:>20s} {:>9s}: {}, load {:.1f} ms, {:.1f} kB'.format(
+				row['placement'], row['type'], row['table'], row['status'], row['loadMs'], row['arrayBytes'] / 1e3))
+			continue
+		print('{:>6s} {:>20s} {:>9s}: load {:6.1f} ms (compile {:7.1f} ms), {:7.1f} kB arrays, window p50 {:6.2f} ms p99 {:6.2f} ms '
+			  '(model {:5.2f} ms), accuracy {:.1%} on {} windows{}'.format(
+			row['placement'], row['type'], row['table'], row['loadMs'], row['compileMs'], row['arrayBytes'] / 1e3,
+			row['p50Ms'], row['p99Ms'], row['modelP99Ms'], row['accuracy'], int(row['testWindows']),
+			', OVER BUDGET' if row['overBudget'] else ''))
+
+	missing = table[table['status'] == 'missing']
+	print('{} of {} placement, type and table combinations have no model file'.format(len(missing), len(missing) + len(models)))
+	print('Table of {} written to {}'.format(commit, output))
+
+	failures = ['{} {} {}: p99 {:.2f} ms over the {:g} ms budget'.format(row['placement'], row['type'], row['table'], row['p99Ms'], args.budget * 1e3)
+				for i, row in table[table['overBudget']].iterrows()]
+
+	if args.compare:
+		previous = pd.read_csv(args.compare, dtype={'commit': str, 'machine': str})
+		if set(previous['machine']) != {platform.machine()}:
+			print('Warning: {} was measured on {}, latencies are not comparable'.format(args.compare, ', '.join(sorted(set(previous['machine'])))))
+		print('Compared against {} ({})'.format(args.compare, ', '.join(sorted(set(previous['commit'])))))
+		failures += fnCompare(table, previous)
+
+	for failure in failures:
+		print('FAIL ' + failure)
+
+	sys.exit(1 if failures else 0)
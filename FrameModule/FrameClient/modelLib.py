@@ -0,0 +1,789 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library converts the trained terrain classifiers
+				into flat NumPy arrays and evaluates them without going
+				through sklearn's per-call validation and dispatch.
+
+				1. RandomForest - flattened node arrays, vectorized traversal
+				2. SupportVectorMachine - support vectors and one-vs-one
+				   coefficients extracted once, batched kernel evaluation
+				3. StandardScaler - contiguous mean and scale applied in place
+
+				Compiled artifacts are cached on disk as memory-mappable
+				arrays keyed by the source file, and in memory per process,
+				so joblib and sklearn are only imported when a model changes.
+				Artifacts written directly in compiled form by the training
+				pipeline are read without joblib or sklearn at all.
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os, sys
+import time
+import json
+import shutil
+import hashlib
+
+# DEFINITIONS
+
+dir_path = os.path.dirname(os.path.realpath(__file__))  # Current file directory
+
+# Directory holding compiled artifacts, one subdirectory per source file path
+CACHE_DIR = os.path.join(dir_path, 'cache')
+
+# Compiled artifacts already loaded in this process, keyed by source path (and float type for copies in other types)
+MEMORY_CACHE = {}
+
+# Tree level from which, and levels between which, paths that reached a leaf are dropped from batch traversal
+COMPACT_START = 8
+COMPACT_EVERY = 3
+
+# CLASSES
+
+class ClCompiledForest:
+	"""
+	Class for evaluating a random forest from flattened node arrays.
+	"""
+
+	def __init__(self, feature, threshold, left, right, value, roots, classes, depth, featureNames = None):
+		"""
+		Purpose:	Store the flattened forest
+		Passed:		Feature index tested at each node (0 at leaves)
+					Threshold at each node (inf at leaves)
+					Left child of each node (leaves point to themselves)
+					Right child of each node (leaves point to themselves)
+					Class vote fractions at each node (n_nodes, n_classes)
+					Root node of each tree
+					Class labels
+					Maximum tree depth
+					Optional names of the features the forest was trained on
+		"""
+
+		self.feature = feature
+		self.threshold = threshold
+		self.left = left
+		self.right = right
+		self.value = value
+		self.roots = roots
+		self.classes_ = classes
+		self.depth = int(depth)
+		self.featureNames = featureNames
+
+		# Traversal copies: 32-bit indices, both children of a node side by side so one take picks
+		# the branch, and float32 thresholds so float32 features are compared without conversion
+		self.children = np.stack([left, right], axis=1).astype(np.int32).ravel()
+		self.splitFeature = np.asarray(feature, dtype=np.int32)
+		self.splitThreshold = fnFloorThreshold(threshold, np.float32)
+		self.leaf = np.asarray(left) == np.arange(len(left))
+		self.rootNodes = np.asarray(roots, dtype=np.int32)
+
+	@classmethod
+	def fnFromEstimator(cls, forest):
+		"""
+		Purpose:	Flatten a fitted sklearn RandomForestClassifier
+		Passed:		Fitted forest
+		Returns:	Compiled forest
+		"""
+
+		features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+		depth = 0
+		offset = 0
+
+		for estimator in forest.estimators_:
+			tree = estimator.tree_
+			nNodes = tree.node_count
+			nodes = np.arange(nNodes)
+			leaf = tree.children_left == -1
+
+			# Leaves always step left onto themselves so traversal can run a fixed depth
+			features.append(np.where(leaf, 0, tree.feature))
+			thresholds.append(np.where(leaf, np.inf, tree.threshold))
+			lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+			rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+
+			# Normalize leaf counts into vote fractions like DecisionTreeClassifier.predict_proba
+			value = tree.value[:, 0, :].astype(np.float64)
+			normalizer = value.sum(axis=1, keepdims=True)
+			normalizer[normalizer == 0] = 1
+			values.append(value / normalizer)
+
+			roots.append(offset)
+			depth = max(depth, tree.max_depth)
+			offset += nNodes
+
+		return cls(np.concatenate(features).astype(np.intp), np.concatenate(thresholds),
+				   np.concatenate(lefts).astype(np.intp), np.concatenate(rights).astype(np.intp),
+				   np.concatenate(values), np.array(roots, dtype=np.intp), np.asarray(forest.classes_), depth,
+				   getattr(forest, 'feature_names_in_', None))
+
+	def fnToArrays(self):
+		"""
+		Purpose:	Split the compiled forest into arrays and scalars for storage
+		Returns:	Dictionary of arrays, dictionary of scalars
+		"""
+
+		arrays = {'feature': self.feature, 'threshold': self.threshold, 'left': self.left, 'right': self.right,
+				  'value': self.value, 'roots': self.roots, 'classes': self.classes_}
+		if self.featureNames is not None:
+			arrays['featureNames'] = self.featureNames
+
+		return arrays, {'depth': self.depth}
+
+	@classmethod
+	def fnFromArrays(cls, arrays, scalars):
+		"""
+		Purpose:	Rebuild the compiled forest from stored arrays and scalars
+		Passed:		Dictionary of arrays, dictionary of scalars
+		Returns:	Compiled forest
+		"""
+
+		return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+				   arrays['value'], arrays['roots'], arrays['classes'], scalars['depth'], arrays.get('featureNames'))
+
+	def fnAsType(self, dtype):
+		"""
+		Purpose:	Copy of the forest with thresholds and vote fractions in another float type
+		Passed:		Float type (i.e. np.float32)
+		Returns:	Compiled forest
+		"""
+
+		# Round thresholds down so float32 features take the same branch as against the float64 threshold
+		threshold = fnFloorThreshold(self.threshold, dtype)
+
+		return ClCompiledForest(self.feature, threshold, self.left, self.right, self.value.astype(dtype),
+								self.roots, self.classes_, self.depth, self.featureNames)
+
+	def fnPrune(self, nTrees = None, maxDepth = None):
+		"""
+		Purpose:	Smaller copy of the forest keeping its first trees, cut to a maximum depth,
+					with the nodes no longer reachable dropped
+		Passed:		Number of trees kept (None for all)
+					Depth at which nodes become leaves (None for the full depth)
+		Returns:	Compiled forest
+		"""
+
+		roots = self.roots[:nTrees]
+		maxDepth = self.depth if maxDepth is None else min(maxDepth, self.depth)
+
+		# Walk down from the roots one level at a time, nodes on the last level kept become leaves
+		levels = [roots]
+		while len(levels) <= maxDepth:
+			frontier = levels[-1]
+			internal = frontier[self.left[frontier] != frontier]
+			if len(internal) == 0:
+				break
+			levels.append(np.concatenate([self.left[internal], self.right[internal]]))
+
+		nodes = np.sort(np.concatenate(levels))
+		leaf = np.isin(nodes, levels[-1]) | (self.left[nodes] == nodes)
+
+		index = np.zeros(len(self.feature), dtype=np.intp)
+		index[nodes] = np.arange(len(nodes))
+		kept = np.arange(len(nodes))
+
+		# Internal node vote fractions are the class fractions reaching them, as leaves of a shallower tree
+		return ClCompiledForest(np.where(leaf, 0, self.feature[nodes]), np.where(leaf, np.inf, self.threshold[nodes]).astype(self.threshold.dtype),
+								np.where(leaf, kept, index[self.left[nodes]]), np.where(leaf, kept, index[self.right[nodes]]),
+								np.array(self.value[nodes]), index[roots], self.classes_, len(levels) - 1, self.featureNames)
+
+	def fnApply(self, X):
+		"""
+		Purpose:	Find the leaf reached in every tree for every sample
+		Passed:		(n_samples, n_features) feature array
+		Returns:	(n_samples, n_trees) leaf node indices
+		"""
+
+		# Trees compare float32 features, as in sklearn
+		X = np.asarray(X, dtype=np.float32)
+		if X.ndim == 1:
+			X = X.reshape(1, -1)
+
+		# One flat entry per sample and tree, with the offset of the sample's row so features are gathered with a single take
+		nSamples, nFeatures = X.shape
+		nTrees = len(self.rootNodes)
+		flatX = np.ascontiguousarray(X).ravel()
+		nodes = np.tile(self.rootNodes, nSamples)
+		rowOffset = np.repeat(np.arange(nSamples, dtype=np.int32) * nFeatures, nTrees)
+
+		leaves = None
+		for level in range(self.depth):
+			nodes = self.children.take(2 * nodes + (flatX.take(rowOffset + self.splitFeature.take(nodes)) > self.splitThreshold.take(nodes)))
+
+			# Most paths end well above the deepest leaf, so finished ones stop being stepped
+			if level >= COMPACT_START and (level - COMPACT_START) % COMPACT_EVERY == 0:
+				active = ~self.leaf.take(nodes)
+				if leaves is None:
+					leaves = nodes.copy()
+					slots = np.flatnonzero(active)
+				else:
+					leaves[slots] = nodes
+					slots = slots[active]
+				nodes = nodes[active]
+				rowOffset = rowOffset[active]
+				if len(nodes) == 0:
+					break
+
+		if leaves is None:
+			leaves = nodes
+		else:
+			leaves[slots] = nodes
+
+		return leaves.reshape(nSamples, nTrees)
+
+	def predict_proba(self, X):
+		"""
+		Purpose:	Average class vote fractions over all trees
+		Passed:		(n_samples, n_features) feature array or a single feature row
+		Returns:	(n_samples, n_classes) class probabilities
+		"""
+
+		leaves = self.fnApply(X)
+
+		# Votes summed tree by tree, as sklearn accumulates them
+		votes = np.add.reduceat(self.value.take(leaves.ravel(), axis=0), np.arange(0, leaves.size, leaves.shape[1]), axis=0)
+
+		return votes / leaves.shape[1]
+
+	def predict(self, X):
+		"""
+		Purpose:	Predict the class of each sample
+		Passed:		(n_samples, n_features) feature array or a single feature row
+		Returns:	(n_samples, ) class labels
+		"""
+
+		return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+class ClCompiledSVC:
+	"""
+	Class for evaluating a one-vs-one support vector classifier as one batched kernel.
+	"""
+
+	def __init__(self, supportVectors, pairCoefT, intercept, pairClasses, classes, kernel, gamma, coef0, degree, svNorms = None, featureNames = None):
+		"""
+		Purpose:	Store the extracted support vector machine
+		Passed:		Support vectors (n_sv, n_features)
+					Coefficient of every support vector in every class pair (n_sv, n_pairs)
+					Intercept of every class pair
+					Class index pair (i, j) of every decision function (n_pairs, 2)
+					Class labels
+					Kernel name ('rbf', 'linear', 'poly', 'sigmoid')
+					Kernel parameters gamma, coef0 and degree
+					Optional precomputed squared norm of every support vector
+					Optional names of the features the model was trained on
+		"""
+
+		self.supportVectors = supportVectors
+		self.pairCoefT = pairCoefT
+		self.intercept = intercept
+		self.pairClasses = pairClasses
+		self.classes_ = classes
+		self.kernel = kernel
+		self.gamma = gamma
+		self.coef0 = coef0
+		self.degree = degree
+
+		# Precomputed support vector norms for the RBF kernel
+		if svNorms is None:
+			svNorms = np.einsum('ij,ij->i', supportVectors, supportVectors)
+		self.svNorms = svNorms
+		self.featureNames = featureNames
+
+	@classmethod
+	def fnFromEstimator(cls, svc):
+		"""
+		Purpose:	Extract the one-vs-one decision functions of a fitted sklearn SVC
+		Passed:		Fitted SVC
+		Returns:	Compiled support vector classifier
+		"""
+
+		# Read attributes directly so models pickled by older sklearn versions still load
+		attributes = vars(svc)
+		nSupport = np.asarray(attributes.get('_n_support', attributes.get('n_support_')))
+		dualCoef = np.asarray(attributes['_dual_coef_'])
+		supportVectors = np.asarray(attributes['support_vectors_'], dtype=np.float64)
+
+		nClasses = len(nSupport)
+		start = np.concatenate([[0], np.cumsum(nSupport)])
+
+		pairCoef, pairClasses = [], []
+
+		# Same pair order and coefficient layout as libsvm
+		for i in range(nClasses):
+			for j in range(i + 1, nClasses):
+				coef = np.zeros(len(supportVectors))
+				coef[start[i]:start[i + 1]] = dualCoef[j - 1, start[i]:start[i + 1]]
+				coef[start[j]:start[j + 1]] = dualCoef[i, start[j]:start[j + 1]]
+				pairCoef.append(coef)
+				pairClasses.append((i, j))
+
+		return cls(supportVectors, np.ascontiguousarray(np.array(pairCoef).T), np.asarray(attributes['_intercept_'], dtype=np.float64),
+				   np.array(pairClasses, dtype=np.intp), np.asarray(svc.classes_), svc.kernel,
+				   attributes['_gamma'], svc.coef0, svc.degree, featureNames=getattr(svc, 'feature_names_in_', None))
+
+	def fnToArrays(self):
+		"""
+		Purpose:	Split the compiled support vector machine into arrays and scalars for storage
+		Returns:	Dictionary of arrays, dictionary of scalars
+		"""
+
+		arrays = {'supportVectors': self.supportVectors, 'pairCoefT': self.pairCoefT, 'intercept': self.intercept,
+				  'pairClasses': self.pairClasses, 'classes': self.classes_, 'svNorms': self.svNorms}
+		if self.featureNames is not None:
+			arrays['featureNames'] = self.featureNames
+
+		return (arrays,
+				{'kernel': self.kernel, 'gamma': float(self.gamma), 'coef0': float(self.coef0), 'degree': int(self.degree)})
+
+	@classmethod
+	def fnFromArrays(cls, arrays, scalars):
+		"""
+		Purpose:	Rebuild the compiled support vector machine from stored arrays and scalars
+		Passed:		Dictionary of arrays, dictionary of scalars
+		Returns:	Compiled support vector machine
+		"""
+
+		return cls(arrays['supportVectors'], arrays['pairCoefT'], arrays['intercept'], arrays['pairClasses'],
+				   arrays['classes'], scalars['kernel'], scalars['gamma'], scalars['coef0'], scalars['degree'],
+				   arrays['svNorms'], arrays.get('featureNames'))
+
+	def fnAsType(self, dtype):
+		"""
+		Purpose:	Copy of the support vector machine with its arrays in another float type,
+					predictions then run in that type
+		Passed:		Float type (i.e. np.float32)
+		Returns:	Compiled support vector machine
+		"""
+
+		return ClCompiledSVC(self.supportVectors.astype(dtype), self.pairCoefT.astype(dtype), self.intercept.astype(dtype),
+							 self.pairClasses, self.classes_, self.kernel, self.gamma, self.coef0, self.degree,
+							 self.svNorms.astype(dtype), self.featureNames)
+
+	def fnKernel(self, X):
+		"""
+		Purpose:	Kernel between every sample and every support vector
+		Passed:		(n_samples, n_features) feature array
+		Returns:	(n_samples, n_sv) kernel matrix
+		"""
+
+		K = np.dot(X, self.supportVectors.T)
+
+		if self.kernel == 'rbf':
+			K *= -2
+			K += np.einsum('ij,ij->i', X, X)[:, None]
+			K += self.svNorms
+			K *= -self.gamma
+			np.exp(K, out=K)
+		elif self.kernel == 'poly':
+			K *= self.gamma
+			K += self.coef0
+			K **= self.degree
+		elif self.kernel == 'sigmoid':
+			K *= self.gamma
+			K += self.coef0
+			np.tanh(K, out=K)
+
+		return K
+
+	def decision_function(self, X):
+		"""
+		Purpose:	One-vs-one decision values
+		Passed:		(n_samples, n_features) feature array or a single feature row
+		Returns:	(n_samples, n_pairs) decision values
+		"""
+
+		X = np.asarray(X, dtype=self.supportVectors.dtype)
+		if X.ndim == 1:
+			X = X.reshape(1, -1)
+
+		return np.dot(self.fnKernel(X), self.pairCoefT) + self.intercept
+
+	def predict(self, X):
+		"""
+		Purpose:	Predict the class of each sample by one-vs-one voting
+		Passed:		(n_samples, n_features) feature array or a single feature row
+		Returns:	(n_samples, ) class labels
+		"""
+
+		decision = self.decision_function(X)
+
+		# Positive decision votes for the first class of the pair, ties go to the lower class
+		winners = np.where(decision > 0, self.pairClasses[:, 0], self.pairClasses[:, 1])
+		votes = np.zeros((decision.shape[0], len(self.classes_)), dtype=np.intp)
+		for pair in range(winners.shape[1]):
+			votes[np.arange(decision.shape[0]), winners[:, pair]] += 1
+
+		return self.classes_.take(np.argmax(votes, axis=1))
+
+
+class ClCompiledScaler:
+	"""
+	Class for standardizing feature rows in place from contiguous mean and scale arrays.
+	"""
+
+	def __init__(self, mean, scale, dtype = np.float64):
+		"""
+		Purpose:	Store the standardization parameters
+		Passed:		Mean of every feature
+					Scale (standard deviation) of every feature
+					Float type of the features standardized
+		"""
+
+		self.mean = np.ascontiguousarray(mean, dtype=dtype)
+		self.scale = np.ascontiguousarray(scale, dtype=dtype)
+
+	@classmethod
+	def fnFromEstimator(cls, scaler):
+		"""
+		Purpose:	Extract the parameters of a fitted sklearn StandardScaler
+		Passed:		Fitted scaler
+		Returns:	Compiled scaler
+		"""
+
+		nFeatures = len(scaler.mean_) if scaler.mean_ is not None else len(scaler.scale_)
+		mean = scaler.mean_ if scaler.with_mean else np.zeros(nFeatures)
+		scale = scaler.scale_ if scaler.with_std else np.ones(nFeatures)
+
+		return cls(mean, scale)
+
+	def fnToArrays(self):
+		"""
+		Purpose:	Split the compiled scaler into arrays and scalars for storage
+		Returns:	Dictionary of arrays, dictionary of scalars
+		"""
+
+		return {'mean': self.mean, 'scale': self.scale}, {}
+
+	@classmethod
+	def fnFromArrays(cls, arrays, scalars):
+		"""
+		Purpose:	Rebuild the compiled scaler from stored arrays
+		Passed:		Dictionary of arrays, dictionary of scalars
+		Returns:	Compiled scaler
+		"""
+
+		return cls(arrays['mean'], arrays['scale'])
+
+	def fnAsType(self, dtype):
+		"""
+		Purpose:	Copy of the scaler for features of another float type
+		Passed:		Float type (i.e. np.float32)
+		Returns:	Compiled scaler
+		"""
+
+		return ClCompiledScaler(self.mean, self.scale, dtype)
+
+	def fnNormalize(self, X):
+		"""
+		Purpose:	Standardize features in place, same operation order as StandardScaler
+		Passed:		Feature row or (n_samples, n_features) array, modified in place
+		Returns:	The same array
+		"""
+
+		np.subtract(X, self.mean, out=X)
+		np.divide(X, self.scale, out=X)
+
+		return X
+
+	def fnCheck(self, scaler):
+		"""
+		Purpose:	Confirm normalization matches the sklearn scaler it was extracted from
+		Passed:		Fitted sklearn scaler
+		"""
+
+		# Probe rows spread around the training distribution
+		probe = self.mean + self.scale * np.linspace(-3, 3, 7)[:, None]
+
+		expected = scaler.transform(probe)
+		actual = self.fnNormalize(probe.copy())
+
+		if not np.allclose(actual, expected, rtol=1e-12, atol=1e-12):
+			raise ValueError('Compiled scaler differs from sklearn by up to {}'.format(np.max(np.abs(actual - expected))))
+
+
+# Compiled artifact classes by name, for reading cached artifacts
+COMPILED_TYPES = {'ClCompiledForest': ClCompiledForest, 'ClCompiledSVC': ClCompiledSVC, 'ClCompiledScaler': ClCompiledScaler}
+
+
+# FUNCTIONS
+
+def fnFloorThreshold(threshold, dtype):
+	"""
+	Purpose:	Thresholds in another float type, rounded down so features of that type take the
+				same branch as against the original thresholds
+	Passed:		Threshold array
+				Float type (i.e. np.float32)
+	Returns:	Threshold array
+	"""
+
+	rounded = np.array(threshold, dtype=dtype)
+	above = rounded > threshold
+	rounded[above] = np.nextafter(rounded[above], -np.inf)
+
+	return rounded
+
+def fnCompileModel(estimator):
+	"""
+	Purpose:	Convert a fitted sklearn classifier into its compiled form
+	Passed:		Fitted sklearn estimator
+	Returns:	Compiled model
+	"""
+
+	if hasattr(estimator, 'estimators_') and hasattr(estimator.estimators_[0], 'tree_'):
+		return ClCompiledForest.fnFromEstimator(estimator)
+	if hasattr(estimator, 'support_vectors_'):
+		return ClCompiledSVC.fnFromEstimator(estimator)
+
+	raise TypeError('No compiled form for {}'.format(type(estimator).__name__))
+
+def fnSaveCompiled(compiled, directory, source = None):
+	"""
+	Purpose:	Write a compiled artifact as one .npy file per array plus a json header
+	Passed:		Compiled model or scaler
+				Directory to write, replaced if it exists
+				Optional description of the source file the artifact was built from
+	"""
+
+	arrays, scalars = compiled.fnToArrays()
+
+	# Write beside the destination and swap in so readers never see a partial artifact
+	tempDirectory = '{}.{}.tmp'.format(directory, os.getpid())
+	shutil.rmtree(tempDirectory, ignore_errors=True)
+	os.makedirs(tempDirectory)
+
+	for name, array in arrays.items():
+		array = np.asarray(array)
+		if array.dtype == object:
+			array = array.astype(str)
+		np.save(os.path.join(tempDirectory, name + '.npy'), array, allow_pickle=False)
+
+	with open(os.path.join(tempDirectory, 'meta.json'), 'w') as metaFile:
+		json.dump({'type': type(compiled).__name__, 'arrays': list(arrays), 'scalars': scalars, 'source': source}, metaFile)
+
+	# The old artifact is moved aside rather than deleted first, so a crash never leaves neither
+	oldDirectory = '{}.{}.old'.format(directory, os.getpid())
+	if os.path.isdir(directory):
+		shutil.rmtree(oldDirectory, ignore_errors=True)
+		os.rename(directory, oldDirectory)
+	os.rename(tempDirectory, directory)
+	shutil.rmtree(oldDirectory, ignore_errors=True)
+
+def fnReadCompiled(directory):
+	"""
+	Purpose:	Memory-map a compiled artifact written by fnSaveCompiled
+	Passed:		Artifact directory
+	Returns:	Compiled model or scaler, json header
+	"""
+
+	with open(os.path.join(directory, 'meta.json')) as metaFile:
+		meta = json.load(metaFile)
+
+	arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r', allow_pickle=False) for name in meta['arrays']}
+
+	return COMPILED_TYPES[meta['type']].fnFromArrays(arrays, meta['scalars']), meta
+
+def fnFileHash(path):
+	"""
+	Purpose:	SHA-1 of a file's contents
+	Passed:		Path to file
+	Returns:	Hex digest
+	"""
+
+	sha = hashlib.sha1()
+	with open(path, 'rb') as sourceFile:
+		for chunk in iter(lambda: sourceFile.read(1 << 20), b''):
+			sha.update(chunk)
+
+	return sha.hexdigest()
+
+def fnCompiledPath(path):
+	"""
+	Purpose:	Compiled artifact directory standing in for a joblib file, as written by the
+				training pipeline (same name without the extension)
+	Passed:		Path to source (joblib) file
+	Returns:	Artifact directory, None unless it exists and is newer than the joblib file
+	"""
+
+	compiledPath = os.path.splitext(path)[0]
+
+	if not os.path.isfile(os.path.join(compiledPath, 'meta.json')):
+		return None
+	if os.path.isfile(path) and os.stat(path).st_mtime_ns > os.stat(os.path.join(compiledPath, 'meta.json')).st_mtime_ns:
+		return None
+
+	return compiledPath
+
+def fnLoadCached(path, fnCompile):
+	"""
+	Purpose:	Load the compiled form of an artifact, reusing the in-process copy, a compiled
+				artifact written in its place, or the on-disk cache, and only compiling when
+				the source file has changed
+	Passed:		Path to source (joblib) file
+				Function compiling the source file, only called on a cache miss
+	Returns:	Compiled model or scaler
+	"""
+
+	path = os.path.realpath(path)
+
+	if path in MEMORY_CACHE:
+		return MEMORY_CACHE[path]
+
+	compiledPath = fnCompiledPath(path)
+	if compiledPath is not None:
+		MEMORY_CACHE[path] = fnReadCompiled(compiledPath)[0]
+		return MEMORY_CACHE[path]
+
+	stat = os.stat(path)
+	source = {'path': path, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+	# Keyed by the full path, so files of the same name in different directories keep their own entries
+	cacheDirectory = os.path.join(CACHE_DIR, '{}_{}'.format(os.path.basename(path), hashlib.sha1(path.encode()).hexdigest()[:12]))
+
+	compiled = None
+
+	try:
+		cached, meta = fnReadCompiled(cacheDirectory)
+		cachedSource = meta['source']
+
+		# Matching mtime and size is trusted, otherwise fall back to comparing contents
+		if all(cachedSource[key] == source[key] for key in ['path', 'mtime', 'size']):
+			compiled = cached
+		elif cachedSource['size'] == source['size'] and cachedSource['sha1'] == fnFileHash(path):
+			compiled = cached
+			source['sha1'] = cachedSource['sha1']
+			meta['source'] = source
+			with open(os.path.join(cacheDirectory, 'meta.json'), 'w') as metaFile:
+				json.dump(meta, metaFile)
+	except (OSError, ValueError, KeyError, TypeError):
+		pass
+
+	if compiled is None:
+		compiled = fnCompile(path)
+		source['sha1'] = fnFileHash(path)
+		try:
+			os.makedirs(CACHE_DIR, exist_ok=True)
+			fnSaveCompiled(compiled, cacheDirectory, source)
+			compiled, meta = fnReadCompiled(cacheDirectory)
+		except OSError as e:
+			print('Could not cache {}: {}'.format(path, e))
+
+	MEMORY_CACHE[path] = compiled
+
+	return compiled
+
+def fnLoadTyped(path, compiled, dtype):
+	"""
+	Purpose:	Copy of a loaded artifact in another float type, kept in memory per process
+	Passed:		Path to source (joblib) file
+				Compiled model or scaler as stored (float64)
+				Float type wanted
+	Returns:	Compiled model or scaler
+	"""
+
+	if np.dtype(dtype) == np.float64:
+		return compiled
+
+	key = (os.path.realpath(path), np.dtype(dtype).name)
+	if key not in MEMORY_CACHE:
+		MEMORY_CACHE[key] = compiled.fnAsType(np.dtype(dtype).type)
+
+	return MEMORY_CACHE[key]
+
+def fnLoadModel(path, dtype = np.float64):
+	"""
+	Purpose:	Load the compiled form of a joblib model
+	Passed:		Path to joblib file
+				Float type the model runs in
+	Returns:	Compiled model
+	"""
+
+	def fnCompile(sourcePath):
+		from joblib import load
+		return fnCompileModel(load(sourcePath))
+
+	return fnLoadTyped(path, fnLoadCached(path, fnCompile), dtype)
+
+def fnLoadScaler(path, dtype = np.float64):
+	"""
+	Purpose:	Load the compiled form of a joblib StandardScaler, checking it against
+				sklearn whenever it is (re)compiled
+	Passed:		Path to joblib file
+				Float type of the features standardized
+	Returns:	Compiled scaler
+	"""
+
+	def fnCompile(sourcePath):
+		from joblib import load
+		scaler = load(sourcePath)
+		compiled = ClCompiledScaler.fnFromEstimator(scaler)
+		compiled.fnCheck(scaler)
+		return compiled
+
+	return fnLoadTyped(path, fnLoadCached(path, fnCompile), dtype)
+
+def fnTimeCall(function, X, repeat = 200):
+	"""
+	Purpose:	Best-of time of a prediction call
+	Passed:		Prediction function
+				Feature array
+				Number of calls
+	Returns:	Minimum seconds per call
+	"""
+
+	times = []
+	for i in range(repeat):
+		timeStart = time.perf_counter()
+		function(X)
+		times.append(time.perf_counter() - timeStart)
+
+	return min(times)
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	# Parity and latency check of compiled models against sklearn
+	# Usage: python3 modelLib.py [model.joblib features.npy]
+	#   features.npy holds recorded, standardized feature windows (n_windows, n_features)
+	#   Without arguments a forest and an SVM are fitted on synthetic data
+
+	from joblib import load
+
+	if len(sys.argv) >= 3:
+		X = np.load(sys.argv[2])
+		estimators = [load(sys.argv[1])]
+	else:
+		from sklearn.ensemble import RandomForestClassifier
+		from sklearn.svm import SVC
+		np.random.seed(0)
+		X = np.random.normal(size=(3000, 30))
+		y = np.argmax(X[:, :7] + 0.5 * np.random.normal(size=(3000, 7)), axis=1)
+		estimators = [RandomForestClassifier(n_estimators=100).fit(X[:2000], y[:2000]),
+					  SVC(gamma='scale').fit(X[:2000], y[:2000])]
+		X = X[2000:]
+
+	for estimator in estimators:
+
+		compiled = fnCompileModel(estimator)
+
+		np.testing.assert_array_equal(compiled.predict(X), estimator.predict(X))
+		if hasattr(compiled, 'predict_proba'):
+			np.testing.assert_allclose(compiled.predict_proba(X), estimator.predict_proba(X), rtol=1e-9, atol=1e-12)
+		print('{}: compiled predictions match sklearn on {} windows'.format(type(compiled).__name__, len(X)))
+
+		compiled32 = compiled.fnAsType(np.float32)
+		print('    float32 copy agrees on {:.2%} of windows'.format(np.mean(compiled32.predict(X.astype(np.float32)) == compiled.predict(X))))
+
+		if hasattr(compiled, 'fnPrune'):
+			from copy import copy
+			half = copy(estimator)
+			half.estimators_ = estimator.estimators_[:len(estimator.estimators_) // 2]
+			np.testing.assert_allclose(compiled.fnPrune(len(half.estimators_)).predict_proba(X), half.predict_proba(X), rtol=1e-9, atol=1e-12)
+			print('    pruned copy of the first {} trees matches sklearn'.format(len(half.estimators_)))
+
+		single = X[:1]
+		print('    single window: sklearn {:8.2f} ms, compiled {:8.2f} ms'.format(
+			fnTimeCall(estimator.predict, single) * 1e3, fnTimeCall(compiled.predict, single) * 1e3))
+		print('    {} windows: sklearn {:8.2f} ms, compiled {:8.2f} ms'.format(
+			len(X), fnTimeCall(estimator.predict, X, 5) * 1e3, fnTimeCall(compiled.predict, X, 5) * 1e3))
@@ -0,0 +1,357 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python script shrinks a random forest to fit a per-window
+				latency target and exports the chosen forest for the
+				classifier.
+
+				Candidates are built from the forest of one placement and
+				feature family:
+
+				1. Trees - the first n trees of the forest
+				2. Depth - every tree cut at a maximum depth, cut nodes voting
+				   with the class fractions that reach them
+				3. Features - refitted on the most used features only, so the
+				   feature plan computes fewer features per window
+				4. Distilled - small forests fitted to the forest's own labels
+
+				Each candidate is replayed window by window through the
+				ClTerrainClassifier path, as modelBenchmark does, on two
+				slices of every recorded session: the end of its training
+				windows, held back from the refitted candidates for choosing
+				between them, and the held-out end that trainingPipeline tests
+				on. The validation accuracy against p99 latency Pareto front is
+				printed, and the most accurate candidate within the target is
+				written with --export as a compiled artifact beside the joblib
+				file, which fnLoadModel (and so terrainClassifier.py) then
+				loads in its place. Its test accuracy is reported apart from
+				the accuracy it was chosen on.
+
+				Reductions start from the joblib model, or from a forest
+				written by trainingPipeline, and refuse an artifact written
+				here so an already reduced forest is not reduced again. The
+				original forest saw the validation windows in training, so its
+				pruned forms score a little high on them. Test accuracy is only
+				unbiased if the forest was trained as trainingPipeline splits
+				the sessions.
+
+				python3 modelReduction.py "IMU Data/Middle_Grass_Frame6050.csv" ... --model "RF Time" --target-ms 2 --export
+"""
+
+# IMPORTED LIBRARIES
+
+import numpy as np
+import pandas as pd
+import os
+import sys
+import time
+
+from featureCacheLib import fnLoadFeatures
+from plannerLib import fnColumnNames, fnCanonicalName
+from modelLib import fnCompileModel, fnSaveCompiled, fnReadCompiled, fnCompiledPath
+from cascadeLib import fnLoadFamilyScaler, MODELS, MODEL_DIR
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, TERRAINS, fnSessionFreqs
+from sessionLib import fnParseSessionName, fnLoadSession, fnSessionWindows
+from trainingPipeline import fnSplitWindows, fnArtifactDir, TEST_FRACTION, RANDOM_STATE, RF_PARAMS
+from modelBenchmark import fnReplayModel
+from precisionReport import fnArrayBytes
+
+# DEFINITIONS
+
+# Candidate grids: trees kept, depth cut, features kept and distilled (trees, depth) forests
+TREE_COUNTS = [5, 10, 25, 50]
+DEPTHS = [4, 6, 8, 10, 12]
+FEATURE_COUNTS = [5, 10, 20]
+STUDENTS = [(10, 6), (10, 8), (25, 8)]
+
+# Share of each session's training windows held back for choosing between candidates
+VALIDATION_FRACTION = 0.2
+
+# Replays of the held-out windows per candidate, each window timed at its fastest to keep scheduler noise out
+REPLAY_REPEATS = 3
+
+# FUNCTIONS
+
+def fnSelectionSplit(nWindows, gapWindows, testFraction = TEST_FRACTION, validationFraction = VALIDATION_FRACTION):
+	"""
+	Purpose:	Split a session's windows as trainingPipeline does, then split its training windows
+				again into a fitting start and a validation end
+	Passed:		Number of windows in the session
+				Windows overlapping a given window on either side
+				Share of windows held out for testing
+				Share of the training windows held back for validation
+	Returns:	Fitting window indices, validation window indices, test window indices
+	"""
+
+	trainWindows, testWindows = fnSplitWindows(nWindows, gapWindows, testFraction)
+	fitWindows, validationWindows = fnSplitWindows(len(trainWindows), gapWindows, validationFraction)
+
+	return trainWindows[fitWindows], trainWindows[validationWindows], testWindows
+
+def fnTrainingSet(sessions, placement, family, featureNames, hopSamples, testFraction = TEST_FRACTION,
+				  validationFraction = VALIDATION_FRACTION):
+	"""
+	Purpose:	Standardized features and terrain labels of the fitting windows of every session
+				of a placement, without the validation and held-out windows
+	Passed:		List of (session csv path, placement)
+				Sensor placement
+				Feature family (Time, Freq, PSDLog)
+				Names of the columns wanted, in order
+				Samples between windows
+				Share of each session held out
+				Share of the training windows held back for validation
+	Returns:	(n_windows, n_features) features, (n_windows, ) terrain indices
+	"""
+
+	sensorParam = SENSOR_PARAMS[placement]
+	gapWindows = -(-(sensorParam['wLength'] + 2 * PAD_LENGTH) // hopSamples) - 1
+	scaler = fnLoadFamilyScaler(placement, family)
+
+	lookup = {featName: i for i, featName in enumerate(fnColumnNames(placement, fnSessionFreqs(sensorParam))[family])}
+	columns = np.array([lookup[fnCanonicalName(featName)] for featName in featureNames], dtype=np.intp)
+
+	X, y = [], []
+	for path, sessionPlacement in sessions:
+		if sessionPlacement != placement:
+			continue
+
+		features, meta = fnLoadFeatures(path, hopSamples, placement, [family])
+		if meta['terrain'] not in TERRAINS:
+			print('Skipping {}: terrain {!r} is not one of {}'.format(path, meta['terrain'], TERRAINS))
+			continue
+
+		fitWindows, validationWindows, testWindows = fnSelectionSplit(meta['windows'], gapWindows, testFraction, validationFraction)
+		X.append(scaler.fnNormalize(np.array(features[family][fitWindows], dtype=np.float64))[:, columns])
+		y.append(np.full(len(fitWindows), TERRAINS.index(meta['terrain'])))
+
+	if not X:
+		return np.zeros((0, len(columns))), np.zeros(0, dtype=np.intp)
+
+	return np.concatenate(X), np.concatenate(y)
+
+def fnReplayWindows(sessions, placement, hopSamples, testFraction = TEST_FRACTION, validationFraction = VALIDATION_FRACTION):
+	"""
+	Purpose:	Padded windows of the validation and held-out slices of every session of a placement
+	Passed:		List of (session csv path, placement)
+				Sensor placement
+				Samples between classifications
+				Share of each session held out
+				Share of the training windows held back for validation
+	Returns:	Validation and held-out lists of ((n_windows, wLength + 2 * PAD_LENGTH, 6) windows, terrain)
+				per session, as fnReplayModel takes them
+	"""
+
+	sensorParam = SENSOR_PARAMS[placement]
+	gapWindows = -(-(sensorParam['wLength'] + 2 * PAD_LENGTH) // hopSamples) - 1
+
+	validation, heldOut = [], []
+	for sessionPath, sessionPlacement in sessions:
+		if sessionPlacement != placement:
+			continue
+
+		samples, sessionPlacement, terrain = fnLoadSession(sessionPath, sessionPlacement)
+		windows = fnSessionWindows(samples, sensorParam, hopSamples)
+		fitWindows, validationWindows, testWindows = fnSelectionSplit(len(windows), gapWindows, testFraction, validationFraction)
+		validation.append((windows[validationWindows], terrain))
+		heldOut.append((windows[testWindows], terrain))
+
+	return validation, heldOut
+
+def fnAccuracy(replay):
+	"""
+	Purpose:	Share of the windows of a known terrain a replay labelled correctly
+	Passed:		Replay dictionary from fnReplayModel
+	Returns:	Accuracy, nan without such windows
+	"""
+
+	return float(np.mean(replay['correct'])) if len(replay['correct']) else np.nan
+
+def fnSplitCounts(forest, nFeatures):
+	"""
+	Purpose:	Number of splits on each feature over every tree of a compiled forest
+	Passed:		Compiled forest
+				Number of features
+	Returns:	(n_features, ) split counts
+	"""
+
+	internal = forest.left != np.arange(len(forest.left))
+
+	return np.bincount(forest.feature[internal], minlength=nFeatures)
+
+def fnCandidates(teacher, featureNames, XTrain, yTrain, treeCounts = TREE_COUNTS, depths = DEPTHS,
+				 featureCounts = FEATURE_COUNTS, students = STUDENTS):
+	"""
+	Purpose:	Build the reduced forests of a compiled forest
+	Passed:		Compiled forest
+				Names of its feature columns
+				Standardized training features and terrain labels
+				Tree counts, maximum depths, feature counts and (trees, depth) distilled forests tried
+	Returns:	List of (description dictionary, compiled forest)
+	"""
+
+	nTrees = len(teacher.roots)
+	candidates = [({'kind': 'Original', 'trees': nTrees, 'depth': teacher.depth}, teacher)]
+
+	# Pruning needs no training data, and keeps the trees' own splits
+	for count in treeCounts:
+		if count < nTrees:
+			candidates.append(({'kind': 'Trees', 'trees': count, 'depth': teacher.depth}, teacher.fnPrune(count)))
+	for depth in depths:
+		if depth < teacher.depth:
+			candidates.append(({'kind': 'Depth', 'trees': nTrees, 'depth': depth}, teacher.fnPrune(maxDepth=depth)))
+			for count in treeCounts:
+				if count < nTrees:
+					candidates.append(({'kind': 'Trees + Depth', 'trees': count, 'depth': depth}, teacher.fnPrune(count, depth)))
+
+	if len(yTrain) == 0:
+		print('No training windows, only pruned candidates are built')
+		return candidates
+
+	from sklearn.ensemble import RandomForestClassifier
+
+	# Features the forest splits on most, kept in column order
+	ranking = np.argsort(-fnSplitCounts(teacher, len(featureNames)), kind='stable')
+	for count in featureCounts:
+		if count < len(featureNames):
+			kept = np.sort(ranking[:count])
+			forest = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=1, **dict(RF_PARAMS, n_estimators=nTrees)).fit(XTrain[:, kept], yTrain)
+			compiled = fnCompileModel(forest)
+			compiled.featureNames = np.array([str(featureNames[i]) for i in kept])
+			candidates.append(({'kind': 'Features', 'trees': nTrees, 'depth': compiled.depth}, compiled))
+
+	# Students learn the forest's decisions rather than the terrain labels
+	teacherLabels = teacher.predict(XTrain)
+	for count, depth in students:
+		forest = RandomForestClassifier(n_estimators=count, max_depth=depth, random_state=RANDOM_STATE, n_jobs=1).fit(XTrain, teacherLabels)
+		compiled = fnCompileModel(forest)
+		compiled.featureNames = teacher.featureNames
+		candidates.append(({'kind': 'Distilled', 'trees': count, 'depth': compiled.depth}, compiled))
+
+	return candidates
+
+def fnParetoFront(latency, accuracy):
+	"""
+	Purpose:	Candidates no other candidate beats on both latency and accuracy
+	Passed:		Latency of every candidate
+				Accuracy of every candidate
+	Returns:	Boolean mask of the front
+	"""
+
+	front = np.zeros(len(latency), dtype=bool)
+	best = -np.inf
+
+	# Fastest first, each candidate on the front is more accurate than every faster one
+	for i in np.lexsort((-np.asarray(accuracy), np.asarray(latency))):
+		if accuracy[i] > best:
+			front[i] = True
+			best = accuracy[i]
+
+	return front
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	forests = [name for name, (fileName, family) in MODELS.items() if fileName.startswith('RandomForest')]
+
+	parser = argparse.ArgumentParser(description='Shrink a random forest to a per-window latency target and export it for the classifier.')
+	parser.add_argument('sessions', nargs='+', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--model', default=forests[0], choices=forests, help='forest reduced')
+	parser.add_argument('--placement', default='Middle', choices=list(SENSOR_PARAMS), help='placement of the forest')
+	parser.add_argument('--target-ms', type=float, required=True, help='p99 milliseconds a window may take')
+	parser.add_argument('--trees', type=int, nargs='*', default=TREE_COUNTS, help='tree counts tried')
+	parser.add_argument('--depths', type=int, nargs='*', default=DEPTHS, help='maximum depths tried')
+	parser.add_argument('--features', type=int, nargs='*', default=FEATURE_COUNTS, help='feature counts tried')
+	parser.add_argument('--students', nargs='*', default=['{}:{}'.format(*student) for student in STUDENTS], help='distilled forests tried, as trees:depth')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between classifications')
+	parser.add_argument('--test-fraction', type=float, default=TEST_FRACTION, help='share of each session held out, as in trainingPipeline')
+	parser.add_argument('--validation-fraction', type=float, default=VALIDATION_FRACTION, help='share of each session\'s training windows held back for choosing the candidate')
+	parser.add_argument('--repeats', type=int, default=REPLAY_REPEATS, help='replays per candidate, each window timed at its fastest')
+	parser.add_argument('--output', default=None, help='csv of every candidate')
+	parser.add_argument('--export', action='store_true', help='write the chosen forest where the classifier loads it')
+	args = parser.parse_args()
+
+	sessions = []
+	for session in args.sessions:
+		placement, path = session.split('=', 1) if '=' in session else (None, session)
+		name = fnParseSessionName(path)
+		sessions.append((path, placement or (name['Placement'] if name else 'Middle')))
+
+	fileName, family = MODELS[args.model]
+	path = os.path.join(MODEL_DIR, fileName.format(args.placement))
+
+	if os.path.isfile(path):
+		from joblib import load
+		teacher = fnCompileModel(load(path))
+	else:
+		compiledPath = fnCompiledPath(path)
+		if compiledPath is None:
+			sys.exit('No {} forest for {} in {}'.format(args.model, args.placement, MODEL_DIR))
+		teacher, meta = fnReadCompiled(compiledPath)
+		if 'reducedFrom' in (meta['source'] or {}):
+			sys.exit('{} was written by modelReduction and {} is missing, reduce from the original forest'.format(
+				compiledPath, os.path.basename(path)))
+
+	featureNames = teacher.featureNames if teacher.featureNames is not None else \
+		fnColumnNames(args.placement, fnSessionFreqs(SENSOR_PARAMS[args.placement]))[family]
+
+	timeStart = time.perf_counter()
+	XTrain, yTrain = fnTrainingSet(sessions, args.placement, family, featureNames, args.hop, args.test_fraction, args.validation_fraction)
+	candidates = fnCandidates(teacher, featureNames, XTrain, yTrain, args.trees, args.depths, args.features,
+							  [tuple(int(value) for value in student.split(':')) for student in args.students])
+	print('{} candidates from {} training windows in {:.1f} s'.format(len(candidates), len(yTrain), time.perf_counter() - timeStart))
+
+	validation, heldOut = fnReplayWindows(sessions, args.placement, args.hop, args.test_fraction, args.validation_fraction)
+	nValidation = sum(len(windows) for windows, terrain in validation)
+	nTest = sum(len(windows) for windows, terrain in heldOut)
+	if not nValidation:
+		sys.exit('No validation windows for {}'.format(args.placement))
+	if not nTest:
+		sys.exit('No held-out windows for {}'.format(args.placement))
+
+	# Latency is timed on the held-out windows, the candidate is chosen on validation accuracy only
+	rows = []
+	for description, compiled in candidates:
+		replays = [fnReplayModel(args.model, compiled, args.placement, heldOut) for repeat in range(max(args.repeats, 1))]
+		seconds = np.min([replay['seconds'] for replay in replays], axis=0)
+		modelSeconds = np.min([replay['modelSeconds'] for replay in replays], axis=0)
+		p50, p99 = np.percentile(seconds, [50, 99]) * 1e3
+		rows.append(dict(description, features=replays[0]['features'], nodes=len(compiled.feature), arrayBytes=fnArrayBytes(compiled),
+						 selectionAccuracy=fnAccuracy(fnReplayModel(args.model, compiled, args.placement, validation)),
+						 testAccuracy=fnAccuracy(replays[0]), p50Ms=p50, p99Ms=p99, modelP99Ms=np.percentile(modelSeconds, 99) * 1e3))
+
+	table = pd.DataFrame(rows)
+	table['pareto'] = fnParetoFront(table['p99Ms'].values, table['selectionAccuracy'].fillna(0).values)
+	table['withinTarget'] = table['p99Ms'] <= args.target_ms
+
+	print('{} {} on {} validation and {} held-out windows, target p99 {:g} ms'.format(args.placement, args.model, nValidation, nTest, args.target_ms))
+	for i, row in table.sort_values('p99Ms').iterrows():
+		print('{} {:>13s} {:3d} trees, depth {:2d}, {:3d} features, {:6d} nodes: validation {:6.1%}, test {:6.1%}, window p50 {:6.2f} ms p99 {:6.2f} ms (model {:5.2f} ms){}'.format(
+			'*' if row['pareto'] else ' ', row['kind'], row['trees'], row['depth'], row['features'], row['nodes'],
+			row['selectionAccuracy'], row['testAccuracy'], row['p50Ms'], row['p99Ms'], row['modelP99Ms'], '' if row['withinTarget'] else ', over target'))
+	print('* on the validation accuracy against latency Pareto front')
+
+	if args.output:
+		table.to_csv(args.output, index=False)
+
+	within = table[table['withinTarget']]
+	if within.empty:
+		sys.exit('No candidate meets the {:g} ms target, fastest is {:.2f} ms'.format(args.target_ms, table['p99Ms'].min()))
+
+	# Most accurate on the validation windows within the target, the faster one on ties
+	chosen = within.sort_values(['selectionAccuracy', 'p99Ms'], ascending=[False, True]).index[0]
+	row = table.loc[chosen]
+	print('Chosen: {} with {} trees, depth {}, {} features: validation accuracy {:.1%} (chosen on), test accuracy {:.1%}, p99 {:.2f} ms'.format(
+		row['kind'], row['trees'], row['depth'], row['features'], row['selectionAccuracy'], row['testAccuracy'], row['p99Ms']))
+
+	if args.export:
+		directory = fnArtifactDir(MODEL_DIR, fileName, args.placement)
+		fnSaveCompiled(candidates[chosen][1], directory,
+					   {'reducedFrom': path, 'kind': row['kind'], 'trees': int(row['trees']), 'depth': int(row['depth']),
+						'features': int(row['features']), 'targetMs': args.target_ms, 'p99Ms': float(row['p99Ms']),
+						'selectionAccuracy': float(row['selectionAccuracy']), 'validationWindows': nValidation,
+						'testAccuracy': float(row['testAccuracy']), 'testWindows': nTest})
+		print('Written to {}, loaded in place of {}'.format(directory, os.path.basename(path)))
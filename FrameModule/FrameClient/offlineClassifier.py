@@ -0,0 +1,296 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python script re-scores recorded sessions with the current
+				terrain classifiers, much faster than real time.
+
+				Every padded window of a session is a view from
+				sliding_window_view, and blocks of windows go through the
+				ClTerrainClassifier path (Butterworth filter, features,
+				scalers, models) as whole arrays on a pool of processes.
+				The label and probability of every model are written per
+				window, one csv per session.
+
+				python3 offlineClassifier.py "IMU Data/Middle_Grass_Frame6050.csv" Left="IMU Data/Synthesis.csv" ...
+"""
+
+# IMPORTED LIBRARIES
+
+import numpy as np
+import pandas as pd
+import os
+import time
+
+from multiprocessing import Pool
+
+from featuresLib import window_features_batch
+from plannerLib import fnColumnNames, fnCanonicalName
+from cascadeLib import ClModelCascade, fnLoadClassifiers, fnAvailableStages, ALL_STAGES, MODELS
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, TERRAINS, fnSessionFreqs
+from sessionLib import fnParseSessionName, fnLoadSession, fnSessionWindows, fnFilterWindows
+from featureCacheLib import fnLoadFeatures
+
+# DEFINITIONS
+
+# Windows classified per pool task
+BLOCK_WINDOWS = 1024
+
+# Directory the score files are written to
+OUTPUT_DIR = 'Scores'
+
+# Classifiers of every placement in a worker process, filled by fnInitWorker
+WORKER_CLASSIFIERS = {}
+
+# CLASSES
+
+class ClBatchClassifier:
+	"""
+	Class for running the classifiers of one placement on blocks of filtered windows.
+	"""
+
+	def __init__(self, placement, modelNames):
+		"""
+		Purpose:	Load the compiled models and scalers and find each model's feature columns
+		Passed:		Sensor placement (Middle, Left, Right)
+					List of model names from MODELS
+		"""
+
+		self.placement = placement
+		self.sensorParam = SENSOR_PARAMS[placement]
+		self.freqs = fnSessionFreqs(self.sensorParam)
+		self.modelNames = list(modelNames)
+
+		self.models, self.scalers = fnLoadClassifiers(placement, [self.modelNames])
+
+		# Feature names of every model, resolved as the real-time cascade does
+		featureNames = ClModelCascade([self.modelNames], self.models, self.scalers, placement, self.freqs, self.sensorParam['fSamp']).featureNames
+
+		# Only the families some model reads are computed, then concatenated in this order
+		columnNames = fnColumnNames(placement, self.freqs)
+		familyOf = {featName: family for family, names in columnNames.items() for featName in names}
+		required = {name: [fnCanonicalName(featName) for featName in featureNames[name]] for name in self.modelNames}
+		self.families = [family for family in ['Time', 'Freq', 'PSDLog']
+						 if any(familyOf[featName] == family for name in self.modelNames for featName in required[name])]
+
+		# Columns of every model in the concatenated families
+		lookup = {featName: i for i, featName in enumerate(featName for family in self.families for featName in columnNames[family])}
+		self.columns = {name: np.array([lookup[featName] for featName in required[name]], dtype=np.intp) for name in self.modelNames}
+
+	def fnClassify(self, windows):
+		"""
+		Purpose:	Filter, featurize, scale and classify a block of padded windows
+		Passed:		(n_windows, wLength + 2 * PAD_LENGTH, 6) raw windows
+		Returns:	Dictionary of model name to (class labels, probability of the label, nan without probabilities)
+		"""
+
+		filtered = fnFilterWindows(windows, self.sensorParam)
+
+		return self.fnPredict(window_features_batch(filtered, self.sensorParam['fSamp'], len(self.freqs), families=self.families))
+
+	def fnPredict(self, features):
+		"""
+		Purpose:	Scale the raw feature families of a block of windows and run every model
+		Passed:		Dictionary of family to (n_windows, columns) raw features, as from window_features_batch
+		Returns:	Dictionary of model name to (class labels, probability of the label, nan without probabilities)
+		"""
+
+		# Each family normalized by its full scaler, as the real-time plans do
+		features = np.concatenate([self.scalers[family].fnNormalize(np.array(features[family], dtype=np.float64)) for family in self.families], axis=1)
+
+		results = {}
+		for name in self.modelNames:
+			model = self.models[name]
+			X = features[:, self.columns[name]]
+
+			if hasattr(model, 'predict_proba'):
+				probabilities = model.predict_proba(X)
+				best = np.argmax(probabilities, axis=1)
+				results[name] = (model.classes_[best], probabilities[np.arange(len(best)), best])
+			else:
+				results[name] = (model.predict(X), np.full(len(X), np.nan))
+
+		return results
+
+
+# FUNCTIONS
+
+def fnInitWorker(placements, modelNames):
+	"""
+	Purpose:	Load the classifiers of every placement in a worker process
+	Passed:		List of placements
+				Dictionary of placement to list of model names from MODELS
+	"""
+
+	for placement in placements:
+		WORKER_CLASSIFIERS[placement] = ClBatchClassifier(placement, modelNames[placement])
+
+def fnClassifyBlock(task):
+	"""
+	Purpose:	Classify every window of a block of session samples in a worker process
+	Passed:		Session index, placement, samples covering the block's windows, hop, index of the first window
+	Returns:	Session index, index of the first window, dictionary of model name to (labels, probabilities)
+	"""
+
+	session, placement, samples, hopSamples, first = task
+	windows = fnSessionWindows(samples, SENSOR_PARAMS[placement], hopSamples)
+
+	return session, first, WORKER_CLASSIFIERS[placement].fnClassify(windows)
+
+def fnClassifyCached(task):
+	"""
+	Purpose:	Classify every window of a session from its cached features in a worker process,
+				featurizing it first on a cache miss
+	Passed:		Session index, session csv path, placement, hop
+	Returns:	Session index, index of the first window (0), dictionary of model name to (labels, probabilities)
+	"""
+
+	session, path, placement, hopSamples = task
+	classifier = WORKER_CLASSIFIERS[placement]
+	features, meta = fnLoadFeatures(path, hopSamples, placement, classifier.families)
+
+	return session, 0, classifier.fnPredict(features)
+
+def fnSessionTasks(session, samples, placement, hopSamples, blockWindows = BLOCK_WINDOWS):
+	"""
+	Purpose:	Split a session into blocks of windows, each carrying only the samples it reads
+	Passed:		Session index
+				(n_samples, 6) session array
+				Sensor placement
+				Samples between classifications
+				Windows per block
+	Returns:	List of tasks for fnClassifyBlock, number of windows in the session
+	"""
+
+	length = SENSOR_PARAMS[placement]['wLength'] + 2 * PAD_LENGTH
+	nWindows = len(fnSessionWindows(samples, SENSOR_PARAMS[placement], hopSamples))
+
+	tasks = []
+	for first in range(0, nWindows, blockWindows):
+		last = min(first + blockWindows, nWindows) - 1
+		tasks.append((session, placement, samples[first * hopSamples:last * hopSamples + length], hopSamples, first))
+
+	return tasks, nWindows
+
+def fnWriteScores(path, results, nWindows, placement, terrain, hopSamples, modelNames):
+	"""
+	Purpose:	Write the label and probability of every model for every window of a session
+	Passed:		Output csv path
+				List of (first window, results) blocks from fnClassifyBlock
+				Number of windows in the session
+				Sensor placement
+				Terrain from the session name (None if unknown)
+				Samples between classifications
+				List of model names from MODELS
+	"""
+
+	sensorParam = SENSOR_PARAMS[placement]
+	length = sensorParam['wLength'] + 2 * PAD_LENGTH
+
+	# Window ends at the sample that would have triggered it in real time
+	scores = pd.DataFrame({'Window': np.arange(nWindows),
+						   'Start Sample': np.arange(nWindows) * hopSamples,
+						   'Time (s)': (np.arange(nWindows) * hopSamples + length) / sensorParam['fSamp'],
+						   'Placement': placement,
+						   'Terrain': terrain if terrain is not None else ''})
+
+	for name in modelNames:
+		labels = np.zeros(nWindows, dtype=np.int64)
+		probabilities = np.zeros(nWindows)
+		for first, blockResults in results:
+			blockLabels, blockProbabilities = blockResults[name]
+			labels[first:first + len(blockLabels)] = blockLabels
+			probabilities[first:first + len(blockLabels)] = blockProbabilities
+		scores[name] = [TERRAINS[label] for label in labels]
+		scores[name + ' Probability'] = probabilities
+
+	scores.to_csv(path, index=False, float_format='%.4f')
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Classify every window of recorded sessions with the current models.')
+	parser.add_argument('sessions', nargs='+', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--output', default=OUTPUT_DIR, help='directory the score csv files are written to')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between windows (1 for every window)')
+	parser.add_argument('--workers', type=int, default=None, help='worker processes (default one per core)')
+	parser.add_argument('--models', nargs='+', default=None, choices=list(MODELS), help='models run on every window (default every model trained for the placement)')
+	parser.add_argument('--check', type=int, default=0, help='windows per session compared against the real-time cascade')
+	parser.add_argument('--cache', action='store_true', help='read raw features from the feature cache, filling it on a miss')
+	args = parser.parse_args()
+
+	timeStart = time.perf_counter()
+
+	sessions = []
+	for session in args.sessions:
+		placement, path = session.split('=', 1) if '=' in session else (None, session)
+
+		# Cached sessions are only read by a worker on a cache miss
+		if args.cache:
+			name = fnParseSessionName(path)
+			placement = placement or (name['Placement'] if name else 'Middle')
+			sessions.append((path, None, placement, name['Terrain'] if name else None))
+		else:
+			samples, placement, terrain = fnLoadSession(path, placement)
+			sessions.append((path, samples, placement, terrain))
+
+	placements = sorted({placement for path, samples, placement, terrain in sessions})
+
+	# Models asked for must exist, otherwise every model trained for the placement
+	modelNames = {placement: args.models or fnAvailableStages(placement, ALL_STAGES)[0] for placement in placements}
+
+	# Compile or map the models once so every worker reads the same cache
+	for placement in placements:
+		fnLoadClassifiers(placement, [modelNames[placement]])
+
+	tasks = []
+	for i, (path, samples, placement, terrain) in enumerate(sessions):
+		if args.cache:
+			tasks.append((i, path, placement, args.hop))
+		else:
+			tasks += fnSessionTasks(i, samples, placement, args.hop)[0]
+
+	timeLoaded = time.perf_counter()
+
+	results = [[] for session in sessions]
+	with Pool(args.workers, fnInitWorker, (placements, modelNames)) as pool:
+		for session, first, blockResults in pool.imap_unordered(fnClassifyCached if args.cache else fnClassifyBlock, tasks):
+			results[session].append((first, blockResults))
+
+	timeClassified = time.perf_counter()
+
+	nWindows = [sum(len(blockResults[modelNames[placement][0]][0]) for first, blockResults in sessionResults)
+				for sessionResults, (path, samples, placement, terrain) in zip(results, sessions)]
+
+	if not os.path.exists(args.output):
+		os.mkdir(args.output)
+
+	for i, (path, samples, placement, terrain) in enumerate(sessions):
+		name = '{}_{}_Scores.csv'.format(os.path.splitext(os.path.basename(path))[0], placement)
+		fnWriteScores(os.path.join(args.output, name), results[i], nWindows[i], placement, terrain, args.hop, modelNames[placement])
+
+	timeEnd = time.perf_counter()
+
+	# Labels of the first windows against ClModelCascade on the same filtered windows
+	if args.check:
+		for i, (path, samples, placement, terrain) in enumerate(sessions):
+			if samples is None:
+				samples, placement, terrain = fnLoadSession(path, placement)
+			classifier = ClBatchClassifier(placement, modelNames[placement])
+			cascade = ClModelCascade([classifier.modelNames], classifier.models, classifier.scalers, placement, classifier.freqs, classifier.sensorParam['fSamp'])
+			filtered = fnFilterWindows(fnSessionWindows(samples, classifier.sensorParam, args.hop)[:args.check], classifier.sensorParam)
+			first, blockResults = min(results[i], key=lambda block: block[0])
+			mismatches = sum(cascade.fnClassify(window)[0][name] != blockResults[name][0][j]
+							 for j, window in enumerate(filtered) for name in classifier.modelNames)
+			print('{}: {} of {} labels differ from the real-time cascade'.format(os.path.basename(path), mismatches, len(filtered) * len(classifier.modelNames)))
+
+	# Real time covered by the windows against the wall time of the whole run
+	recorded = sum((max(windows - 1, 0) * args.hop + SENSOR_PARAMS[placement]['wLength'] + 2 * PAD_LENGTH) / SENSOR_PARAMS[placement]['fSamp']
+				   for windows, (path, samples, placement, terrain) in zip(nWindows, sessions) if windows)
+	print('{} sessions, {} windows, {:.0f} s recorded'.format(len(sessions), sum(nWindows), recorded))
+	print('Load {:.2f} s, classify {:.2f} s, write {:.2f} s, {:.0f}x real time ({:.0f} windows/s)'.format(
+		timeLoaded - timeStart, timeClassified - timeLoaded, timeEnd - timeClassified,
+		recorded / (timeEnd - timeStart), sum(nWindows) / (timeClassified - timeLoaded)))
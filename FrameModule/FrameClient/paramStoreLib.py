@@ -0,0 +1,368 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library consolidates the normalization parameter
+				and mRMR selection dictionaries into one versioned parameter
+				store.
+
+				Every table (TimeFeats, FreqFeats, PSDLogs, FFTs and their
+				_Power variants) of every placement is a contiguous slice of
+				one mean and one scale array, beside the feature names and a
+				prebuilt sorted name index, all stored as memory-mappable
+				.npy files. The mRMR selections are kept in the json header.
+				The store is rebuilt from the dictionaries when they change,
+				so the classifier and the offline tools read one artifact
+				instead of unpickling several dict-of-floats files.
+
+				Run directly to rebuild the store and check it against the
+				dictionaries:
+				python3 paramStoreLib.py
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os
+import json
+import shutil
+import pickle as pkl
+
+from modelLib import ClCompiledScaler, fnFileHash
+from plannerLib import fnCanonicalName
+
+# DEFINITIONS
+
+dir_path = os.path.dirname(os.path.realpath(__file__))  # Current file directory
+
+DICT_DIR = os.path.join(dir_path, 'dicts')
+
+# Directory holding the built store, rebuilt from DICT_DIR
+PARAM_STORE_DIR = os.path.join(DICT_DIR, 'paramStore')
+
+# Bump whenever the layout of the store changes
+PARAM_STORE_VERSION = 1
+
+# Normalization tables, each read from '{table}_Norm_Param_Dictionary{variant}.pkl'
+NORM_TABLES = ['TimeFeats', 'FreqFeats', 'PSDLogs', 'FFTs']
+NORM_VARIANTS = ['', '_Power']
+
+# Feature selection dictionaries, kept whole in the header
+SELECTION_DICTS = ['mRMR_Dictionary_OldNormalization', 'mRMR_Top10_Dictionary']
+
+# Table standardizing each feature family of the classifier
+FAMILY_TABLES = {'Time': 'TimeFeats', 'Freq': 'FreqFeats', 'PSDLog': 'PSDLogs'}
+
+# Stores already loaded in this process, keyed by directory
+STORE_CACHE = {}
+
+# CLASSES
+
+class ClParamStore:
+	"""
+	Class for looking up normalization parameters by table, placement and feature name.
+	"""
+
+	def __init__(self, names, mean, scale, sortedNames, sortedIndex, meta):
+		"""
+		Purpose:	Store the parameter arrays and the header
+		Passed:		Feature name of every entry
+					Mean of every entry
+					Scale of every entry
+					Feature names sorted within each slice
+					Slice-relative index of each sorted name
+					Header with the slice of every table and placement and the selections
+		"""
+
+		self.names = names
+		self.mean = mean
+		self.scale = scale
+		self.sortedNames = sortedNames
+		self.sortedIndex = sortedIndex
+		self.meta = meta
+
+	def fnSlice(self, table, placement):
+		"""
+		Purpose:	Position of a table's placement in the parameter arrays
+		Passed:		Table name (e.g. 'TimeFeats' or 'PSDLogs_Power')
+					Placement (Middle, Left, Right, Synthesis)
+		Returns:	Start, stop
+		"""
+
+		try:
+			start, stop = self.meta['tables'][table][placement]
+		except KeyError:
+			raise KeyError('No {} parameters for {}'.format(table, placement))
+
+		return start, stop
+
+	def fnNames(self, table, placement):
+		"""
+		Purpose:	Feature names of a table's placement, in column order
+		Passed:		Table name, placement
+		Returns:	Array of names
+		"""
+
+		start, stop = self.fnSlice(table, placement)
+
+		return self.names[start:stop]
+
+	def fnIndex(self, table, placement, names):
+		"""
+		Purpose:	Column of every named feature within a table's placement
+		Passed:		Table name, placement
+					Feature names, in the scaler or the mRMR spelling
+		Returns:	Array of column indices
+		"""
+
+		start, stop = self.fnSlice(table, placement)
+		sortedNames = self.sortedNames[start:stop]
+
+		names = np.array([fnCanonicalName(str(name)) for name in names])
+		positions = np.minimum(np.searchsorted(sortedNames, names), max(stop - start - 1, 0))
+
+		missing = sortedNames[positions] != names if stop > start else np.ones(len(names), dtype=bool)
+		if np.any(missing):
+			raise KeyError('No {} parameters for {} in {}'.format(table, list(names[missing]), placement))
+
+		return self.sortedIndex[start:stop][positions]
+
+	def fnScaler(self, table, placement, names = None):
+		"""
+		Purpose:	Scaler of a table's placement, mapped from the store for the whole table
+		Passed:		Table name, placement
+					Optional feature names to standardize, in that column order
+		Returns:	Compiled scaler
+		"""
+
+		start, stop = self.fnSlice(table, placement)
+
+		if names is None:
+			return ClCompiledScaler(self.mean[start:stop], self.scale[start:stop])
+
+		columns = start + self.fnIndex(table, placement, names)
+
+		return ClCompiledScaler(self.mean[columns], self.scale[columns])
+
+	def fnSelection(self, placement, group, dictionary = 'mRMR_Dictionary_OldNormalization', method = 'Manual', subset = 'All'):
+		"""
+		Purpose:	Features chosen by a selection dictionary
+		Passed:		Placement
+					Feature group ('Features', 'FFTs', 'PSDLogs', 'Combined')
+					Selection dictionary name
+					Selection method and subset keys of the dictionary
+		Returns:	List of feature names, in the dictionary's spelling
+		"""
+
+		return self.meta['selections'][dictionary][method][placement][group][subset]
+
+
+# FUNCTIONS
+
+def fnSourceStamps(dictDir):
+	"""
+	Purpose:	Size, mtime and SHA-1 of every dictionary the store is built from
+	Passed:		Dictionary directory
+	Returns:	Dictionary of file name to stamp
+	"""
+
+	stamps = {}
+
+	for fileName in sorted(os.listdir(dictDir)):
+		if not fileName.endswith('.pkl'):
+			continue
+		stat = os.stat(os.path.join(dictDir, fileName))
+		stamps[fileName] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': fnFileHash(os.path.join(dictDir, fileName))}
+
+	return stamps
+
+def fnBuildParamStore(dictDir = DICT_DIR, directory = PARAM_STORE_DIR):
+	"""
+	Purpose:	Build the parameter store from the pickled dictionaries
+	Passed:		Dictionary directory
+				Store directory, replaced if it exists
+	"""
+
+	names = []
+	means = []
+	scales = []
+	sortedIndex = []
+	tables = {}
+
+	for table in NORM_TABLES:
+		for variant in NORM_VARIANTS:
+			path = os.path.join(dictDir, '{}_Norm_Param_Dictionary{}.pkl'.format(table, variant))
+			if not os.path.isfile(path):
+				continue
+
+			with open(path, 'rb') as dictFile:
+				normParams = pkl.load(dictFile)
+
+			tables[table + variant] = {}
+			for placement, params in normParams.items():
+				start = len(names)
+				tableNames = list(params)
+
+				names.extend(tableNames)
+				means.extend(params[featName]['Mean'] for featName in tableNames)
+				scales.extend(params[featName]['Scale'] for featName in tableNames)
+				sortedIndex.extend(np.argsort(np.array(tableNames), kind='stable'))
+
+				tables[table + variant][placement] = [start, len(names)]
+
+	selections = {}
+	for dictionary in SELECTION_DICTS:
+		path = os.path.join(dictDir, dictionary + '.pkl')
+		if os.path.isfile(path):
+			with open(path, 'rb') as dictFile:
+				selections[dictionary] = pkl.load(dictFile)
+
+	names = np.array(names)
+	sortedIndex = np.array(sortedIndex, dtype=np.int64)
+
+	# Names sorted within each slice, for binary search lookups
+	sortedNames = names.copy()
+	for placements in tables.values():
+		for start, stop in placements.values():
+			sortedNames[start:stop] = names[start:stop][sortedIndex[start:stop]]
+
+	arrays = {'names': names, 'mean': np.array(means, dtype=np.float64), 'scale': np.array(scales, dtype=np.float64),
+			  'sortedNames': sortedNames, 'sortedIndex': sortedIndex}
+
+	# Write beside the destination and swap in so readers never see a partial store
+	tempDirectory = '{}.{}.tmp'.format(directory, os.getpid())
+	shutil.rmtree(tempDirectory, ignore_errors=True)
+	os.makedirs(tempDirectory)
+
+	for name, array in arrays.items():
+		np.save(os.path.join(tempDirectory, name + '.npy'), array, allow_pickle=False)
+
+	with open(os.path.join(tempDirectory, 'meta.json'), 'w') as metaFile:
+		json.dump({'version': PARAM_STORE_VERSION, 'sources': fnSourceStamps(dictDir), 'tables': tables,
+				   'selections': selections}, metaFile)
+
+	shutil.rmtree(directory, ignore_errors=True)
+	os.rename(tempDirectory, directory)
+
+def fnReadParamStore(directory = PARAM_STORE_DIR):
+	"""
+	Purpose:	Memory-map a store written by fnBuildParamStore
+	Passed:		Store directory
+	Returns:	Parameter store
+	"""
+
+	with open(os.path.join(directory, 'meta.json')) as metaFile:
+		meta = json.load(metaFile)
+
+	arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r', allow_pickle=False)
+			  for name in ['names', 'mean', 'scale', 'sortedNames', 'sortedIndex']}
+
+	return ClParamStore(meta=meta, **arrays)
+
+def fnStoreCurrent(meta, dictDir):
+	"""
+	Purpose:	Check a store header against the dictionaries it was built from
+	Passed:		Store header
+				Dictionary directory
+	Returns:	True if the version matches and no dictionary was added, removed or changed
+	"""
+
+	if meta.get('version') != PARAM_STORE_VERSION:
+		return False
+
+	fileNames = sorted(fileName for fileName in os.listdir(dictDir) if fileName.endswith('.pkl'))
+	if fileNames != sorted(meta['sources']):
+		return False
+
+	for fileName in fileNames:
+		stat = os.stat(os.path.join(dictDir, fileName))
+		source = meta['sources'][fileName]
+
+		# Matching mtime and size is trusted, otherwise fall back to comparing contents
+		if source['mtime'] == stat.st_mtime_ns and source['size'] == stat.st_size:
+			continue
+		if source['size'] != stat.st_size or source['sha1'] != fnFileHash(os.path.join(dictDir, fileName)):
+			return False
+
+	return True
+
+def fnLoadParamStore(directory = PARAM_STORE_DIR, dictDir = DICT_DIR):
+	"""
+	Purpose:	Load the parameter store, reusing the in-process copy and rebuilding it only
+				when the dictionaries have changed
+	Passed:		Store directory
+				Dictionary directory
+	Returns:	Parameter store
+	"""
+
+	if directory in STORE_CACHE:
+		return STORE_CACHE[directory]
+
+	store = None
+
+	try:
+		store = fnReadParamStore(directory)
+		if not fnStoreCurrent(store.meta, dictDir):
+			store = None
+	except (OSError, ValueError, KeyError):
+		pass
+
+	if store is None:
+		fnBuildParamStore(dictDir, directory)
+		store = fnReadParamStore(directory)
+
+	STORE_CACHE[directory] = store
+
+	return store
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import time
+
+	fnBuildParamStore()
+
+	# Every entry of every dictionary against the store
+	timeStart = time.perf_counter()
+	dictionaries = {}
+	for fileName in sorted(os.listdir(DICT_DIR)):
+		if fileName.endswith('.pkl'):
+			with open(os.path.join(DICT_DIR, fileName), 'rb') as dictFile:
+				dictionaries[fileName] = pkl.load(dictFile)
+	secondsPickle = time.perf_counter() - timeStart
+
+	timeStart = time.perf_counter()
+	store = fnLoadParamStore()
+	secondsStore = time.perf_counter() - timeStart
+
+	nChecked = 0
+	for table in NORM_TABLES:
+		for variant in NORM_VARIANTS:
+			normParams = dictionaries['{}_Norm_Param_Dictionary{}.pkl'.format(table, variant)]
+			for placement in normParams:
+				names = list(normParams[placement])
+				scaler = store.fnScaler(table + variant, placement)
+				assert list(store.fnNames(table + variant, placement)) == names
+				assert np.array_equal(store.fnIndex(table + variant, placement, names), np.arange(len(names)))
+				assert np.array_equal(scaler.mean, [normParams[placement][featName]['Mean'] for featName in names])
+				assert np.array_equal(scaler.scale, [normParams[placement][featName]['Scale'] for featName in names])
+				nChecked += len(names)
+
+	for dictionary in SELECTION_DICTS:
+		assert store.meta['selections'][dictionary] == dictionaries[dictionary + '.pkl']
+
+	print('Store matches the dictionaries: {} tables, {} parameters'.format(len(store.meta['tables']), nChecked))
+
+	# mRMR selections resolve to scaler columns
+	for placement in ['Middle', 'Left', 'Right']:
+		selection = store.fnSelection(placement, 'PSDLogs')
+		scaler = store.fnScaler('PSDLogs', placement, selection)
+		print('mRMR PSDLogs {}: columns {}'.format(placement, store.fnIndex('PSDLogs', placement, selection)[:5].tolist()))
+
+	timeStart = time.perf_counter()
+	for repeat in range(1000):
+		store.fnIndex('TimeFeats', 'Middle', ['Mean X Accel Middle', 'Zero Crossing Rate Z Gyro Middle'])
+	secondsLookup = (time.perf_counter() - timeStart) / 1000
+
+	print('Unpickling {} dictionaries: {:.2f} ms, mapping the store: {:.2f} ms, two-name lookup: {:.1f} us'.format(
+		len(dictionaries), secondsPickle * 1e3, secondsStore * 1e3, secondsLookup * 1e6))
@@ -0,0 +1,405 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library plans the feature extraction needed by a
+				set of classifiers from the feature names they were trained on.
+
+				Names follow the scaler columns, '{feat} {axis} {placement}'
+				for time and frequency features and 'PSDLog {f} Hz {axis}
+				{placement}' for PSD bins (the long mRMR spellings such as
+				'Zero Crossing Rate' and 'PSD {f}.0 Hz' are accepted too).
+				Only the axes, features and bins that are asked for are
+				computed, and stages nothing depends on are skipped.
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import re
+
+from featuresLib import psd_bins, freq_features, N_FREQ_FEATURES
+from modelLib import ClCompiledScaler
+from configLib import DATA_COLUMNS
+
+# DEFINITIONS
+
+# Time domain feature names, in the order computed by time_features
+TIME_FEATURES_NAMES = ['Mean', 'Std', 'Norm', 'AC', 'Max', 'Min', 'RMS', 'ZCR', 'Skew', 'EK']
+
+# Frequency domain feature names, in the order computed by freq_features
+FREQ_FEATURES_NAMES = ['MSF', 'RMSF', 'FC', 'VF', 'RVF']
+
+# Spellings used in the mRMR selection dictionaries
+FEATURE_ALIASES = {'Autocorrelation': 'AC', 'Excess Kurtosis': 'EK', 'Zero Crossing Rate': 'ZCR',
+				   'Mean Square Frequency': 'MSF', 'Frequency Center': 'FC', 'Variance Frequency': 'VF',
+				   'PSD': 'PSDLog'}
+
+# Time features sharing an intermediate result
+CENTRAL_MOMENT_FEATURES = {'Std', 'Skew', 'EK'}
+SUM_SQUARE_FEATURES = {'Norm', 'AC', 'RMS'}
+
+# Powers of the variance dividing the third and fourth central moments into Skew and EK
+SHAPE_POWERS = np.array([1.5, 2])
+
+# Bins per axis up to which PSD cells are taken from a direct DFT instead of a full FFT
+DIRECT_DFT_BINS = 8
+
+PSD_PATTERN = re.compile(r'^PSDLog (\d+(?:\.\d+)?) Hz (.+) (\S+)$')
+
+# FUNCTIONS
+
+def fnColumnNames(placement, freqs):
+	"""
+	Purpose:	Full column names of every feature family, in scaler column order
+	Passed:		Sensor placement (Middle, Left, Right)
+				Frequencies labelling the PSD bins
+	Returns:	Dictionary of family ('Time', 'Freq', 'PSDLog') to list of names
+	"""
+
+	return {'Time': ['{} {} {}'.format(featName, direction, placement) for direction in DATA_COLUMNS for featName in TIME_FEATURES_NAMES],
+			'Freq': ['{} {} {}'.format(featName, direction, placement) for direction in DATA_COLUMNS for featName in FREQ_FEATURES_NAMES],
+			'PSDLog': ['{} {} Hz {} {}'.format('PSDLog', int(round(freq)), direction, placement) for direction in DATA_COLUMNS for freq in freqs]}
+
+def fnCanonicalName(name):
+	"""
+	Purpose:	Rewrite mRMR spellings of a feature name into the scaler column spelling
+	Passed:		Feature name
+	Returns:	Feature name as used by the scalers
+	"""
+
+	for alias, featName in FEATURE_ALIASES.items():
+		if name.startswith(alias + ' '):
+			name = featName + name[len(alias):]
+			break
+
+	match = PSD_PATTERN.match(name)
+	if match:
+		name = 'PSDLog {} Hz {} {}'.format(int(round(float(match.group(1)))), match.group(2), match.group(3))
+
+	return name
+
+def fnRowIndex(rows):
+	"""
+	Purpose:	Index selecting rows, a slice when they are consecutive so selecting them is a view
+	Passed:		Sorted list of row numbers
+	Returns:	Slice or index array (None for no rows)
+	"""
+
+	if not rows:
+		return None
+	if rows[-1] - rows[0] == len(rows) - 1:
+		return slice(rows[0], rows[-1] + 1)
+
+	return np.array(rows, dtype=np.intp)
+
+# CLASSES
+
+class ClFeaturePlan:
+	"""
+	Class for computing exactly the features named by one or more models.
+	"""
+
+	def __init__(self, featureNames, placement, freqs, fSamp, scalers = None, dtype = np.float64):
+		"""
+		Purpose:	Resolve every name to a (family, feature, axis, bin) cell and group the
+					cells into the stages that produce them
+		Passed:		Feature names required, in the order of the output row
+					Sensor placement (Middle, Left, Right)
+					Frequencies labelling the PSD bins
+					Sampling frequency
+					Optional dictionary of family to compiled scaler over the full family
+					Float type the features are computed and stored in
+		"""
+
+		self.featureNames = [fnCanonicalName(name) for name in featureNames]
+		self.dtype = np.dtype(dtype)
+		self.freqs = np.asarray(freqs, dtype=self.dtype)
+		self.fSamp = fSamp
+		self.nBins = len(self.freqs)
+
+		# Position of every name within its family's full column list, labelled from the exact frequencies
+		columnNames = fnColumnNames(placement, freqs)
+		lookup = {name: (family, i) for family, names in columnNames.items() for i, name in enumerate(names)}
+
+		cells = {'Time': [], 'Freq': [], 'PSDLog': []}
+		for position, name in enumerate(self.featureNames):
+			if name not in lookup:
+				raise ValueError('No runtime feature matches {!r}'.format(name))
+			family, column = lookup[name]
+			cells[family].append((position, column))
+
+		self.row = np.zeros((1, len(self.featureNames)), dtype=self.dtype)
+
+		# Time features, only the needed features over the axes that need any of them
+		self.timeAxes = sorted({column // len(TIME_FEATURES_NAMES) for position, column in cells['Time']})
+		self.timeFeatures = {TIME_FEATURES_NAMES[column % len(TIME_FEATURES_NAMES)] for position, column in cells['Time']}
+		self.timeValues = np.zeros((len(self.timeAxes), len(TIME_FEATURES_NAMES)), dtype=self.dtype)
+		self.timeTargets = np.array([position for position, column in cells['Time']], dtype=np.intp)
+		self.timeSources = np.array([self.timeAxes.index(column // len(TIME_FEATURES_NAMES)) * len(TIME_FEATURES_NAMES) + column % len(TIME_FEATURES_NAMES)
+									 for position, column in cells['Time']], dtype=np.intp)
+
+		# Rows of the time axes needing each statistic, features sharing an intermediate result share its rows
+		featureRows = {featName: {self.timeAxes.index(column // len(TIME_FEATURES_NAMES)) for position, column in cells['Time']
+								  if TIME_FEATURES_NAMES[column % len(TIME_FEATURES_NAMES)] == featName}
+					   for featName in TIME_FEATURES_NAMES}
+		self.timeRows = {'Mean': featureRows['Mean'],
+						 'Sum Square': set().union(*[featureRows[featName] for featName in SUM_SQUARE_FEATURES]),
+						 'Central Moment': set().union(*[featureRows[featName] for featName in CENTRAL_MOMENT_FEATURES]),
+						 'Max': featureRows['Max'], 'Min': featureRows['Min'], 'ZCR': featureRows['ZCR']}
+		self.timeRows = {statistic: fnRowIndex(sorted(rows)) for statistic, rows in self.timeRows.items()}
+		self.timeShape = bool(self.timeFeatures & {'Skew', 'EK'})
+		self.timePowers = None
+
+		# Frequency features need every bin of their axes
+		self.freqAxes = sorted({column // N_FREQ_FEATURES for position, column in cells['Freq']})
+		self.freqTargets = np.array([position for position, column in cells['Freq']], dtype=np.intp)
+		self.freqSources = np.array([self.freqAxes.index(column // N_FREQ_FEATURES) * N_FREQ_FEATURES + column % N_FREQ_FEATURES
+									 for position, column in cells['Freq']], dtype=np.intp)
+		self.freqPSD = np.zeros((self.nBins, len(self.freqAxes)), dtype=self.dtype)
+
+		# PSD log cells on axes with frequency features reuse that PSD, the rest are computed alone
+		psdCells = [(position, column // self.nBins, column % self.nBins) for position, column in cells['PSDLog']]
+		self.psdShared = [(position, self.freqAxes.index(axis), b) for position, axis, b in psdCells if axis in self.freqAxes]
+		psdOwn = [(position, axis, b) for position, axis, b in psdCells if axis not in self.freqAxes]
+		self.psdAxes = sorted({axis for position, axis, b in psdOwn})
+		self.psdBins = sorted({b for position, axis, b in psdOwn})
+		self.psdTargets = np.array([position for position, axis, b in psdOwn], dtype=np.intp)
+		self.psdSources = np.array([self.psdAxes.index(axis) * len(self.psdBins) + self.psdBins.index(b) for position, axis, b in psdOwn], dtype=np.intp)
+		self.psdSharedTargets = np.array([position for position, axis, b in self.psdShared], dtype=np.intp)
+		self.psdSharedSources = np.array([b * max(len(self.freqAxes), 1) + axis for position, axis, b in self.psdShared], dtype=np.intp)
+
+		# Few bins are cheaper as a direct DFT, spectrum bin b + 1 is labelled with freqs[b]
+		self.psdDirect = 0 < len(self.psdBins) <= DIRECT_DFT_BINS
+		self.basis = None
+
+		# Stages with nothing downstream are skipped
+		self.needsTime = len(self.timeTargets) > 0
+		self.needsPSD = len(self.freqTargets) > 0 or len(self.psdTargets) > 0 or len(self.psdSharedTargets) > 0
+		self.needsFreq = len(self.freqTargets) > 0
+
+		# Normalization of only the planned columns
+		self.scaler = None
+		if scalers is not None:
+			mean = np.zeros(len(self.featureNames))
+			scale = np.ones(len(self.featureNames))
+			for family in cells:
+				for position, column in cells[family]:
+					mean[position] = scalers[family].mean[column]
+					scale[position] = scalers[family].scale[column]
+			self.scaler = ClCompiledScaler(mean, scale, self.dtype)
+
+	def fnColumns(self, featureNames):
+		"""
+		Purpose:	Positions of a model's features within the planned row
+		Passed:		Feature names the model was trained on, in order
+		Returns:	Index array into the planned row
+		"""
+
+		positions = {name: position for position, name in enumerate(self.featureNames)}
+
+		return np.array([positions[fnCanonicalName(name)] for name in featureNames], dtype=np.intp)
+
+	def fnComputeTime(self, window):
+		"""
+		Purpose:	Compute and normalize the planned time domain features
+		Passed:		(n, 6) filtered window
+		"""
+
+		values = self.timeValues
+		rows = self.timeRows
+
+		# Axes as contiguous rows so every statistic reduces along memory
+		data = window.T.take(self.timeAxes, axis=0)
+		n = data.shape[1]
+
+		mean = np.sum(data, axis=1) / n
+		if rows['Mean'] is not None:
+			values[rows['Mean'], 0] = mean[rows['Mean']]
+
+		if rows['Sum Square'] is not None:
+			square = data[rows['Sum Square']]
+			sumSq = np.einsum('ij,ij->i', square, square)
+			values[rows['Sum Square'], 2] = np.sqrt(sumSq)
+			values[rows['Sum Square'], 3] = sumSq
+			values[rows['Sum Square'], 6] = np.sqrt(sumSq / n)
+
+		if rows['Central Moment'] is not None:
+			central = rows['Central Moment']
+
+			# Deviations, their squares and ones share one buffer, so a single batched product
+			# gives the third, fourth and second central moments of every axis
+			dev = data[central]
+			powers = self.timePowers
+			if powers is None or powers.shape[2] != n:
+				powers = self.timePowers = np.ones((dev.shape[0], 3, n), dtype=self.dtype)
+			np.subtract(dev, mean[central, np.newaxis], out=powers[:, 0])
+			np.multiply(powers[:, 0], powers[:, 0], out=powers[:, 1])
+			moments = np.matmul(powers, powers[:, 1, :, np.newaxis])[:, :, 0] / n
+			m2 = moments[:, 2]
+
+			values[central, 1] = np.sqrt(m2)
+
+			# Biased skew and excess kurtosis together, constant axes have zero moments so they
+			# give 0 and -3 like time_features
+			if self.timeShape:
+				values[central, 8:10] = moments[:, :2] / np.maximum(m2[:, np.newaxis] ** SHAPE_POWERS, np.finfo(self.dtype).tiny)
+				values[central, 9] -= 3
+
+		if rows['Max'] is not None:
+			values[rows['Max'], 4] = np.amax(data[rows['Max']], axis=1)
+		if rows['Min'] is not None:
+			values[rows['Min'], 5] = np.amin(data[rows['Min']], axis=1)
+		if rows['ZCR'] is not None:
+			positive = data[rows['ZCR']] > 0
+			values[rows['ZCR'], 7] = np.sum(positive[:, 1:] != positive[:, :-1], axis=1) / n
+
+		self.row[0, self.timeTargets] = values.reshape(-1)[self.timeSources]
+		self.fnNormalize(self.timeTargets)
+
+	def fnComputePSD(self, window):
+		"""
+		Purpose:	Compute the planned PSD bins and their normalized logs
+		Passed:		(n, 6) filtered window
+		"""
+
+		# Full PSD of the axes with frequency features
+		if len(self.freqAxes):
+			psd_bins(window[:, self.freqAxes], self.fSamp, self.nBins, self.freqPSD)
+			self.row[0, self.psdSharedTargets] = self.fnLog(self.freqPSD.reshape(-1)[self.psdSharedSources])
+
+		# Remaining cells from a direct DFT of their bins, or an FFT when there are many
+		if len(self.psdTargets):
+			data = window[:, self.psdAxes]
+			n = data.shape[0]
+
+			if self.psdDirect:
+				if self.basis is None or self.basis.shape[0] != n:
+					self.basis = np.exp(-2j * np.pi * np.outer(np.arange(n), np.add(self.psdBins, 1)) / n).astype(np.result_type(self.dtype, np.complex64))
+				spectrum = np.dot(data.T, self.basis)
+				psd = (spectrum.real ** 2 + spectrum.imag ** 2) * (2 / (self.fSamp * n))
+				if n % 2 == 0 and n // 2 - 1 in self.psdBins:
+					psd[:, self.psdBins.index(n // 2 - 1)] /= 2
+			else:
+				psd = psd_bins(data, self.fSamp, self.psdBins[-1] + 1)[self.psdBins].T
+
+			self.row[0, self.psdTargets] = self.fnLog(psd.reshape(-1)[self.psdSources])
+
+		self.fnNormalize(self.psdTargets)
+		self.fnNormalize(self.psdSharedTargets)
+
+	def fnComputeFreq(self):
+		"""
+		Purpose:	Compute and normalize the planned frequency features from the PSD
+					left by fnComputePSD
+		"""
+
+		self.row[0, self.freqTargets] = freq_features(self.freqs, self.freqPSD)[self.freqSources]
+		self.fnNormalize(self.freqTargets)
+
+	def fnCompute(self, window):
+		"""
+		Purpose:	Run every needed stage on a window
+		Passed:		(n, 6) filtered window
+		Returns:	(1, n_features) normalized feature row
+		"""
+
+		if self.needsTime:
+			self.fnComputeTime(window)
+		if self.needsPSD:
+			self.fnComputePSD(window)
+		if self.needsFreq:
+			self.fnComputeFreq()
+
+		return self.row
+
+	def fnLog(self, psd):
+		"""
+		Purpose:	Log10 of PSD values with zero power mapped to 0, as log_psd
+		Passed:		PSD values
+		Returns:	Log PSD values
+		"""
+
+		logs = np.zeros(psd.shape, dtype=self.dtype)
+		np.log10(psd, out=logs, where=psd > 0)
+
+		return logs
+
+	def fnNormalize(self, targets):
+		"""
+		Purpose:	Standardize planned columns in place
+		Passed:		Positions within the row
+		"""
+
+		if self.scaler is not None and len(targets):
+			self.row[0, targets] = (self.row[0, targets] - self.scaler.mean[targets]) / self.scaler.scale[targets]
+
+	def fnSummary(self):
+		"""
+		Purpose:	Describe the planned computation
+		Returns:	Summary string
+		"""
+
+		stages = [stage for stage, needed in [('Time', self.needsTime), ('PSD', self.needsPSD), ('Freq', self.needsFreq)] if needed]
+
+		return 'Feature plan: {} features; time {} on {} axes, freq {} on {} axes, PSD {} cells ({} by {}); stages: {}'.format(
+			len(self.featureNames), len(self.timeTargets), len(self.timeAxes), len(self.freqTargets), len(self.freqAxes),
+			len(self.psdTargets) + len(self.psdSharedTargets), len(self.psdTargets), 'direct DFT' if self.psdDirect else 'FFT',
+			', '.join(stages) if stages else 'none')
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import timeit
+
+	from featuresLib import time_features, psd_freqs, log_psd
+	from paramStoreLib import fnLoadParamStore
+
+	# Planned features against the full feature engines for full and selected name sets
+	np.random.seed(0)
+
+	for placement, wLength, fSamp, nBins in [('Middle', 300, 300, 60), ('Left', 333, 333.3, 64)]:
+		freqs = psd_freqs(wLength, fSamp, nBins)
+		columnNames = fnColumnNames(placement, freqs)
+		allNames = columnNames['Time'] + columnNames['Freq'] + columnNames['PSDLog']
+
+		scalers = {family: ClCompiledScaler(np.random.normal(size=len(names)), np.random.uniform(0.5, 2, size=len(names)))
+				   for family, names in columnNames.items()}
+
+		for trial in range(50):
+			window = np.random.normal(size=(wLength, 6)) * np.random.uniform(0.01, 10, size=6)
+			window[:, 5] = 0
+
+			psd = psd_bins(window, fSamp, nBins)
+			full = np.concatenate([scalers['Time'].fnNormalize(time_features(window)),
+								   scalers['Freq'].fnNormalize(freq_features(freqs, psd)),
+								   scalers['PSDLog'].fnNormalize(log_psd(psd))])
+
+			size = [len(allNames), 1, 5, 20, 100][trial % 5]
+			selected = np.random.choice(len(allNames), size, replace=False)
+			plan = ClFeaturePlan([allNames[i] for i in selected], placement, freqs, fSamp, scalers)
+
+			np.testing.assert_allclose(plan.fnCompute(window)[0], full[selected], rtol=1e-9, atol=1e-9)
+
+		print('ClFeaturePlan matches the full feature engines ({})'.format(placement))
+
+	# Plans for the mRMR selections in the dictionaries, against the full plan
+	store = fnLoadParamStore()
+
+	freqs = psd_freqs(300, 300, 60)
+	columnNames = fnColumnNames('Middle', freqs)
+	window = np.random.normal(size=(300, 6))
+
+	plans = [('All features', ClFeaturePlan(columnNames['Time'] + columnNames['Freq'] + columnNames['PSDLog'], 'Middle', freqs, 300))]
+	for selection in ['Features', 'PSDLogs']:
+		plans.append(('mRMR ' + selection, ClFeaturePlan(store.fnSelection('Middle', selection), 'Middle', freqs, 300)))
+	plans.append(('Time only', ClFeaturePlan(columnNames['Time'], 'Middle', freqs, 300)))
+
+	# Plans take turns so a slow spell of the machine does not land on one of them
+	seconds = {name: float('inf') for name, plan in plans}
+	for repeat in range(20):
+		for name, plan in plans:
+			seconds[name] = min(seconds[name], timeit.timeit(lambda: plan.fnCompute(window), number=200) / 200)
+
+	for name, plan in plans:
+		print('{:<14s} {:8.1f} us  {}'.format(name, seconds[name] * 1e6, plan.fnSummary()))
@@ -0,0 +1,199 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python script compares the float32 classification pipeline
+				against float64 on recorded sessions.
+
+				Each float type replays the sessions sample by sample through
+				the ClTerrainClassifier path (ring buffer, Butterworth filter,
+				planned features, scalers and compiled models) in a fresh
+				worker process. The report gives the label agreement of every
+				model and of the cascade decision, the largest difference of
+				the standardized features, the accuracy of both types, the
+				per-window latency and the memory each type adds.
+
+				python3 precisionReport.py "IMU Data/Middle_Grass_Frame6050.csv" Left="IMU Data/Synthesis.csv" ...
+"""
+
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os
+import time
+import resource
+
+from multiprocessing import Pool
+
+from ringBufferLib import ClRingBuffer
+from filterLib import fnDesignButter, fnFilterWindow
+from cascadeLib import ClModelCascade, fnLoadClassifiers, fnAvailableStages, ALL_STAGES, MODELS
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, TERRAINS, fnSessionFreqs
+from sessionLib import fnLoadSession
+
+# DEFINITIONS
+
+# Reference type first, every other type is compared against it
+PIPELINE_DTYPES = ['float64', 'float32']
+
+# FUNCTIONS
+
+def fnResidentBytes():
+	"""
+	Purpose:	Resident set size of this process
+	Returns:	Bytes, the peak resident size where /proc is not available
+	"""
+
+	try:
+		with open('/proc/self/statm') as statmFile:
+			return int(statmFile.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def fnArrayBytes(item, seen = None):
+	"""
+	Purpose:	Bytes of every array reachable from an object through its attributes, dictionaries and lists
+	Passed:		Object
+				Ids already counted
+	Returns:	Bytes
+	"""
+
+	if seen is None:
+		seen = set()
+	if id(item) in seen:
+		return 0
+	seen.add(id(item))
+
+	if isinstance(item, np.ndarray):
+		return item.nbytes
+	if isinstance(item, dict):
+		return sum(fnArrayBytes(value, seen) for value in item.values())
+	if isinstance(item, (list, tuple)):
+		return sum(fnArrayBytes(value, seen) for value in item)
+	if hasattr(item, '__dict__'):
+		return fnArrayBytes(vars(item), seen)
+
+	return 0
+
+def fnReplay(task):
+	"""
+	Purpose:	Replay sessions through the real-time path in one float type, in a worker process
+	Passed:		List of (session csv path, placement), list of model names (None for every model trained
+				for each placement), hop, float type name
+	Returns:	Dictionary of the float type's results: per session labels, decisions, feature rows
+				and window latencies, the growth in resident size and the bytes of the pipeline's arrays
+	"""
+
+	sessions, modelNames, hopSamples, dtypeName = task
+	dtype = np.dtype(dtypeName).type
+
+	rssStart = fnResidentBytes()
+	pipelines = {}
+	placementModels = {}
+	results = []
+
+	for path, placement in sessions:
+		samples, placement, terrain = fnLoadSession(path, placement)
+		sensorParam = SENSOR_PARAMS[placement]
+
+		# One pipeline per placement, as ClTerrainClassifier keeps it
+		if placement not in pipelines:
+			placementModels[placement] = modelNames or fnAvailableStages(placement, ALL_STAGES)[0]
+			models, scalers = fnLoadClassifiers(placement, [placementModels[placement]], dtype)
+			pipelines[placement] = {'Window': ClRingBuffer(sensorParam['wLength'] + 2 * PAD_LENGTH, samples.shape[1], dtype),
+									'Filtered': np.zeros((sensorParam['wLength'], samples.shape[1]), dtype=dtype),
+									'Sos': fnDesignButter(sensorParam, dtype=dtype),
+									'Cascade': ClModelCascade([placementModels[placement]], models, scalers, placement, fnSessionFreqs(sensorParam),
+															  sensorParam['fSamp'], dtype=dtype)}
+		pipeline = pipelines[placement]
+		window = pipeline['Window']
+		plan = pipeline['Cascade'].stages[0]['Plan']
+
+		labels = {name: [] for name in placementModels[placement]}
+		decisions = []
+		rows = []
+		seconds = []
+
+		for sample in samples:
+			window.append(sample)
+			if window.sampleCount < window.length or (window.sampleCount - window.length) % hopSamples:
+				continue
+
+			timeStart = time.perf_counter()
+			fnFilterWindow(pipeline['Sos'], window.snapshot(), pipeline['Filtered'], PAD_LENGTH)
+			windowLabels, decision, stagesRun = pipeline['Cascade'].fnClassify(pipeline['Filtered'])
+			seconds.append(time.perf_counter() - timeStart)
+
+			for name in labels:
+				labels[name].append(windowLabels[name])
+			decisions.append(decision)
+			rows.append(plan.row[0].astype(np.float64))
+
+		results.append({'path': path, 'placement': placement, 'terrain': terrain, 'labels': labels,
+						'decisions': np.array(decisions), 'rows': np.array(rows), 'seconds': np.array(seconds)})
+
+	return {'dtype': dtypeName, 'sessions': results, 'rss': fnResidentBytes() - rssStart,
+			'pipelineBytes': fnArrayBytes(pipelines)}
+
+def fnAccuracy(labels, terrain):
+	"""
+	Purpose:	Share of windows labelled with a session's terrain
+	Passed:		Class labels
+				Terrain of the session
+	Returns:	Accuracy, nan if the terrain is not a classifier class
+	"""
+
+	if terrain not in TERRAINS or len(labels) == 0:
+		return float('nan')
+
+	return float(np.mean(np.asarray(labels) == TERRAINS.index(terrain)))
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Compare the float32 classification pipeline against float64 on recorded sessions.')
+	parser.add_argument('sessions', nargs='+', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--models', nargs='+', default=None, choices=list(MODELS), help='models run on every window (default every model trained for the placement)')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between classifications')
+	args = parser.parse_args()
+
+	sessions = [tuple(reversed(session.split('=', 1))) if '=' in session else (session, None) for session in args.sessions]
+
+	# Every type in its own fresh process, so neither sees the other's memory or warm caches
+	reports = {}
+	for dtypeName in PIPELINE_DTYPES:
+		with Pool(1) as pool:
+			reports[dtypeName] = pool.apply(fnReplay, ((sessions, args.models, args.hop, dtypeName), ))
+
+	reference = reports[PIPELINE_DTYPES[0]]
+
+	for dtypeName in PIPELINE_DTYPES[1:]:
+		report = reports[dtypeName]
+		print('{} against {}'.format(dtypeName, reference['dtype']))
+
+		for base, other in zip(reference['sessions'], report['sessions']):
+			nWindows = len(base['decisions'])
+			agreement = {name: np.mean(np.equal(base['labels'][name], other['labels'][name])) for name in base['labels']}
+			worst = min(agreement, key=agreement.get)
+			featureDiff = np.max(np.abs(base['rows'] - other['rows'])) if nWindows else 0.0
+
+			print('{} ({}, {}): {} windows, decision agreement {:.2%}, lowest model agreement {:.2%} ({}), '
+				  'largest feature difference {:.2e} sd, decision accuracy {:.2%} / {:.2%}'.format(
+				os.path.basename(base['path']), base['placement'], base['terrain'], nWindows,
+				np.mean(base['decisions'] == other['decisions']) if nWindows else 1.0, agreement[worst], worst, featureDiff,
+				fnAccuracy(base['decisions'], base['terrain']), fnAccuracy(other['decisions'], other['terrain'])))
+
+		for label, item in [(reference['dtype'], reference), (dtypeName, report)]:
+			seconds = np.concatenate([session['seconds'] for session in item['sessions']])
+			p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1e3
+			print('{:>8s}: window latency p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms; pipeline arrays {:.1f} kB, resident size grew {:.1f} MB'.format(
+				label, p50, p95, p99, item['pipelineBytes'] / 1e3, item['rss'] / 1e6))
+
+		baseSeconds = np.median(np.concatenate([session['seconds'] for session in reference['sessions']]))
+		otherSeconds = np.median(np.concatenate([session['seconds'] for session in report['sessions']]))
+		print('{} median latency {:.2f}x, pipeline arrays {:.2f}x, resident growth {:+.1f} MB'.format(
+			dtypeName, baseSeconds / otherSeconds, reference['pipelineBytes'] / max(report['pipelineBytes'], 1),
+			(report['rss'] - reference['rss']) / 1e6))
@@ -0,0 +1,300 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library provides the preallocated circular buffer
+				used to hold the rolling IMU window for terrain classification.
+
+				Samples are written in place at a moving write index, so
+				ingesting a sample is O(1) and never allocates, and the
+				classifier reads the window back in chronological order
+				through snapshot().
+
+				1. ClRingBuffer - window shared between threads, lock guarded
+				2. ClSharedRingBuffer - window in shared memory for a reader
+				   in another process, process lock guarded
+"""
+# IMPORTED LIBRARIES
+
+import multiprocessing
+import numpy as np
+import threading
+import time
+import timeit
+from multiprocessing import shared_memory
+
+# CLASSES
+
+class ClRingBuffer:
+	"""
+	Class for a fixed-length, preallocated rolling window of samples.
+	"""
+
+	def __init__(self, length, nAxes = 6, dtype = np.float64):
+		"""
+		Purpose:	Preallocate the circular buffer and the snapshot output
+		Passed:		Number of samples in the window
+					Number of axes per sample
+					Float type samples are stored in
+		"""
+
+		self.length = length
+		self.nAxes = nAxes
+
+		# Circular storage, oldest sample lives at the write index
+		self.buffer = np.zeros((length, nAxes), dtype=dtype)
+		self.index = 0
+
+		# Total number of samples ever written
+		self.sampleCount = 0
+
+		# Preallocated chronological copy handed to the reader
+		self.snapshotBuffer = np.zeros((length, nAxes), dtype=dtype)
+
+		# Guards the write index against a concurrent snapshot
+		self.lock = threading.Lock()
+
+	def append(self, sample, offset = None, scale = None):
+		"""
+		Purpose:	Write one sample over the oldest sample in the window
+		Passed:		Sample values (sequence of length nAxes)
+					Optional offset subtracted from the sample in place
+					Optional scale multiplied onto the sample in place
+		"""
+
+		with self.lock:
+			row = self.buffer[self.index]
+			row[:] = sample
+
+			if offset is not None:
+				np.subtract(row, offset, out = row)
+			if scale is not None:
+				np.multiply(row, scale, out = row)
+
+			self.index += 1
+			if self.index == self.length:
+				self.index = 0
+			self.sampleCount += 1
+
+	def snapshot(self, out = None):
+		"""
+		Purpose:	Copy the window out in chronological order (oldest first)
+		Passed:		Optional (length, nAxes) array to copy into, otherwise the
+					preallocated snapshot buffer is reused and overwritten on the
+					next call
+		Returns:	Window array in chronological order
+		"""
+
+		if out is None:
+			out = self.snapshotBuffer
+
+		with self.lock:
+			split = self.length - self.index
+			out[:split] = self.buffer[self.index:]
+			out[split:] = self.buffer[:self.index]
+
+		return out
+
+	def recent(self, n, out = None):
+		"""
+		Purpose:	Copy out the newest samples in chronological order
+		Passed:		Number of samples (at most the window length)
+					Optional (n, nAxes) array to copy into
+		Returns:	(n, nAxes) array of the newest samples
+		"""
+
+		if out is None:
+			out = np.zeros((n, self.nAxes), dtype=self.buffer.dtype)
+
+		with self.lock:
+			start = self.index - n
+			if start >= 0:
+				out[:] = self.buffer[start:self.index]
+			else:
+				out[:-start] = self.buffer[start:]
+				out[-start:] = self.buffer[:self.index]
+
+		return out
+
+
+class ClSharedRingBuffer:
+	"""
+	Class for a rolling window in shared memory, written by one process and
+	snapshotted by others under a lock shared between the processes.
+	"""
+
+	# Header layout (int64): write index, total sample count
+	INDEX, COUNT = 0, 1
+	HEADER_LENGTH = 2
+
+	def __init__(self, length, nAxes = 6, name = None, dtype = np.float64, lock = None, context = None):
+		"""
+		Purpose:	Create the shared memory block, or attach to an existing one
+		Passed:		Number of samples in the window
+					Number of axes per sample
+					Name of an existing block to attach to (None to create one)
+					Float type samples are stored in
+					Lock of the existing block (None to create one), inherited or passed to
+					child processes when they start, never sent over a queue
+					Multiprocessing context the reader processes start from (None for the default)
+		"""
+
+		self.length = length
+		self.nAxes = nAxes
+		self.dtype = np.dtype(dtype)
+
+		size = 8 * self.HEADER_LENGTH + self.dtype.itemsize * length * nAxes
+		self.owner = name is None
+		self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+
+		self.header = np.ndarray((self.HEADER_LENGTH, ), dtype=np.int64, buffer=self.memory.buf)
+		self.buffer = np.ndarray((length, nAxes), dtype=self.dtype, buffer=self.memory.buf, offset=8 * self.HEADER_LENGTH)
+
+		if self.owner:
+			self.header.fill(0)
+			self.buffer.fill(0)
+
+		# Semaphore acquire and release are full memory barriers, so a snapshot never sees a half written row
+		self.lock = (context or multiprocessing).Lock() if lock is None else lock
+
+		# Preallocated chronological copy handed to the reader (local to each process)
+		self.snapshotBuffer = np.zeros((length, nAxes), dtype=self.dtype)
+
+	def __getstate__(self):
+		"""
+		Purpose:	Pickle by shared memory name so spawned processes reattach to the same block
+		"""
+
+		return {'length': self.length, 'nAxes': self.nAxes, 'name': self.memory.name, 'dtype': self.dtype.str, 'lock': self.lock}
+
+	def __setstate__(self, state):
+		"""
+		Purpose:	Reattach to the shared memory block in the receiving process
+		"""
+
+		self.__init__(state['length'], state['nAxes'], state['name'], state['dtype'], state['lock'])
+
+	@property
+	def sampleCount(self):
+		"""
+		Purpose:	Total number of samples ever written
+		"""
+
+		return int(self.header[self.COUNT])
+
+	def append(self, sample, offset = None, scale = None):
+		"""
+		Purpose:	Write one sample over the oldest sample in the window, single writer only
+		Passed:		Sample values (sequence of length nAxes)
+					Optional offset subtracted from the sample in place
+					Optional scale multiplied onto the sample in place
+		"""
+
+		header = self.header
+
+		with self.lock:
+			index = header[self.INDEX]
+
+			row = self.buffer[index]
+			row[:] = sample
+			if offset is not None:
+				np.subtract(row, offset, out = row)
+			if scale is not None:
+				np.multiply(row, scale, out = row)
+
+			header[self.INDEX] = index + 1 if index + 1 < self.length else 0
+			header[self.COUNT] += 1
+
+	def snapshot(self, out = None):
+		"""
+		Purpose:	Copy the window out in chronological order (oldest first)
+		Passed:		Optional (length, nAxes) array to copy into, otherwise the
+					preallocated snapshot buffer is reused and overwritten on the
+					next call
+		Returns:	Window array in chronological order
+		"""
+
+		if out is None:
+			out = self.snapshotBuffer
+
+		# The writer blocks for one window copy (a few microseconds) rather than the reader spinning
+		with self.lock:
+			index = self.header[self.INDEX]
+			split = self.length - index
+			out[:split] = self.buffer[index:]
+			out[split:] = self.buffer[:index]
+
+		return out
+
+	def recent(self, n, out = None):
+		"""
+		Purpose:	Copy out the newest samples in chronological order, from the writing process
+		Passed:		Number of samples (at most the window length)
+					Optional (n, nAxes) array to copy into
+		Returns:	(n, nAxes) array of the newest samples
+		"""
+
+		if out is None:
+			out = np.zeros((n, self.nAxes), dtype=self.buffer.dtype)
+
+		index = self.header[self.INDEX]
+		start = index - n
+		if start >= 0:
+			out[:] = self.buffer[start:index]
+		else:
+			out[:-start] = self.buffer[start:]
+			out[-start:] = self.buffer[:index]
+
+		return out
+
+	def fnClose(self):
+		"""
+		Purpose:	Detach from the shared memory block, freeing it if this instance created it
+		"""
+
+		self.header = self.buffer = None
+		self.memory.close()
+		if self.owner:
+			self.memory.unlink()
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	# Microbenchmark of per-sample ingest cost, np.roll versus ring buffer
+	# Window sizes match FRAME_MODULE and WHEEL_MODULE with PAD_LENGTH padding
+	# For Pi-class numbers run pinned to a single core, i.e.
+	#   OPENBLAS_NUM_THREADS=1 taskset -c 0 python3 ringBufferLib.py
+
+	from configLib import FRAME_MODULE, WHEEL_MODULE, PAD_LENGTH
+
+	N_SAMPLES = 30000
+
+	offset = np.array([0, 0, 9.8, 0, 0, 0])
+	scale = np.array([1, 1, 1, np.pi/180, np.pi/180, np.pi/180])
+	transmissionData = ['IMU_6', time.time(), 0.1, -0.2, 9.9, 1.5, -0.3, 0.2]
+
+	for name, wLength in [('FRAME_MODULE', FRAME_MODULE['wLength']), ('WHEEL_MODULE', WHEEL_MODULE['wLength'])]:
+
+		length = wLength + 2 * PAD_LENGTH
+
+		windowIMUraw = np.zeros((length, 6))
+
+		def fnRollIngest():
+			global windowIMUraw
+			windowIMUraw = np.roll(windowIMUraw, -1, axis=0)
+			windowIMUraw[-1, :] = np.multiply(np.subtract(transmissionData[2:8], offset), scale)
+
+		ringBuffer = ClRingBuffer(length)
+
+		def fnRingIngest():
+			ringBuffer.append(transmissionData[2:8], offset, scale)
+
+		rollTime = min(timeit.repeat(fnRollIngest, number = N_SAMPLES, repeat = 5)) / N_SAMPLES
+		ringTime = min(timeit.repeat(fnRingIngest, number = N_SAMPLES, repeat = 5)) / N_SAMPLES
+		snapTime = min(timeit.repeat(ringBuffer.snapshot, number = N_SAMPLES, repeat = 5)) / N_SAMPLES
+
+		print('{} ({} x 6)'.format(name, length))
+		print('    np.roll ingest:     {:8.2f} us/sample'.format(rollTime * 1e6))
+		print('    ring buffer ingest: {:8.2f} us/sample ({:.1f}x)'.format(ringTime * 1e6, rollTime / ringTime))
+		print('    snapshot:           {:8.2f} us/window'.format(snapTime * 1e6))
@@ -0,0 +1,320 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library classifies several sensor placements
+				(Middle, Left and Right) in one service.
+
+				Every placement keeps its own shared memory window, sensor
+				parameters, filter, scalers and models. Whenever the ingest
+				side schedules placements (every HOP_SAMPLES of each), they
+				are classified in one cycle on one pool of worker processes
+				shared by all placements. The compiled models are loaded
+				before the pool starts, so forked workers inherit them and
+				every worker maps the same on-disk cache.
+				Throughput and latency are reported per placement.
+
+				Run directly to replay recorded sessions through the service:
+				python3 serviceLib.py "IMU Data/Middle_Grass_Frame6050.csv" Left="IMU Data/Grass_Synthesis.csv" ...
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import time
+
+from multiprocessing import Pool
+
+from ringBufferLib import ClSharedRingBuffer
+from filterLib import fnDesignButter, fnFilterWindow
+from timingLib import ClStageTimer
+from cascadeLib import ClModelCascade, fnLoadClassifiers, fnAvailableStages, ALL_STAGES, MODELS
+from configLib import SENSOR_PARAMS, PAD_LENGTH, fnSessionFreqs
+
+# DEFINITIONS
+
+# Seconds of one hop at the frame module's rate, a cycle taking longer is counted late
+CYCLE_SECONDS = 0.5
+
+# Worker processes shared by all placements (None for one per placement)
+POOL_WORKERS = None
+
+# Stages timed per placement, 'Queue' is the wait for a free worker and 'Total' runs from cycle start to result
+SERVICE_STAGES = ['Queue', 'Snapshot', 'Filter', 'Time Features', 'PSD', 'Freq Features',
+				  'SVM Time', 'SVM Freq', 'SVM PSD', 'RF Time', 'RF Freq', 'RF PSD', 'Total']
+
+# Placement state of a worker process, filled by fnInitWorker
+WORKER_STATE = {}
+
+# CLASSES
+
+class ClLapRecorder:
+	"""
+	Class for collecting stage laps in a worker so they can be recorded by the service.
+	"""
+
+	def __init__(self):
+		"""
+		Purpose:	Start an empty list of laps
+		"""
+
+		self.laps = []
+
+	def fnLap(self, stage, timeStart):
+		"""
+		Purpose:	Keep the time since timeStart against a stage and start the next lap
+		Passed:		Stage name
+					perf_counter value when the stage started
+		Returns:	perf_counter value now, the start of the next stage
+		"""
+
+		timeNow = time.perf_counter()
+		self.laps.append((stage, timeNow - timeStart))
+
+		return timeNow
+
+
+class ClPlacementService:
+	"""
+	Class for classifying the windows of several placements on one shared worker pool.
+	"""
+
+	def __init__(self, placements, stages = ALL_STAGES, threshold = None, workers = POOL_WORKERS, reportInterval = 30, dtype = np.float64):
+		"""
+		Purpose:	Load every placement's models, create its window and start the worker pool
+		Passed:		List of placements (Middle, Left, Right)
+					List of stages, each a list of model names from cascadeLib.MODELS, narrowed to the
+					models trained for each placement
+					Cascade margin at or above which later stages are skipped (None to run every stage)
+					Number of worker processes (None for one per placement)
+					Seconds between printed summaries (None to never print)
+					Float type of the windows, features and models
+		"""
+
+		self.placements = list(placements)
+
+		# Compile or map every placement's models once, before the workers fork
+		self.stages = {placement: fnAvailableStages(placement, stages) for placement in self.placements}
+		for placement in self.placements:
+			fnLoadClassifiers(placement, self.stages[placement], dtype)
+
+		self.windows = {placement: ClSharedRingBuffer(SENSOR_PARAMS[placement]['wLength'] + 2 * PAD_LENGTH, dtype=dtype) for placement in self.placements}
+
+		# Sample count at the last classification, to skip placements without new data
+		self.sampleCounts = {placement: 0 for placement in self.placements}
+
+		# Per placement latency histograms and counters
+		self.timers = {placement: ClStageTimer(SERVICE_STAGES, None) for placement in self.placements}
+		self.windowsClassified = {placement: 0 for placement in self.placements}
+		self.windowsStale = {placement: 0 for placement in self.placements}
+		self.cycles = 0
+		self.cyclesLate = 0
+
+		self.reportInterval = reportInterval
+		self.timeReported = time.perf_counter()
+
+		self.pool = Pool(workers or len(self.placements), fnInitWorker, (self.windows, self.stages, threshold, dtype))
+
+	def fnAppend(self, placement, sample, offset = None, scale = None):
+		"""
+		Purpose:	Write one sample into a placement's window, from the ingest process only
+		Passed:		Placement the sample came from
+					Sample values
+					Optional offset subtracted from the sample
+					Optional scale multiplied onto the sample
+		"""
+
+		self.windows[placement].append(sample, offset, scale)
+
+	def fnCycle(self, placements = None):
+		"""
+		Purpose:	Classify placements with a full window and new samples on the worker pool
+		Passed:		Placements to classify (None for every placement)
+		Yields:		Placement, dictionary of model name to class label, cascade class label and
+					number of stages run, as soon as each placement finishes
+		"""
+
+		timeCycle = time.perf_counter()
+		tasks = []
+
+		for placement in self.placements if placements is None else placements:
+			sampleCount = self.windows[placement].sampleCount
+
+			if sampleCount < self.windows[placement].length:
+				continue
+
+			# Sensor stopped sending, do not classify the same window again
+			if sampleCount == self.sampleCounts[placement]:
+				self.windowsStale[placement] += 1
+				continue
+
+			self.sampleCounts[placement] = sampleCount
+			tasks.append((placement, timeCycle))
+
+		for placement, labels, decision, stagesRun, laps in self.pool.imap_unordered(fnClassifyPlacement, tasks):
+			timer = self.timers[placement]
+			for stage, seconds in laps:
+				timer.fnRecord(stage, seconds)
+			timer.fnRecord('Total', time.perf_counter() - timeCycle)
+			self.windowsClassified[placement] += 1
+
+			yield placement, labels, decision, stagesRun
+
+		self.cycles += 1
+		if time.perf_counter() - timeCycle > CYCLE_SECONDS:
+			self.cyclesLate += 1
+
+	def fnSummary(self, seconds):
+		"""
+		Purpose:	Format throughput and latency percentiles of every placement
+		Passed:		Seconds the counters cover
+		Returns:	Summary string
+		"""
+
+		lines = ['Cycles: {}, late: {}'.format(self.cycles, self.cyclesLate)]
+
+		for placement in self.placements:
+			p50, p95, p99 = self.timers[placement].fnPercentiles('Total')
+			lines.append('{}: {} windows, {:.2f} windows/s, stale: {}, latency p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms'.format(
+				placement, self.windowsClassified[placement], self.windowsClassified[placement] / max(seconds, 1e-9),
+				self.windowsStale[placement], p50 * 1e3, p95 * 1e3, p99 * 1e3))
+			lines.append(self.timers[placement].fnSummary())
+
+		return '\n'.join(lines)
+
+	def fnReport(self, force = False):
+		"""
+		Purpose:	Print the summary and clear the counters once the report interval has passed
+		Passed:		Report regardless of the interval
+		Returns:	True if a summary was printed
+		"""
+
+		seconds = time.perf_counter() - self.timeReported
+
+		if self.reportInterval is None and not force:
+			return False
+		if not force and seconds < self.reportInterval:
+			return False
+
+		print(self.fnSummary(seconds))
+		self.fnReset()
+
+		return True
+
+	def fnReset(self):
+		"""
+		Purpose:	Clear the histograms and counters of every placement
+		"""
+
+		for placement in self.placements:
+			self.timers[placement].fnReset()
+			self.windowsClassified[placement] = 0
+			self.windowsStale[placement] = 0
+		self.cycles = 0
+		self.cyclesLate = 0
+		self.timeReported = time.perf_counter()
+
+	def fnClose(self):
+		"""
+		Purpose:	Stop the worker pool and free the shared memory windows
+		"""
+
+		self.pool.terminate()
+		self.pool.join()
+
+		for window in self.windows.values():
+			window.fnClose()
+
+
+# FUNCTIONS
+
+def fnInitWorker(windows, stages, threshold, dtype = np.float64):
+	"""
+	Purpose:	Build each placement's filter and cascade in a worker process
+	Passed:		Dictionary of placement to shared window
+				Dictionary of placement to list of stages, each a list of model names from cascadeLib.MODELS
+				Cascade margin at or above which later stages are skipped
+				Float type of the windows, features and models
+	"""
+
+	for placement, window in windows.items():
+		sensorParam = SENSOR_PARAMS[placement]
+
+		# Already in memory when forked from the service, otherwise mapped from the compiled cache
+		models, scalers = fnLoadClassifiers(placement, stages[placement], dtype)
+
+		WORKER_STATE[placement] = {'Window': window,
+								   'Sos': fnDesignButter(sensorParam, dtype=dtype),
+								   'Filtered': np.zeros((sensorParam['wLength'], window.nAxes), dtype=dtype),
+								   'Cascade': ClModelCascade(stages[placement], models, scalers, placement, fnSessionFreqs(sensorParam),
+															 sensorParam['fSamp'], threshold, dtype)}
+
+def fnClassifyPlacement(task):
+	"""
+	Purpose:	Snapshot, filter and classify one placement's window in a worker process
+	Passed:		Placement and the perf_counter value the cycle started at
+	Returns:	Placement, dictionary of model name to class label, cascade class label,
+				number of stages run and list of (stage, seconds) laps
+	"""
+
+	placement, timeCycle = task
+	state = WORKER_STATE[placement]
+	laps = ClLapRecorder()
+
+	timeStage = laps.fnLap('Queue', timeCycle)
+
+	windowIMUraw = state['Window'].snapshot()
+	timeStage = laps.fnLap('Snapshot', timeStage)
+
+	fnFilterWindow(state['Sos'], windowIMUraw, state['Filtered'], PAD_LENGTH)
+	laps.fnLap('Filter', timeStage)
+
+	labels, decision, stagesRun = state['Cascade'].fnClassify(state['Filtered'], laps)
+
+	return placement, labels, decision, stagesRun, laps.laps
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	from sessionLib import fnLoadSession
+
+	parser = argparse.ArgumentParser(description='Replay recorded sessions through the multi-placement service as fast as it runs.')
+	parser.add_argument('sessions', nargs='+', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--workers', type=int, default=POOL_WORKERS, help='worker processes shared by all placements')
+	parser.add_argument('--models', nargs='+', default=list(MODELS), help='models run on every window')
+	args = parser.parse_args()
+
+	# One session per placement
+	sessions = {}
+	for session in args.sessions:
+		placement, path = session.split('=', 1) if '=' in session else (None, session)
+		samples, placement, terrain = fnLoadSession(path, placement)
+		sessions[placement] = samples
+
+	service = ClPlacementService(list(sessions), [args.models], workers=args.workers, reportInterval=None)
+
+	# Each cycle feeds CYCLE_SECONDS of every placement's samples
+	cycleSamples = {placement: int(round(CYCLE_SECONDS * SENSOR_PARAMS[placement]['fSamp'])) for placement in sessions}
+	nCycles = min(len(samples) // cycleSamples[placement] for placement, samples in sessions.items())
+
+	timeStart = time.perf_counter()
+	timeClassifying = 0.0
+
+	for cycle in range(nCycles):
+		for placement, samples in sessions.items():
+			for sample in samples[cycle * cycleSamples[placement]:(cycle + 1) * cycleSamples[placement]]:
+				service.fnAppend(placement, sample)
+
+		timeCycle = time.perf_counter()
+		for result in service.fnCycle():
+			pass
+		timeClassifying += time.perf_counter() - timeCycle
+
+	seconds = time.perf_counter() - timeStart
+	print(service.fnSummary(seconds))
+	print('{} cycles of {:.1f} s in {:.2f} s ({:.2f} s classifying), {:.0f}x real time'.format(
+		nCycles, CYCLE_SECONDS, seconds, timeClassifying, nCycles * CYCLE_SECONDS / max(timeClassifying, 1e-9)))
+
+	service.fnClose()
@@ -0,0 +1,119 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library reads recorded data collection sessions
+				back into the form the real-time classifier sees, so models
+				and pipeline changes can be evaluated offline.
+
+				Sessions are the csv files written by fnSaveData and
+				fnSaveSynthesis, named '{Placement}_{terrain}_{Device}'.
+				Windows are cut with the classifier's padding and hop and
+				filtered the same way as ClTerrainClassifier.
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import pandas as pd
+import os, re
+
+from filterLib import fnDesignButter, fnFilterWindowBatch
+from featuresLib import BATCH_CHUNK
+from configLib import PAD_LENGTH
+
+# DEFINITIONS
+
+# Recorded columns in DATA_COLUMNS order, already in m/s^2 and rad/s
+SESSION_COLUMNS = ['ACCELEROMETER X (m/s²)', 'ACCELEROMETER Y (m/s²)', 'ACCELEROMETER Z (m/s²)',
+				   'GYROSCOPE X (rad/s)', 'GYROSCOPE Y (rad/s)', 'GYROSCOPE Z (rad/s)']
+
+# Column prefix of each wheel in synthesis files
+SYNTHESIS_PREFIX = {'Left': 'L ', 'Right': 'R '}
+
+# Gravity removed from recorded samples, as IMU_OFFSET does in real time
+SESSION_OFFSET = np.array([0, 0, 9.8, 0, 0, 0])
+
+# '{Placement}_{terrain}_{Device}' with an optional sensor suffix such as 6050
+SESSION_PATTERN = re.compile(r'^(?P<placement>[^_]+)_(?P<terrain>.+)_(?P<device>[A-Za-z]+?)(?P<sensor>\d*)$')
+
+# FUNCTIONS
+
+def fnParseSessionName(path):
+	"""
+	Purpose:	Read placement, terrain and device from a session file name
+	Passed:		Session csv path
+	Returns:	Dictionary of 'Placement', 'Terrain' and 'Device' (None if the name does not match)
+	"""
+
+	match = SESSION_PATTERN.match(os.path.splitext(os.path.basename(path))[0])
+
+	if match is None:
+		return None
+
+	return {'Placement': match.group('placement'), 'Terrain': match.group('terrain'), 'Device': match.group('device')}
+
+def fnLoadSession(path, placement = None):
+	"""
+	Purpose:	Load the six IMU axes of a recorded session with gravity removed
+	Passed:		Session csv path
+				Placement to read from a synthesis file ('Left' or 'Right'), otherwise
+				taken from the file name
+	Returns:	(n_samples, 6) array, placement, terrain
+	"""
+
+	session = fnParseSessionName(path)
+	terrain = session['Terrain'] if session else None
+	if placement is None:
+		placement = session['Placement'] if session else 'Middle'
+
+	data = pd.read_csv(path)
+
+	columns = SESSION_COLUMNS
+	if SYNTHESIS_PREFIX['Left'] + SESSION_COLUMNS[0] in data.columns:
+		if placement not in SYNTHESIS_PREFIX:
+			raise ValueError('Synthesis session {} needs placement Left or Right'.format(path))
+		columns = [SYNTHESIS_PREFIX[placement] + column for column in SESSION_COLUMNS]
+
+	samples = data[columns].to_numpy(dtype=np.float64)
+	samples -= SESSION_OFFSET
+
+	return samples, placement, terrain
+
+def fnSessionWindows(samples, sensorParam, hopSamples):
+	"""
+	Purpose:	View every padded classification window of a session, one per hop once
+				the window has filled, as ClTerrainClassifier schedules them
+	Passed:		(n_samples, 6) session array
+				Sensor parameter dictionary
+				Samples between classifications
+	Returns:	(n_windows, wLength + 2 * PAD_LENGTH, 6) read-only view
+	"""
+
+	length = sensorParam['wLength'] + 2 * PAD_LENGTH
+
+	if len(samples) < length:
+		return np.zeros((0, length, samples.shape[1]))
+
+	windows = np.lib.stride_tricks.sliding_window_view(samples, length, axis=0)[::hopSamples]
+
+	return windows.transpose(0, 2, 1)
+
+def fnFilterWindows(windows, sensorParam, out = None, chunk = BATCH_CHUNK):
+	"""
+	Purpose:	Zero-phase filter each padded window on its own, as done in real time,
+				a block of windows per call
+	Passed:		(n_windows, padded length, 6) windows
+				Sensor parameter dictionary
+				Optional (n_windows, wLength, 6) output array
+				Windows filtered per call, bounding the temporary arrays
+	Returns:	(n_windows, wLength, 6) filtered windows
+	"""
+
+	sos = fnDesignButter(sensorParam)
+
+	if out is None:
+		out = np.zeros((len(windows), sensorParam['wLength'], windows.shape[2]))
+
+	for start in range(0, len(windows), chunk):
+		fnFilterWindowBatch(sos, windows[start:start + chunk], out[start:start + chunk], PAD_LENGTH)
+
+	return out
@@ -9,9 +9,13 @@ Purpose:        This Python script should autostart when the Raspberry Pi is fir
 
 # IMPORTED LIBRARIES
 
+import time
+
+# Reference for reporting boot time to first classification
+PROCESS_START = time.perf_counter()
+
 import smbus
 import math
-import time
 import datetime
 import os
 import sys
@@ -19,15 +23,9 @@ import socket
 
 import pickle as pkl
 import numpy as np
-from scipy import signal, stats
-import pandas as pd
-import sklearn
-from sklearn.preprocessing import scale
-import pickle as pkl
-from joblib import load, dump
 
 from cobs import cobs
-from multiprocessing import Process, Queue
+from multiprocessing import Process, Queue, Event, RawValue, get_context
 from threading import Thread
 
 # LOCALLY IMPORTED LIBRARIES
@@ -43,6 +41,13 @@ from featuresLib import *
 from IMUSensorLib import *
 from USSSensorLib import *
 from PiCamSensorLib import *
+from ringBufferLib import ClRingBuffer, ClSharedRingBuffer
+from filterLib import fnDesignButter, fnFilterWindow
+from timingLib import ClStageTimer
+from cascadeLib import ClModelCascade, fnLoadClassifiers, fnAvailableStages, ALL_STAGES, CASCADE_STAGES, CASCADE_THRESHOLD
+from activityLib import ClActivityDetector, fnLoadNoiseFloor
+from serviceLib import ClPlacementService
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, TERRAINS, fnNumberOfBins, fnSessionFreqs
 
 # DEFINITIONS
 
@@ -59,31 +64,51 @@ ACTIVE_SENSORS = [1]
 
 # Direction Vectors
 STD_COLUMNS = ['X Accel', 'Y Accel', 'Z Accel', 'X Gyro', 'Y Gyro', 'Z Gyro', 'Run Time', 'Epoch Time']
-DATA_COLUMNS =  ['X Accel', 'Y Accel', 'Z Accel', 'X Gyro', 'Y Gyro', 'Z Gyro']
 
 EPSILON = 0.00001 # For small float values
 
-FRAME_MODULE = {'wLength': 300, 'fSamp': 300, 'fLow': 55, 'fHigh': 1}
-WHEEL_MODULE = {'wLength': 333, 'fSamp': 333.3, 'fLow': 60, 'fHigh': 1}
+# Placements classified, several share one ClPlacementService (i.e. ['Middle', 'Left', 'Right'] with ACTIVE_SENSORS [1, 5, 6])
+PLACEMENTS = ['Middle']
+
+# Offset and scale converting raw IMU samples (gravity removed, deg/s to rad/s)
+IMU_OFFSET = np.array([0, 0, 9.8, 0, 0, 0])
+IMU_SCALE = np.array([1, 1, 1, math.pi/180, math.pi/180, math.pi/180])
+
+# Offset and scale of each placement's samples, the wheel modules already send rad/s
+PLACEMENT_INPUTS = {'Middle': (IMU_OFFSET, IMU_SCALE), 'Left': (IMU_OFFSET, None), 'Right': (IMU_OFFSET, None)}
 
-PAD_LENGTH = 15 # pad length to let filtering be better
-N_BINS_OVER_CUTOFF = 5 # Collect some information from attenuated frequencies bins
+# Classification runs after every configLib.HOP_SAMPLES new samples
+# When a hop arrives mid-classification, 'coalesce' queues one run on the newest window, 'skip' drops it
+SCHEDULE_POLICY = 'coalesce'
 
-# DICTIONARIES
+# Run only the time forest first and the spectral forests when its margin is below CASCADE_THRESHOLD,
+# instead of every model on every window
+CASCADE_MODE = False
 
-# Time domain feature functions and names
-TIME_FEATURES = {'Mean': np.mean, 'Std': np.std,  'Norm': l2norm, 'AC': autocorr, 
-                 'Max': np.amax, 'Min' : np.amin, 'RMS': rms, 'ZCR': zcr, 
-                 'Skew': stats.skew, 'EK': stats.kurtosis}
+# Suspend classification while the chair is parked, using the noise floor saved by fnCalibrate
+STATIONARY_GATING = True
+NOISE_FLOOR_PATH = 'IMU6050Noise.pkl'
 
-TIME_FEATURES_NAMES = ['Mean', 'Std', 'Norm', 'AC', 'Max', 'Min', 'RMS', 'ZCR', 'Skew', 'EK']
+# Run classification in a separate 'process' over a shared memory window, or in a 'thread' of the ingest process
+CLASSIFIER_MODE = 'process'
 
-# Time domain feature functions and names           
-FREQ_FEATURES = freq_features = {'MSF': msf, 'RMSF': rmsf, 'FC': fc, 'VF': vf, 'RVF': rvf}
+# The classifier process is forked so it inherits the loaded models, the connected socket and the
+# shared window lock, whatever the platform's default start method (spawn or forkserver would fail
+# to pickle the socket and reload every model)
+CLASSIFIER_CONTEXT = get_context('fork')
 
-FREQ_FEATURES_NAMES = ['MSF', 'RMSF', 'FC', 'VF', 'RVF']
+# Float type of the window, filter, features, scalers and models, np.float32 halves the memory
+# traffic of every stage (see precisionReport.py for its parity against np.float64 on recorded sessions)
+PIPELINE_DTYPE = np.float64
 
-TERRAINS = ['Concrete', 'Carpet', 'Linoleum', 'Asphalt', 'Sidewalk', 'Grass', 'Gravel']
+# Classification loop stages timed, seconds between printed summaries, optional raw timing csv
+TIMING_STAGES = ['Snapshot', 'Filter', 'Time Features', 'PSD', 'Freq Features',
+				 'SVM Time', 'SVM Freq', 'SVM PSD', 'RF Time', 'RF Freq', 'RF PSD', 'Send']
+TIMING_REPORT_INTERVAL = 30
+TIMING_DUMP_PATH = None
+
+# Ingest loop stages timed, to compare sample jitter between classifier modes
+INGEST_STAGES = ['Ingest Interval', 'Sample Age']
 
 # CLASSES
 
@@ -98,60 +123,94 @@ class ClTerrainClassifier:
 		Passed: 	Nothing
 		"""
 		
-		# Middle
-		self.placement = 'Middle'
-		self.sensorParam = FRAME_MODULE
-
-		# Left
-		#~ self.placement = 'Left'
-		#~ self.sensorParam = WHEEL_MODULE
+		self.timeCreated = time.perf_counter()
+		self.firstClassification = True
 		
-		#~ # Right
-		#~ self.placement = 'Right'
-		#~ self.sensorParam = WHEEL_MODULE
+		# First placement, the only one unless several run on the placement service
+		self.placement = PLACEMENTS[0]
+		self.sensorParam = SENSOR_PARAMS[self.placement]
 		
-		# Calculates the number of bins available
-		nbins = int(self.sensorParam['wLength'] / self.sensorParam['fSamp'] *self.sensorParam['fLow'] + N_BINS_OVER_CUTOFF)
-			
-		print('unpickling')
-		
-		#~ randomForestTime = pkl.load(open(os.path.join(dir_path, 'models', 'RandomForest_Middle_TimeFeats.pkl'), 'rb'))
-		#~ self.SVMTime = load('models/SupportVectorMachine_Middle_TimeFeats.joblib')
-		#~ self.SVMFreq = load('models/SupportVectorMachine_Middle_FreqFeats.joblib')
-		#~ self.SVMPSD = load('models/SupportVectorMachine_Middle_PSDLogs.joblib')
-
-		self.RFTime = load('models/RandomForest_Middle_TimeFeats.joblib')
-		self.RFFreq = load('models/RandomForest_Middle_FreqFeats.joblib')
-		self.RFPSD = load('models/RandomForest_Middle_PSDLogs.joblib')
-
-		self.timeScaler = load('scalers/Middle_TimeFeats_Scaler.joblib')
-		self.freqScaler = load('scalers/Middle_FreqFeats_Scaler.joblib')
-		self.psdlScaler = load('scalers/Middle_PSDLogs_Scaler.joblib')
-
-		# Prepopulate pandas dataframe
-		EFTimeColumnNames = ['{} {} {}'.format(featName, direction, self.placement) for direction in DATA_COLUMNS for featName in TIME_FEATURES_NAMES]
-		self.EFTimeColumnedFeatures = pd.DataFrame(data = np.zeros((1,len(EFTimeColumnNames))), columns = EFTimeColumnNames)
-		EFFreqColumnNames = ['{} {} {}'.format(featName, direction, self.placement) for direction in DATA_COLUMNS for featName in FREQ_FEATURES_NAMES]
-		self.EFFreqColumnedFeatures = pd.DataFrame(data = np.zeros((1,len(EFFreqColumnNames))), columns = EFFreqColumnNames)
-		self.protocol = protocol
+		# Only include frequency bins up to and a little bit past the cutoff frequency
+		# Everything past that is useless because its the same on all terrains
+		self.nBins = fnNumberOfBins(self.sensorParam)
+		self.freqs = fnSessionFreqs(self.sensorParam)
 		
+		self.protocol = protocol
 		
+		# Connect first, so a failed attempt has no worker pool or shared memory to release
 		if self.protocol == 'TCP':
 			self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 			self.socket.settimeout(10)
 			self.socket.connect((HOST, PORT))
 			print('Connected.')
+			
+		print('loading models')
+
+		# Support vector machines are reduced to support vectors and one-vs-one coefficients,
+		# random forests are flattened into node arrays, scalers into contiguous arrays
+		stages = CASCADE_STAGES if CASCADE_MODE else ALL_STAGES
 		
+		# Several placements each keep their own window, filter and models on one shared worker pool
+		self.service = None
+		if len(PLACEMENTS) > 1:
+			self.service = ClPlacementService(PLACEMENTS, stages, CASCADE_THRESHOLD if CASCADE_MODE else None,
+											  reportInterval = TIMING_REPORT_INTERVAL, dtype = PIPELINE_DTYPE)
+		else:
+			# Only the models trained for this placement, a missing model drops out of its stage
+			stages = fnAvailableStages(self.placement, stages)
+			models, scalers = fnLoadClassifiers(self.placement, stages, PIPELINE_DTYPE)
+
+			# Every stage plans only the features its models read
+			self.cascade = ClModelCascade(stages, models, scalers, self.placement, self.freqs, self.sensorParam['fSamp'],
+										  CASCADE_THRESHOLD if CASCADE_MODE else None, PIPELINE_DTYPE)
+			for stage in self.cascade.stages:
+				print(stage['Plan'].fnSummary())
+
 		# Initialize data queue and marker to pass for separate prcoesses
 		self.dataQueue = Queue()
 		self.runMarker= Queue()
 		
-		# Create class variables
-		self.windowIMUraw = np.zeros((self.sensorParam['wLength'] + 2 * PAD_LENGTH, 6))
-		self.windowIMUfiltered = np.zeros((self.sensorParam['wLength'], 6))
-		self.windowIMUPSD = np.zeros([])
-		self.windowIMULogPSD = np.zeros([])
-		self.windowIMULogPSDFeatures = np.zeros([])
+		# Create class variables, the placement service keeps its own window, filter and output per placement
+		if self.service is not None:
+			self.windows = self.service.windows
+		else:
+			if CLASSIFIER_MODE == 'process':
+				self.windowIMUraw = ClSharedRingBuffer(self.sensorParam['wLength'] + 2 * PAD_LENGTH, dtype = PIPELINE_DTYPE,
+													   context = CLASSIFIER_CONTEXT)
+			else:
+				self.windowIMUraw = ClRingBuffer(self.sensorParam['wLength'] + 2 * PAD_LENGTH, dtype = PIPELINE_DTYPE)
+			self.windowIMUfiltered = np.zeros((self.sensorParam['wLength'], 6), dtype = PIPELINE_DTYPE)
+			self.sos = fnDesignButter(self.sensorParam, dtype = PIPELINE_DTYPE)
+			self.windows = {self.placement: self.windowIMUraw}
+		
+		# Sample-count driven scheduling state and counters, shared with the classifier process
+		# The placement service also keeps which placements have a window pending
+		self.classifyTrigger = Event()
+		self.classifyBusy = RawValue('b', 0)
+		self.classifyPending = {placement: False for placement in PLACEMENTS}
+		self.samplesSinceHop = {placement: 0 for placement in PLACEMENTS}
+		self.windowsScheduled = RawValue('q', 0)
+		self.windowsSkipped = RawValue('q', 0)
+		self.windowsCoalesced = RawValue('q', 0)
+		self.windowsLate = RawValue('q', 0)
+		
+		# Activity detection of every placement on the ingest side, the classifier reports 'Stationary' while it is set
+		# The frame IMU's calibrated noise floor is the only one, the wheel modules are gated against it too
+		noiseStd = fnLoadNoiseFloor(NOISE_FLOOR_PATH, IMU_SCALE) if STATIONARY_GATING else None
+		self.activityDetectors = {placement: ClActivityDetector(noiseStd) for placement in PLACEMENTS} if noiseStd is not None else {}
+		self.stationary = {placement: RawValue('b', 0) for placement in PLACEMENTS}
+		self.windowsStationary = RawValue('q', 0)
+		if STATIONARY_GATING and noiseStd is None:
+			print('No noise floor at {}, stationary gating disabled until the IMU is calibrated'.format(NOISE_FLOOR_PATH))
+		
+		# Ingest jitter histograms and queue depth sampled every hop
+		self.ingestTimer = ClStageTimer(INGEST_STAGES, TIMING_REPORT_INTERVAL)
+		self.queueDepthMax = 0
+		self.queueDepthSum = 0
+		self.queueDepthCount = 0
+		
+		# Per-stage latency histograms of the classification loop
+		self.timer = ClStageTimer(TIMING_STAGES, TIMING_REPORT_INTERVAL, TIMING_DUMP_PATH)
 				
 		# Create dictionary to house various active sensors and acivate specified sensors
 		self.instDAQLoop = {} 
@@ -179,8 +238,14 @@ class ClTerrainClassifier:
 
 		print('Start Process.')
 		
-		# Start terrain classification in separate thread
-		terrain = Thread(target=self.fnTerrainClassification, args = (0.5, ))
+		# Start terrain classification in a separate process (forked, sharing the socket) or thread,
+		# the placement service dispatches the scheduled placements to its own worker pool from a thread
+		if self.service is not None:
+			terrain = Thread(target=self.fnServiceClassification)
+		elif CLASSIFIER_MODE == 'process':
+			terrain = CLASSIFIER_CONTEXT.Process(target=self.fnTerrainClassification, args = (HOP_SAMPLES, ))
+		else:
+			terrain = Thread(target=self.fnTerrainClassification, args = (HOP_SAMPLES, ))
 		terrain.start()
 		
 		timeStart = time.time()
@@ -193,67 +258,288 @@ class ClTerrainClassifier:
 			processes[SENSOR_LIST[sensor]] = Process(target=self.instDAQLoop[SENSOR_LIST[sensor]].fnRun, args = (frequency, ))
 			processes[SENSOR_LIST[sensor]].start()
 
+		timeIngest = time.perf_counter()
+
 		#Keep collecting data and updating rolling window
 		while True:
 
 			transmissionData = self.dataQueue.get()
 
 			if transmissionData[0] in ['IMU_6', 'WHEEL']:
-				self.windowIMUraw = np.roll(self.windowIMUraw, -1, axis=0)
-				self.windowIMUraw[-1, :] = np.multiply(np.subtract(transmissionData[2:8], [0, 0, 9.8, 0, 0, 0]), [1, 1, 1, math.pi/180, math.pi/180, math.pi/180]) 
+				
+				# Wheel modules tag their samples with their placement
+				placement = transmissionData[8] if transmissionData[0] == 'WHEEL' else 'Middle'
+				if placement not in PLACEMENTS:
+					continue
+				
+				# Time between ingested samples and age of each sample when it reaches the window
+				timeIngest = self.ingestTimer.fnLap('Ingest Interval', timeIngest)
+				self.ingestTimer.fnRecord('Sample Age', time.time() - transmissionData[1])
+				
+				window = self.windows[placement]
+				window.append(transmissionData[2:8], *PLACEMENT_INPUTS[placement])
+				
+				# Trigger classification every hop of each placement once its window has filled
+				self.samplesSinceHop[placement] += 1
+				if self.samplesSinceHop[placement] >= HOP_SAMPLES and window.sampleCount >= window.length:
+					self.samplesSinceHop[placement] = 0
+					if not self.fnCheckStationary(placement):
+						self.fnScheduleClassification(placement)
+					self.fnSampleQueueDepth()
 			elif transmissionData[0] in ['USS_DOWN', 'USS_FORW']:
 				pass
 			elif transmissionData[0] in ['PI_CAM']:
 				pass
 
-	def fnTerrainClassification(self, waitTime):
+	def fnSampleQueueDepth(self):
 		"""
-		Purpose:	Class method for running terrain classification
-		Passed:		Time in between runs
+		Purpose:	Track the data queue backlog and periodically report it with the ingest jitter
+		Passed:		None
 		"""
 		
-		index = 0
+		queueDepth = self.dataQueue.qsize()
+		self.queueDepthMax = max(self.queueDepthMax, queueDepth)
+		self.queueDepthSum += queueDepth
+		self.queueDepthCount += 1
+		
+		if self.ingestTimer.fnReport():
+			print('Queue depth mean: {:.1f}, max: {}'.format(self.queueDepthSum / self.queueDepthCount, self.queueDepthMax))
+			self.queueDepthMax = 0
+			self.queueDepthSum = 0
+			self.queueDepthCount = 0
+
+	def fnCheckStationary(self, placement):
+		"""
+		Purpose:	Update a placement's activity detector with its newest hop and suspend or
+					resume its classification when it stops or starts moving
+		Passed:		Placement the hop came from
+		Returns:	True while the placement is stationary and its classification is suspended
+		"""
+		
+		activityDetector = self.activityDetectors.get(placement)
+		if activityDetector is None:
+			return False
+		
+		wasStationary = activityDetector.stationary
+		stationary = activityDetector.fnUpdate(self.windows[placement].recent(HOP_SAMPLES))
+		
+		if stationary:
+			self.windowsStationary.value += 1
+			
+			# Wake the classifier once so it reports the stationary state
+			if not wasStationary:
+				self.stationary[placement].value = 1
+				self.classifyPending[placement] = True
+				self.classifyTrigger.set()
+		elif wasStationary:
+			self.stationary[placement].value = 0
+		
+		return stationary
+
+	def fnScheduleClassification(self, placement):
+		"""
+		Purpose:	Request a classification of a placement's current window from the ingest side,
+					skipping or coalescing it when the previous one is still running
+		Passed:		Placement whose hop completed
+		"""
+		
+		self.windowsScheduled.value += 1
+		
+		# The classifier process only sees the trigger, the service thread also sees each placement's flag
+		pending = self.classifyTrigger.is_set() if self.service is None else self.classifyPending[placement]
+		
+		if self.classifyBusy.value or pending:
+			if SCHEDULE_POLICY == 'skip':
+				self.windowsSkipped.value += 1
+				return
+			
+			# A run is already pending or will be, it picks up the newest window
+			if pending:
+				self.windowsCoalesced.value += 1
+		
+		self.classifyPending[placement] = True
+		self.classifyTrigger.set()
+
+	def fnTerrainClassification(self, hopSamples):
+		"""
+		Purpose:	Class method for running terrain classification whenever the
+					ingest side schedules a window
+		Passed:		Number of new samples between classifications
+		"""
+		
+		# CPU time of this loop, reported as the share of one core
+		self.cpuReported = time.thread_time()
+		self.timeCpuReported = time.perf_counter()
 		
 		# Keep running until run marker tells to terminate
-		while self.runMarker:
+		while self.runMarker.empty():
 			
-			print(time.perf_counter())
+			# Wake periodically so termination is still noticed without data
+			if not self.classifyTrigger.wait(1):
+				self.fnReportTiming()
+				continue
+			self.classifyTrigger.clear()
 			
-			# Filter window
-			self.fnFilterButter(self.windowIMUraw)
+			# Parked, report it once and leave the pipeline idle
+			if self.stationary[self.placement].value:
+				try:
+					self.socket.sendall('Stationary'.encode())
+				except Exception as e:
+					print(e)
+					break
+				continue
+			
+			self.classifyBusy.value = 1
 			
-			# Build extracted feature vector
-			self.fnBuildTimeFeatures(TIME_FEATURES_NAMES)
+			sampleStart = self.windowIMUraw.sampleCount
+			timeStage = time.perf_counter()
 			
-			# Build PSD and PSD features
-			self.fnBuildPSD(self.windowIMUfiltered)
-			self.fnBuildFreqFeatures(FREQ_FEATURES_NAMES)
+			# Take a consistent chronological copy of the window
+			windowIMUraw = self.windowIMUraw.snapshot()
+			timeStage = self.timer.fnLap('Snapshot', timeStage)
 			
-			#~ terrainTypeSVMTime = self.SVMTime.predict(self.EFTimeColumnedFeatures)
-			#~ terrainTypeSVMFreq = self.SVMFreq.predict(self.EFFreqColumnedFeatures)
-			#~ terrainTypeSVMPSD = self.SVMPSD.predict(self.windowIMULogPSDFeatures)
+			# Filter window
+			self.fnFilterButter(windowIMUraw)
+			timeStage = self.timer.fnLap('Filter', timeStage)
 			
-			#~ self.socket.sendall('Time: {0:>8s} \nFreq: {1:>8s} \nPSD:  {2:>8s}'.format(TERRAINS[terrainTypeSVMTime[0]], TERRAINS[terrainTypeSVMFreq[0]], TERRAINS[terrainTypeSVMPSD[0]]).encode())
+			# Build the planned features and run the models, stage by stage
+			labels, decision, stagesRun = self.cascade.fnClassify(self.windowIMUfiltered, self.timer)
+			timeStage = time.perf_counter()
 			
-			terrainTypeRFTime = self.RFTime.predict(self.EFTimeColumnedFeatures)
-			terrainTypeRFFreq = self.RFFreq.predict(self.EFFreqColumnedFeatures)
-			terrainTypeRFPSD = self.RFPSD.predict(self.windowIMULogPSDFeatures)
 			try:
-				self.socket.sendall('Time: {0:>8s}     Freq: {1:>8s}     PSD:  {2:>8s}'.format(TERRAINS[terrainTypeRFTime[0]], TERRAINS[terrainTypeRFFreq[0]], TERRAINS[terrainTypeRFPSD[0]]).encode())
+				self.socket.sendall(self.fnFormatMessage(labels, decision).encode())
 			except Exception as e:
 				print(e)
 				break
+			self.timer.fnLap('Send', timeStage)
 			
-			#~ self.socket.sendall('Time (RF):  {0:>8s} \nTime (SVM): {1:>8s}'.format(TERRAINS[terrainTypeRFTime[0]], TERRAINS[terrainTypeSVMTime[0]]).encode())
+			# Late when the next hop was already due before this window finished
+			if self.windowIMUraw.sampleCount - sampleStart >= hopSamples:
+				self.windowsLate.value += 1
+			self.classifyBusy.value = 0
 			
-			#~ print('Time: {0:>8s} \nFreq: {1:>8s} \nPSD:  {2:>8s} \n'.format(TERRAINS[terrainTypeSVMTime[0]], TERRAINS[terrainTypeSVMFreq[0]], TERRAINS[terrainTypeSVMPSD[0]]))
-			#~ print('Time: {0:>8s} \nFreq: {1:>8s} \nPSD:  {2:>8s} \n'.format(TERRAINS[terrainTypeRFTime[0]], TERRAINS[terrainTypeRFFreq[0]], TERRAINS[terrainTypeRFPSD[0]]))
+			# Periodically print p50/p95/p99 of every stage and the scheduling counters
+			self.fnReportTiming()
 			
-			#~ print('Time: {}'.format(TERRAINS[terrainTypeSVMTime[0]]))
-			#~ print('Freq: {}'.format(TERRAINS[terrainTypeSVMFreq[0]]))
-			#~ print('PSD:  {}'.format(TERRAINS[terrainTypeSVMPSD[0]]))
+			if self.firstClassification:
+				self.firstClassification = False
+				print('First classification {:.2f} s after process start, {:.2f} s after connection attempt'.format(
+					time.perf_counter() - PROCESS_START, time.perf_counter() - self.timeCreated))
+		
+	def fnServiceClassification(self):
+		"""
+		Purpose:	Thread method running the placement service on the placements the
+					ingest side schedules, every hop of each
+		Passed:		None
+		"""
+		
+		# CPU time of this loop, reported as the share of one core
+		self.cpuReported = time.thread_time()
+		self.timeCpuReported = time.perf_counter()
+		
+		# Keep running until run marker tells to terminate
+		while self.runMarker.empty():
+			
+			# Wake periodically so termination is still noticed without data
+			if not self.classifyTrigger.wait(1):
+				self.fnReportTiming()
+				continue
+			self.classifyTrigger.clear()
 			
-			time.sleep(waitTime - (time.perf_counter() % waitTime))
+			# Placements scheduled since the last cycle, a later hop is picked up by the next one
+			placements = [placement for placement in PLACEMENTS if self.classifyPending[placement]]
+			for placement in placements:
+				self.classifyPending[placement] = False
+			
+			# Parked placements report it once and leave their pipeline idle
+			for placement in [placement for placement in placements if self.stationary[placement].value]:
+				try:
+					self.socket.sendall('{}\nStationary'.format(placement).encode())
+				except Exception as e:
+					print(e)
+					return
+			placements = [placement for placement in placements if not self.stationary[placement].value]
+			
+			# A failed send ends the thread as it ends the single placement loop, the pool is stopped on shut down
+			self.classifyBusy.value = 1
+			cycle = self.service.fnCycle(placements)
+			try:
+				for result in cycle:
+					if not self.fnSendPlacement(*result):
+						return
+			finally:
+				cycle.close()
+				self.classifyBusy.value = 0
+			
+			# Periodically print every placement's latencies and the scheduling counters
+			self.fnReportTiming()
+		
+	def fnFormatMessage(self, labels, decision):
+		"""
+		Purpose:	Format the terrain of every model for the server
+		Passed:		Dictionary of model name to class label (models that did not run absent)
+					Cascade class label
+		Returns:	Message string
+		"""
+		
+		# Models that did not run are shown as '-'
+		terrainTypes = {stage: TERRAINS[label] for stage, label in labels.items()}
+		message = 'RF   Time: {0:>8s}  Freq: {1:>8s}  PSD: {2:>8s}\nSVM  Time: {3:>8s}  Freq: {4:>8s}  PSD: {5:>8s}'.format(
+			*[terrainTypes.get(stage, '-') for stage in ['RF Time', 'RF Freq', 'RF PSD', 'SVM Time', 'SVM Freq', 'SVM PSD']])
+		if CASCADE_MODE:
+			message += '\nCascade: {}'.format(TERRAINS[decision])
+		
+		return message
+		
+	def fnSendPlacement(self, placement, labels, decision, stagesRun):
+		"""
+		Purpose:	Send one placement's terrains from the placement service, headed by the placement
+		Passed:		Placement
+					Dictionary of model name to class label
+					Cascade class label
+					Number of cascade stages run
+		Returns:	False if the send failed
+		"""
+		
+		try:
+			self.socket.sendall('{}\n{}'.format(placement, self.fnFormatMessage(labels, decision)).encode())
+		except Exception as e:
+			print(e)
+			return False
+		
+		if self.firstClassification:
+			self.firstClassification = False
+			print('First classification {:.2f} s after process start, {:.2f} s after connection attempt'.format(
+				time.perf_counter() - PROCESS_START, time.perf_counter() - self.timeCreated))
+		
+		return True
+		
+	def fnReportTiming(self):
+		"""
+		Purpose:	Print the stage latencies, scheduling counters and classifier CPU use
+					once the report interval has passed
+		Passed:		None
+		"""
+		
+		if self.service is not None:
+			if not self.service.fnReport():
+				return
+		elif not self.timer.fnReport():
+			return
+		
+		print('Windows scheduled: {}, skipped: {}, coalesced: {}, late: {}, stationary: {}'.format(
+			self.windowsScheduled.value, self.windowsSkipped.value, self.windowsCoalesced.value, self.windowsLate.value,
+			self.windowsStationary.value))
+		
+		cpuNow = time.thread_time()
+		timeNow = time.perf_counter()
+		print('Classifier CPU: {:.1%} of one core'.format((cpuNow - self.cpuReported) / (timeNow - self.timeCpuReported)))
+		self.cpuReported = cpuNow
+		self.timeCpuReported = timeNow
+		
+		if CASCADE_MODE and self.service is None:
+			print(self.cascade.fnSummary())
+			self.cascade.fnReset()
 		
 	def fnShutDown(self):
 		
@@ -263,6 +549,12 @@ class ClTerrainClassifier:
 			self.sock.close()
 		except Exception as e:
 			print(e)
+		
+		# Stop the worker pool and free the shared memory windows
+		if self.service is not None:
+			self.service.fnClose()
+		elif CLASSIFIER_MODE == 'process':
+			self.windowIMUraw.fnClose()
 
 	def fnFilterButter(self, dataWindow):
 		"""
@@ -271,82 +563,8 @@ class ClTerrainClassifier:
 		Passed:		Rolling raw IMU data
 		"""
 		
-		# Get normalized frequencies
-		w_low = self.sensorParam['fLow'] / (self.sensorParam['fSamp'] / 2) 
-		w_high = self.sensorParam['fHigh'] / (self.sensorParam['fSamp'] / 2)
-
-		# Get Butterworth filter parameters
-		b_butter, a_butter = signal.butter(N=4, Wn=w_low, btype='low')
-		
-		dataSet = np.copy(dataWindow)
-		
-		# Filter all the data columns
-		for i in range(6):
-			self.windowIMUfiltered[:, i] = signal.filtfilt(b_butter, a_butter, dataSet[:, i])[PAD_LENGTH:self.sensorParam['wLength']+PAD_LENGTH]
-		
-		print('filtered!')
-			
-	def fnBuildPSD(self, dataWindow):
-		"""
-		Purpose:	Builds power spectrum densities for each direction
-		Passed:		Filtered IMU data
-		"""
-		
-		# Only include frequency bins up to and a little bit past the cutoff frequency
-		# Everything past that is useless because its the same on all terrains
-		n_bins = int(self.sensorParam['wLength'] / self.sensorParam['fSamp'] * self.sensorParam['fLow']) + N_BINS_OVER_CUTOFF
-		windowIMUPSD = np.zeros((n_bins, 6))
-		windowIMULogPSD = np.zeros((n_bins, 6))
-
-		# Calculate PSD for each axes
-		for i in range(6):
-			# Normalized PSD - Returns frequencies and power density
-			freq, Pxx = signal.periodogram(dataWindow[:, i], self.sensorParam['fSamp'])
-			windowIMUPSD[:, i] = np.resize(Pxx[1:], n_bins)
-			
-			# Calculate log10 of PSD, replacing points where PSD = 0 with 0 to avoid division by 0
-			for j in range(len(windowIMUPSD[:, i])):
-				if (windowIMUPSD[j, i] == 0):
-					windowIMULogPSD[j, i] = 0
-				else:
-					windowIMULogPSD[j, i] = np.log10(windowIMUPSD[j, i])
-			
-		# Append freq column
-		freq_col = np.transpose([np.resize(freq[:-1], n_bins)])
-		self.windowIMUPSD = np.append(windowIMUPSD, freq_col, axis=1)
-		self.windowIMULogPSD = np.append(windowIMULogPSD, freq_col, axis=1)
-		
-		colNames = ['{} {} Hz {} {}'.format('PSDLog', round(freq[0]), direction, self.placement) for direction in DATA_COLUMNS for freq in freq_col]	
-		psdLogData = [self.windowIMULogPSD[i, j] for j in range(len(self.windowIMULogPSD[0, :])-1) for i in range(len(self.windowIMULogPSD[:, 0]))]
-		#~ psdLogData = np.divide(np.subtract(psdLogData, self.PSDMean), self.PSDScale)
-		psdLogData = self.psdlScaler.transform(np.array(psdLogData).reshape(1,-1))[0]
-		self.windowIMULogPSDFeatures = pd.DataFrame(data=[psdLogData], columns=colNames)
-		
-		print('PSD!')
-   	
-	def fnBuildTimeFeatures(self, features):
-		"""
-		Purpose:	Perform all time domain feature extraction on filtered data, 
-					then columns the data and standardized based on mean and std
-		Passed:		Feature dictionary to perform
-		"""
-		dataList = [TIME_FEATURES[featName](self.windowIMUfiltered[:, i]) for i, direction in enumerate(DATA_COLUMNS) for featName in features]
-		#~ dataList = np.divide(np.subtract(dataList, self.TimeMean), self.TimeScale)
-		dataList = self.timeScaler.transform(np.array(dataList).reshape(1,-1))[0]
-		dataNames = ['{} {} {}'.format(featName, direction, self.placement) for direction in DATA_COLUMNS for featName in features]
-		self.EFTimeColumnedFeatures = pd.DataFrame(data=[dataList], columns=dataNames)
-
-	def fnBuildFreqFeatures(self, features):
-		"""
-		Purpose:	Perform all frequency domain feature extraction on filtered data, 
-					then columns the data and standardized based on mean and std
-		Passed:		Feature dictionary to perform
-		"""
-		dataList = [FREQ_FEATURES[featName](self.windowIMUPSD[:, -1], self.windowIMUPSD[:, i]) for i, direction in enumerate(DATA_COLUMNS) for featName in features]
-		#~ dataList = np.divide(np.subtract(dataList, self.FreqMean), self.FreqScale)
-		dataList = self.freqScaler.transform(np.array(dataList).reshape(1, -1))[0]
-		dataNames = ['{} {} {}'.format(featName, direction, self.placement) for direction in DATA_COLUMNS for featName in features]
-		self.EFFreqColumnedFeatures = pd.DataFrame(data=[dataList], columns=dataNames)
+		# Filter all the data columns at once with the cached filter design
+		fnFilterWindow(self.sos, dataWindow, self.windowIMUfiltered, PAD_LENGTH)
 
 
 
@@ -366,6 +584,7 @@ if __name__=="__main__":
 
 	processStatus = False
 
+	# Reconnect attempts reuse the models and scalers already loaded in this process
 	while True:
 		try:
 			instTerrainClassifier = ClTerrainClassifier(protocol = 'TCP')
@@ -375,8 +594,9 @@ if __name__=="__main__":
 			time.sleep(1)
 			if processStatus:
 				instTerrainClassifier.runMarker.put(False)
-				instTransferClient.fnShutDown()
+				instTerrainClassifier.fnShutDown()
 				instTerrainClassifier.runMarker.close()
 				instTerrainClassifier.dataQueue.close()
 				connectedStatus = False
+				processStatus = False
 			print(e)
@@ -0,0 +1,176 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python library records per-stage latencies of the
+				classification loop into fixed-size histograms.
+
+				Recording a duration is a single bin increment, so it can
+				sit on the hot path. Percentile summaries are printed
+				periodically, and raw timings can optionally be appended
+				to a csv file for offline analysis.
+"""
+# IMPORTED LIBRARIES
+
+import numpy as np
+import math
+import time
+
+# DEFINITIONS
+
+# Log-spaced histogram bins from 1 us to 10 s
+HIST_MIN = 1e-6
+HIST_MAX = 10.0
+HIST_BINS = 280
+
+# CLASSES
+
+class ClStageTimer:
+	"""
+	Class for collecting latency histograms of named stages.
+	"""
+
+	def __init__(self, stages, reportInterval = 30, dumpPath = None, rawLength = 4096):
+		"""
+		Purpose:	Preallocate one histogram per stage
+		Passed:		List of stage names, in reporting order
+					Seconds between printed summaries (None to never print)
+					Optional csv path raw timings are appended to
+					Number of raw timings buffered between file writes
+		"""
+
+		self.stages = list(stages)
+		self.stageIndex = {stage: i for i, stage in enumerate(self.stages)}
+
+		# Histogram counts, bin i spans [edges[i], edges[i + 1])
+		self.edges = np.geomspace(HIST_MIN, HIST_MAX, HIST_BINS + 1)
+		self.logMin = math.log(HIST_MIN)
+		self.binsPerLog = HIST_BINS / (math.log(HIST_MAX) - self.logMin)
+		self.counts = np.zeros((len(self.stages), HIST_BINS + 2), dtype=np.int64)
+		self.maxima = np.zeros(len(self.stages))
+
+		self.reportInterval = reportInterval
+		self.timeReported = time.perf_counter()
+
+		# Raw timings buffered as (stage index, seconds) before being dumped
+		self.dumpPath = dumpPath
+		self.rawTimings = np.zeros((rawLength, 2))
+		self.rawCount = 0
+
+		if self.dumpPath is not None:
+			with open(self.dumpPath, 'a') as dumpFile:
+				dumpFile.write('Stage,Seconds\n')
+
+	def fnRecord(self, stage, seconds):
+		"""
+		Purpose:	Add one duration to a stage's histogram
+		Passed:		Stage name
+					Duration in seconds
+		"""
+
+		i = self.stageIndex[stage]
+
+		# Bin 0 holds underflow, the last bin holds overflow
+		if seconds <= HIST_MIN:
+			self.counts[i, 0] += 1
+		else:
+			self.counts[i, min(HIST_BINS + 1, 1 + int((math.log(seconds) - self.logMin) * self.binsPerLog))] += 1
+
+		if seconds > self.maxima[i]:
+			self.maxima[i] = seconds
+
+		if self.dumpPath is not None:
+			self.rawTimings[self.rawCount] = (i, seconds)
+			self.rawCount += 1
+			if self.rawCount == len(self.rawTimings):
+				self.fnDump()
+
+	def fnLap(self, stage, timeStart):
+		"""
+		Purpose:	Record the time since timeStart against a stage and start the next lap
+		Passed:		Stage name
+					perf_counter value when the stage started
+		Returns:	perf_counter value now, the start of the next stage
+		"""
+
+		timeNow = time.perf_counter()
+		self.fnRecord(stage, timeNow - timeStart)
+
+		return timeNow
+
+	def fnPercentiles(self, stage, percentiles = (50, 95, 99)):
+		"""
+		Purpose:	Estimate percentiles of a stage from its histogram
+		Passed:		Stage name
+					Percentiles to estimate
+		Returns:	List of durations in seconds (upper edge of the bin, nan if empty)
+		"""
+
+		counts = self.counts[self.stageIndex[stage]]
+		total = counts.sum()
+
+		if total == 0:
+			return [float('nan')] * len(percentiles)
+
+		cumulative = np.cumsum(counts)
+		upperEdges = np.concatenate([[HIST_MIN], self.edges[1:], [np.inf]])
+		bins = np.searchsorted(cumulative, np.multiply(percentiles, total / 100.0))
+
+		return [min(upperEdges[b], self.maxima[self.stageIndex[stage]]) for b in bins]
+
+	def fnSummary(self):
+		"""
+		Purpose:	Format a p50/p95/p99 table of every stage with samples
+		Returns:	Summary string
+		"""
+
+		lines = ['{:<16s} {:>7s} {:>9s} {:>9s} {:>9s} {:>9s}'.format('Stage (ms)', 'Count', 'p50', 'p95', 'p99', 'Max')]
+
+		for i, stage in enumerate(self.stages):
+			count = self.counts[i].sum()
+			if count:
+				p50, p95, p99 = self.fnPercentiles(stage)
+				lines.append('{:<16s} {:>7d} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(
+					stage, count, p50 * 1e3, p95 * 1e3, p99 * 1e3, self.maxima[i] * 1e3))
+
+		return '\n'.join(lines)
+
+	def fnReport(self, force = False):
+		"""
+		Purpose:	Print the summary and start a new period once the report interval has passed
+		Passed:		Report regardless of the interval
+		Returns:	True if a summary was printed
+		"""
+
+		if self.reportInterval is None and not force:
+			return False
+		if not force and time.perf_counter() - self.timeReported < self.reportInterval:
+			return False
+
+		print(self.fnSummary())
+		self.fnDump()
+		self.fnReset()
+
+		return True
+
+	def fnReset(self):
+		"""
+		Purpose:	Clear all histograms
+		"""
+
+		self.counts.fill(0)
+		self.maxima.fill(0)
+		self.timeReported = time.perf_counter()
+
+	def fnDump(self):
+		"""
+		Purpose:	Append buffered raw timings to the dump file
+		"""
+
+		if self.dumpPath is None or self.rawCount == 0:
+			return
+
+		with open(self.dumpPath, 'a') as dumpFile:
+			for stage, seconds in self.rawTimings[:self.rawCount]:
+				dumpFile.write('{},{:.9f}\n'.format(self.stages[int(stage)], seconds))
+
+		self.rawCount = 0
@@ -0,0 +1,267 @@
+"""
+Author:         Kevin Ta
+Date:           2019 August 8th
+Purpose:        This Python script rebuilds the scalers and the random forest and
+				support vector machine models of each placement from recorded
+				sessions.
+
+				Sessions are featurized in parallel through the feature
+				cache and split per terrain into training and test windows,
+				then every model is fitted on its own worker process. The
+				scalers and models are written directly as compiled arrays
+				(modelLib.fnSaveCompiled), which the classifier memory-maps
+				without unpickling sklearn objects, beside a json manifest
+				of the sessions, parameters and test accuracy of the run.
+
+				python3 trainingPipeline.py "IMU Data/Middle_Grass_Frame6050.csv" Left="IMU Data/Synthesis.csv" ...
+"""
+
+# IMPORTED LIBRARIES
+
+import numpy as np
+import os
+import json
+import time
+import pickle as pkl
+
+from multiprocessing import Pool, cpu_count
+
+from featureCacheLib import fnLoadFeatures, fnFeatureParams
+from plannerLib import fnColumnNames
+from modelLib import ClCompiledScaler, fnCompileModel, fnSaveCompiled
+from cascadeLib import MODELS, SCALERS, MODEL_DIR, SCALER_DIR
+from configLib import SENSOR_PARAMS, PAD_LENGTH, HOP_SAMPLES, TERRAINS, fnSessionFreqs
+from sessionLib import fnParseSessionName
+from paramStoreLib import DICT_DIR, FAMILY_TABLES
+
+# DEFINITIONS
+
+# Share of each session's windows, taken from its end, held out for testing
+TEST_FRACTION = 0.2
+
+# Seed of every randomized estimator, so a run can be repeated exactly
+RANDOM_STATE = 0
+
+# Estimator parameters, the support vector machine as the shipped SupportVectorMachine_Middle_FreqFeats
+RF_PARAMS = {'n_estimators': 100}
+SVM_PARAMS = {'kernel': 'rbf', 'C': 1.0, 'gamma': 'scale'}
+
+# FUNCTIONS
+
+def fnFeaturizeSession(task):
+	"""
+	Purpose:	Fill the feature cache for one session in a worker process
+	Passed:		Session csv path, placement, hop
+	Returns:	Session csv path and placement, feature cache entry description
+	"""
+
+	path, placement, hopSamples = task
+	features, meta = fnLoadFeatures(path, hopSamples, placement)
+
+	return (path, placement), meta
+
+def fnSplitWindows(nWindows, gapWindows, testFraction = TEST_FRACTION):
+	"""
+	Purpose:	Split a session's windows into a training start and a test end, dropping the
+				windows in between that overlap both
+	Passed:		Number of windows in the session
+				Windows overlapping a given window on either side
+				Share of windows held out for testing
+	Returns:	Training window indices, test window indices
+	"""
+
+	nTest = int(round(nWindows * testFraction))
+	if nTest == 0:
+		return np.arange(nWindows), np.arange(0)
+
+	return np.arange(max(nWindows - nTest - gapWindows, 0)), np.arange(nWindows - nTest, nWindows)
+
+def fnArtifactDir(directory, fileName, placement):
+	"""
+	Purpose:	Artifact directory of a model or scaler file name, read by modelLib in place of the joblib file
+	Passed:		Directory
+				File name format from MODELS or SCALERS
+				Sensor placement
+	Returns:	Artifact directory path
+	"""
+
+	return os.path.join(directory, os.path.splitext(fileName.format(placement))[0])
+
+def fnTrainModel(task):
+	"""
+	Purpose:	Fit, compile, test and save one model in a worker process
+	Passed:		Placement, model name, standardized training features and labels,
+				standardized test features and labels, feature names, output directory
+	Returns:	Placement, model name, test accuracy (nan without test windows), seconds fitting
+	"""
+
+	placement, name, XTrain, yTrain, XTest, yTest, featureNames, directory = task
+
+	from sklearn.ensemble import RandomForestClassifier
+	from sklearn.svm import SVC
+
+	if name.startswith('RF'):
+		estimator = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=1, **RF_PARAMS)
+	else:
+		estimator = SVC(random_state=RANDOM_STATE, **SVM_PARAMS)
+
+	timeStart = time.perf_counter()
+	estimator.fit(XTrain, yTrain)
+	seconds = time.perf_counter() - timeStart
+
+	compiled = fnCompileModel(estimator)
+	compiled.featureNames = np.array(featureNames)
+
+	accuracy = float(np.mean(compiled.predict(XTest) == yTest)) if len(yTest) else float('nan')
+
+	fnSaveCompiled(compiled, fnArtifactDir(directory, MODELS[name][0], placement),
+				   {'trainingWindows': len(yTrain), 'testWindows': len(yTest), 'testAccuracy': accuracy})
+
+	return placement, name, accuracy, seconds
+
+def fnSaveNormDicts(scalers, columnNames, placement, directory = DICT_DIR):
+	"""
+	Purpose:	Merge a placement's scaler parameters into the normalization parameter dictionaries,
+				the parameter store is rebuilt from them on its next load
+	Passed:		Dictionary of family to compiled scaler
+				Dictionary of family to column names
+				Sensor placement
+				Dictionary directory
+	"""
+
+	for family, table in FAMILY_TABLES.items():
+		path = os.path.join(directory, '{}_Norm_Param_Dictionary.pkl'.format(table))
+
+		normParams = {}
+		if os.path.isfile(path):
+			with open(path, 'rb') as dictFile:
+				normParams = pkl.load(dictFile)
+
+		normParams[placement] = {featName: {'Mean': float(mean), 'Scale': float(scale)}
+								 for featName, mean, scale in zip(columnNames[family], scalers[family].mean, scalers[family].scale)}
+
+		with open(path, 'wb') as dictFile:
+			pkl.dump(normParams, dictFile)
+
+
+# MAIN PROGRAM
+
+if __name__ == "__main__":
+
+	import argparse
+
+	from sklearn.preprocessing import StandardScaler
+
+	parser = argparse.ArgumentParser(description='Rebuild the scalers and models of each placement from recorded sessions.')
+	parser.add_argument('sessions', nargs='+', help='session csv files, as path or Placement=path to pick a wheel from a synthesis file')
+	parser.add_argument('--hop', type=int, default=HOP_SAMPLES, help='samples between training windows')
+	parser.add_argument('--test-fraction', type=float, default=TEST_FRACTION, help='share of each session held out for testing')
+	parser.add_argument('--workers', type=int, default=None, help='worker processes (default one per core)')
+	parser.add_argument('--models', nargs='+', default=list(MODELS), help='models to train')
+	parser.add_argument('--model-dir', default=MODEL_DIR, help='directory the compiled models are written to')
+	parser.add_argument('--scaler-dir', default=SCALER_DIR, help='directory the compiled scalers are written to')
+	parser.add_argument('--norm-dicts', action='store_true', help='also merge the scaler parameters into the dicts normalization dictionaries')
+	args = parser.parse_args()
+
+	workers = args.workers or cpu_count()
+	timeStart = time.perf_counter()
+
+	# Sessions in a fixed order so the training set, and every model, is the same on each run
+	sessions = []
+	for session in args.sessions:
+		placement, path = session.split('=', 1) if '=' in session else (None, session)
+		name = fnParseSessionName(path)
+		sessions.append((os.path.realpath(path), placement or (name['Placement'] if name else 'Middle')))
+	sessions = sorted(set(sessions))
+
+	with Pool(workers) as pool:
+		entries = dict(pool.map(fnFeaturizeSession, [(path, placement, args.hop) for path, placement in sessions]))
+
+	timeFeaturized = time.perf_counter()
+
+	os.makedirs(args.model_dir, exist_ok=True)
+	os.makedirs(args.scaler_dir, exist_ok=True)
+
+	tasks = []
+	manifests = {}
+
+	for placement in sorted({placement for path, placement in sessions}):
+		sensorParam = SENSOR_PARAMS[placement]
+		columnNames = fnColumnNames(placement, fnSessionFreqs(sensorParam))
+		gapWindows = -(-(sensorParam['wLength'] + 2 * PAD_LENGTH) // args.hop) - 1
+
+		# Split every session of every terrain on its own, so each terrain is in both sets
+		split = {'Train': {family: [] for family in SCALERS}, 'Test': {family: [] for family in SCALERS}}
+		labels = {'Train': [], 'Test': []}
+		used = []
+
+		for path, sessionPlacement in sessions:
+			if sessionPlacement != placement:
+				continue
+			meta = entries[(path, sessionPlacement)]
+			if meta['terrain'] not in TERRAINS:
+				print('Skipping {}: terrain {!r} is not one of {}'.format(path, meta['terrain'], TERRAINS))
+				continue
+
+			features, meta = fnLoadFeatures(path, args.hop, placement)
+			trainWindows, testWindows = fnSplitWindows(meta['windows'], gapWindows, args.test_fraction)
+
+			for family in SCALERS:
+				split['Train'][family].append(features[family][trainWindows])
+				split['Test'][family].append(features[family][testWindows])
+			labels['Train'].append(np.full(len(trainWindows), TERRAINS.index(meta['terrain'])))
+			labels['Test'].append(np.full(len(testWindows), TERRAINS.index(meta['terrain'])))
+			used.append({'path': path, 'sha1': meta['source']['sha1'], 'terrain': meta['terrain'],
+						 'trainWindows': len(trainWindows), 'testWindows': len(testWindows)})
+
+		if not used:
+			continue
+
+		yTrain = np.concatenate(labels['Train'])
+		yTest = np.concatenate(labels['Test'])
+
+		# Scalers are fitted on the training windows only, then written and applied
+		scalers = {}
+		standardized = {}
+		for family, fileName in SCALERS.items():
+			XTrain = np.concatenate(split['Train'][family])
+			XTest = np.concatenate(split['Test'][family])
+
+			scaler = StandardScaler().fit(XTrain)
+			scalers[family] = ClCompiledScaler.fnFromEstimator(scaler)
+			scalers[family].fnCheck(scaler)
+			fnSaveCompiled(scalers[family], fnArtifactDir(args.scaler_dir, fileName, placement), {'trainingWindows': len(XTrain)})
+
+			standardized[family] = (scalers[family].fnNormalize(XTrain), scalers[family].fnNormalize(XTest))
+
+		if args.norm_dicts:
+			fnSaveNormDicts(scalers, columnNames, placement)
+
+		for name in args.models:
+			family = MODELS[name][1]
+			XTrain, XTest = standardized[family]
+			tasks.append((placement, name, XTrain, yTrain, XTest, yTest, columnNames[family], args.model_dir))
+
+		manifests[placement] = {'sessions': used, 'featureParams': fnFeatureParams(placement, args.hop),
+								'testFraction': args.test_fraction, 'randomState': RANDOM_STATE,
+								'rfParams': RF_PARAMS, 'svmParams': SVM_PARAMS, 'terrains': TERRAINS, 'models': {}}
+
+	timeScaled = time.perf_counter()
+
+	# Longest fits first so the pool stays busy to the end
+	tasks.sort(key=lambda task: (not task[1].startswith('SVM'), -task[2].size))
+
+	with Pool(min(workers, max(len(tasks), 1))) as pool:
+		for placement, name, accuracy, seconds in pool.imap_unordered(fnTrainModel, tasks):
+			manifests[placement]['models'][name] = {'testAccuracy': accuracy, 'fitSeconds': seconds}
+			print('{} {}: test accuracy {:.1%}, fitted in {:.1f} s'.format(placement, name, accuracy, seconds))
+
+	timeTrained = time.perf_counter()
+
+	for placement, manifest in manifests.items():
+		with open(os.path.join(args.model_dir, 'Training_{}.json'.format(placement)), 'w') as manifestFile:
+			json.dump(manifest, manifestFile, indent=1, sort_keys=True)
+
+	print('{} sessions on {} workers: featurize {:.1f} s, scale {:.1f} s, train {:.1f} s, total {:.1f} s'.format(
+		len(sessions), workers, timeFeaturized - timeStart, timeScaled - timeFeaturized, timeTrained - timeScaled,
+		time.perf_counter() - timeStart))